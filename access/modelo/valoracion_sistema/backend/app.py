@@ -11,24 +11,48 @@ Fecha: 5 de agosto de 2025
 Versión: 1.0
 """
 
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, request, jsonify, render_template, send_file, Response, stream_with_context
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 import sqlite3
 import json
 import math
-from datetime import datetime
+import copy
+import itertools
+import multiprocessing
+import os
+import threading
+import queue
+import random
+import sys
+import time
+from datetime import datetime, timedelta
 import uuid
-from io import BytesIO
+import base64
+import cProfile
+import hashlib
+import hmac
+import atexit
+import csv
+import tempfile
+import unicodedata
+import zipfile
+import zlib
+from bisect import bisect_left
+from collections import OrderedDict
+from statistics import NormalDist
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from io import BytesIO, StringIO
+from importlib.util import find_spec
+# ReportLab y openpyxl se importan en el primer PDF o XLSX: cargarlos aquí
+# alargaba el arranque de cada worker (y de cada proceso de los pools)
+REPORTLAB_AVAILABLE = find_spec('reportlab') is not None
 try:
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.pagesizes import letter
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    from reportlab.lib.units import inch
-    REPORTLAB_AVAILABLE = True
+    import numpy as np
+    NUMPY_AVAILABLE = True
 except ImportError:
-    REPORTLAB_AVAILABLE = False
+    NUMPY_AVAILABLE = False
+OPENPYXL_AVAILABLE = find_spec('openpyxl') is not None
 
 app = Flask(__name__)
 CORS(app)
@@ -86,242 +110,2062 @@ PESOS_ISO25010 = {
     'flexibility': 0.03            # Adaptabilidad (nuevo en 2023)
 }
 
+# Horas base por tipo de sistema (COCOMO adaptado al mercado colombiano)
+HORAS_BASE_TIPO = {
+    'sistema_auditoria': 140,        # Complejidad normativa alta
+    'aplicativo_gestion': 100,       # Gestión estándar de datos
+    'sistema_reportes': 80,          # Enfoque específico en reportes
+    'erp_basico': 160,              # Múltiples módulos integrados
+    'crm_sistema': 120,             # Gestión de relaciones
+    'aplicativo_inventarios': 90,   # Control de stock y movimientos
+    'gestion_documental': 110,      # Manejo de archivos y metadatos
+    'sistema_contable': 130,        # Complejidad contable y fiscal
+    'otro': 100                     # Promedio general
+}
+
+# Horas adicionales por funcionalidad implementada (clave, horas, etiqueta)
+AJUSTES_FUNCIONALIDADES = [
+    ('autenticacion_avanzada', 35, 'Autenticación avanzada'),
+    ('reportes_complejos', 45, 'Reportes complejos'),
+    ('integracion_externa', 60, 'Integración externa'),
+    ('workflow_aprobaciones', 70, 'Workflows'),
+    ('dashboard_ejecutivo', 40, 'Dashboard ejecutivo'),
+    ('api_rest', 55, 'APIs REST'),
+    ('notificaciones', 25, 'Notificaciones'),
+    ('backup_automatico', 20, 'Backup automático'),
+    ('auditoria_logs', 30, 'Logs auditoría')
+]
+
+# Factores por volumen de datos (usados en horas y en complejidad)
+FACTORES_VOLUMEN_DATOS = {
+    'pequeno': 1.0,
+    'medio': 1.12,
+    'grande': 1.25,
+    'muy_grande': 1.40
+}
+
+# Factores por arquitectura (usados en horas y en complejidad)
+FACTORES_ARQUITECTURA = {
+    'monolitica': 1.0,
+    'capas': 1.15,
+    'cliente_servidor': 1.20,
+    'web_multicapa': 1.30,
+    'soa': 1.45,
+    'microservicios': 1.70
+}
+
+# Factores por tipo de base de datos
+FACTORES_BASE_DATOS = {
+    'local': 1.0,           # Access, SQLite, Excel
+    'sql_server_express': 1.15,
+    'mysql': 1.20,
+    'postgresql': 1.25,
+    'sql_server': 1.35,
+    'oracle': 1.50,
+    'nosql': 1.30
+}
+
+# Factor base por criticidad de negocio (1-5)
+FACTORES_CRITICIDAD = {
+    1: 0.75,  # Experimental, no crítico
+    2: 0.90,  # Soporte, baja criticidad
+    3: 1.00,  # Operaciones normales
+    4: 1.25,  # Procesos críticos
+    5: 1.50   # Operación central, misión crítica
+}
+
 # ================================
-# MOTOR DE VALORACIÓN
+# REGLAS DE VALORACIÓN (DECLARATIVAS)
 # ================================
+# Las reglas de umbral son (operador, umbral, factor) y se evalúan en orden:
+# se aplica la primera que se cumple; si ninguna se cumple el factor es 1.0.
+# Todas las tablas se compilan una sola vez en ReglasCompiladas.
 
-class MotorValoracion:
+# Horas: usuarios concurrentes (+15% concurrencia, +8% usuarios múltiples)
+UMBRALES_USUARIOS_HORAS = [('>', 20, 1.15), ('>', 5, 1.08)]
+
+# Complejidad: concurrencia de usuarios
+UMBRALES_CONCURRENCIA = [
+    ('>=', 200, 1.50),  # Sistemas de alta concurrencia
+    ('>=', 50, 1.35),   # Media-alta concurrencia
+    ('>=', 20, 1.20),   # Media concurrencia
+    ('>=', 10, 1.10),   # Baja-media concurrencia
+    ('>', 5, 1.05)      # Multiusuario básico
+]
+
+# Complejidad: integraciones externas
+UMBRALES_INTEGRACIONES = [
+    ('>', 10, 1.60),    # Altamente integrado
+    ('>', 5, 1.40),     # Múltiples integraciones
+    ('>', 2, 1.25),     # Varias integraciones
+    ('>', 0, 1.15)      # Algunas integraciones
+]
+
+# Complejidad: funcionalidades avanzadas (se aplican en este orden)
+FACTORES_FUNCIONALIDADES_COMPLEJIDAD = [
+    ('api_rest', 1.12),               # APIs y servicios web
+    ('workflow_aprobaciones', 1.08),  # Workflows avanzados
+    ('notificaciones', 1.05),         # Sistemas de notificaciones
+    ('dashboard_ejecutivo', 1.06)     # Dashboards ejecutivos complejos
+]
+
+# Negocio: ahorros económicos anuales (COP)
+UMBRALES_AHORRO_ANUAL = [
+    ('>', 50000000, 1.40),  # Alto impacto económico
+    ('>', 20000000, 1.30),  # Medio-alto impacto
+    ('>', 10000000, 1.20),  # Medio impacto
+    ('>', 5000000, 1.15),   # Bajo-medio impacto
+    ('>', 1000000, 1.08)    # Bajo impacto
+]
+
+# Negocio: usuarios beneficiados
+UMBRALES_USUARIOS_TOTALES = [
+    ('>', 500, 1.25),   # Amplio impacto organizacional
+    ('>', 100, 1.15),   # Medio impacto
+    ('>', 50, 1.08),    # Impacto departamental
+    ('>', 20, 1.04)     # Impacto de equipo
+]
+
+# Negocio: ROI anual (ahorro / inversión)
+UMBRALES_ROI = [
+    ('>', 2.0, 1.30),   # Excelente ROI
+    ('>', 1.0, 1.20),   # Buen ROI
+    ('>', 0.5, 1.10)    # ROI aceptable
+]
+
+# Negocio: sector
+FACTORES_SECTOR_NEGOCIO = {
+    'publico': 1.12,     # Mayor valor social y regulatorio
+    'financiero': 1.18,  # Alta regulación y criticidad
+    'salud': 1.15        # Impacto en vidas humanas
+}
+
+# Colombia: primas de cumplimiento, en el orden en que se aplican.
+# 'sector=...' compara el sector; el resto son banderas de los datos.
+CUMPLIMIENTOS_COLOMBIA = [
+    ('genera_reportes_oficiales', 1.18, "Reportes oficiales para entes de control"),
+    ('requiere_auditoria_logs', 1.12, "Logs de auditoría detallados"),
+    ('sector=publico', 1.15, "Sector público colombiano"),
+    ('sector=financiero', 1.25, "Sector financiero regulado"),
+    ('interoperabilidad_govco', 1.10, "Estándares interoperabilidad Gov.co"),
+    ('maneja_datos_personales', 1.08, "Cumplimiento Ley Habeas Data"),
+    ('decreto_648', 1.15, "Decreto 648/2017 - Auditoría Interna"),
+    ('iso_27001', 1.12, "Controles ISO 27001"),
+    ('sarlaft', 1.20, "Cumplimiento SARLAFT"),
+    ('contraloria', 1.10, "Reportes Contraloría General")
+]
+
+# Colombia: bonificación por número de cumplimientos
+UMBRALES_BONO_CUMPLIMIENTO = [('>=', 5, 1.08), ('>=', 3, 1.05)]
+
+# Colombia: factor base del mercado colombiano 2025
+FACTOR_MERCADO_COLOMBIA = 1.05
+
+# Valoración: tipo de valoración
+AJUSTES_TIPO_VALORACION = {'conservadora': 0.85, 'optimista': 1.15}
+
+# Valoración: contexto de desarrollo (se aplican en este orden)
+AJUSTES_CONTEXTO_VALORACION = [
+    ('desarrollo_interno', 0.9),      # Desarrollo interno suele ser más económico
+    ('tiempo_parcial', 0.85),         # Desarrollo tiempo parcial es más barato
+    ('aprendizaje_tecnologia', 1.2),  # Tiempo de aprendizaje influyó en el costo
+    ('sin_metodologia', 0.8),         # Sin metodología reduce valor profesional
+    ('urgencia_tiempo', 1.1),         # Desarrollo urgente cuesta más
+    ('prototipo_iterativo', 0.95)     # Iterativo puede ser menos eficiente inicialmente
+]
+
+# Valoración y confianza: tecnologías de bajo costo (primera coincidencia)
+AJUSTES_TECNOLOGIA_BAJO_COSTO = [('access', 0.7), ('excel', 0.6), ('vb_net', 0.8)]
+
+# Valoración: ausencia de datos críticos (campo == 'no')
+AJUSTES_DATOS_FALTANTES = [('conoce_tiempo_desarrollo', 0.9), ('conoce_inversion', 0.9)]
+
+# Confianza: nivel de certeza declarado
+AJUSTES_CERTEZA_CONFIANZA = {'alta': 1.1, 'baja': 0.8}
+
+# Confianza: (campo conoce_*, bandera de estimación, factor si no se conoce, factor si es estimado)
+AJUSTES_INFORMACION_CONFIANZA = [
+    ('conoce_tiempo_desarrollo', 'tiempo_calculado_por_fechas', 0.9, 0.95),
+    ('conoce_inversion', 'inversion_es_estimada', 0.85, 0.9),
+    ('conoce_ahorros', 'ahorros_son_estimados', 0.9, 0.95)
+]
+
+# Confianza: contexto de desarrollo (se aplican en este orden)
+AJUSTES_CONTEXTO_CONFIANZA = [
+    ('desarrollo_interno', 1.05),
+    ('sin_metodologia', 0.85),
+    ('urgencia_tiempo', 0.9),
+    ('tiempo_parcial', 0.95)
+]
+
+# Confianza: tipo de valoración
+AJUSTES_TIPO_CONFIANZA = {'conservadora': 1.05, 'optimista': 0.9}
+
+# Campos cuya presencia determina la confianza base
+CAMPOS_CRITICOS_CONFIANZA = [
+    'tipo_software', 'tecnologia_principal', 'antiguedad_anos',
+    'usuarios_concurrentes', 'criticidad_negocio'
+]
+
+# Tecnologías básicas, más predecibles (reducen el margen de incertidumbre)
+TECNOLOGIAS_BASICAS = ['access', 'excel', 'vba']
+
+# Máximo de elementos aceptados por /api/valorar/lote
+LOTE_MAX_ELEMENTOS = 50000
+
+# Variaciones del análisis de sensibilidad, uno a la vez sobre la valoración base:
+# ('valores', alternativas) o ('escala', multiplicadores del valor actual).
+# Cada puntaje ISO 25010 respondido se varía además en ±1 dentro de 1-5.
+VARIACIONES_SENSIBILIDAD = {
+    'criticidad_negocio': ('valores', list(FACTORES_CRITICIDAD)),
+    'usuarios_concurrentes': ('escala', [0.5, 2]),
+    'usuarios_totales': ('escala', [0.5, 2]),
+    'integraciones_externas': ('valores', [0, 1, 3, 6, 11]),
+    'arquitectura': ('valores', list(FACTORES_ARQUITECTURA)),
+    'volumen_datos': ('valores', list(FACTORES_VOLUMEN_DATOS)),
+    'base_datos_tipo': ('valores', list(FACTORES_BASE_DATOS)),
+    'tiempo_desarrollo_meses': ('escala', [0.5, 2]),
+    'ahorro_anual_cop': ('escala', [0.5, 2]),
+    'sector': ('valores', ['privado'] + list(FACTORES_SECTOR_NEGOCIO)),
+    'tipo_valoracion': ('valores', ['conservadora', 'equilibrada', 'optimista'])
+}
+
+# Factores del desglose que se reportan en el análisis de sensibilidad
+FACTORES_DESGLOSE = [
+    'horas_estimadas', 'costo_hora', 'valor_base', 'factor_calidad', 'factor_complejidad',
+    'factor_negocio', 'factor_colombia', 'factor_ajuste_valoracion', 'margen_incertidumbre'
+]
+
+# Grilla de escenarios (/api/escenarios): opciones de cada eje pedido como "todos".
+# Los demás campos de VOCABULARIOS_RESPUESTAS usan su vocabulario; los ejes
+# iso25010.<característica> van de 1 a 5, y las banderas, funcionalidades.<clave>
+# y contexto_desarrollo.<clave> toman False y True (ver _dominio_eje).
+OPCIONES_ESCENARIOS = {
+    'tecnologia_principal': list(FACTORES_TECNOLOGIA),
+    'tipo_software': list(HORAS_BASE_TIPO),
+    'arquitectura': list(FACTORES_ARQUITECTURA),
+    'volumen_datos': list(FACTORES_VOLUMEN_DATOS),
+    'base_datos_tipo': list(FACTORES_BASE_DATOS),
+    'criticidad_negocio': list(FACTORES_CRITICIDAD),
+    'sector': ['privado'] + list(FACTORES_SECTOR_NEGOCIO),
+    'tipo_valoracion': ['conservadora', 'equilibrada', 'optimista']
+}
+ESCENARIOS_EJES_DEFECTO = ['tecnologia_principal', 'arquitectura']
+ESCENARIOS_METRICAS_DEFECTO = ['valor_minimo', 'valor_promedio', 'valor_maximo']
+ESCENARIOS_MAX_COMBINACIONES = 50000
+
+# Tamaño de página del histórico (por defecto y máximo)
+HISTORICO_LIMITE_DEFECTO = 50
+HISTORICO_LIMITE_MAXIMO = 500
+
+# Filas leídas del cursor (y enviadas al cliente) por fragmento en /api/exportar
+EXPORTACION_FILAS_POR_FRAGMENTO = 1000
+
+# Importación masiva desde CSV/XLSX
+IMPORTACION_WORKERS = int(os.environ.get('VALORACION_IMPORTACION_WORKERS', str(min(4, os.cpu_count() or 1))))
+IMPORTACION_DIRECTORIO = os.environ.get('VALORACION_IMPORTACION_DIR', tempfile.gettempdir())
+IMPORTACION_FILAS_POR_FRAGMENTO = 2000  # Filas valoradas por tarea del pool y por transacción
+IMPORTACION_TRABAJOS_MAXIMOS = 50
+
+# Muestreo estadístico (/api/muestreo): sin reemplazo, con semilla reproducible
+METODOS_MUESTREO = ('aleatorio', 'sistematico', 'estratificado')
+ASIGNACIONES_MUESTREO = ('proporcional', 'igual')  # Reparto de la muestra entre estratos
+MUESTREO_TAMANO_MAXIMO = 1000000
+MUESTREO_ESTRATOS_MAXIMOS = 10000
+MUESTREO_FILAS_POR_FRAGMENTO = 1000
+
+# Tamaño de muestra (/api/muestreo/tamano): confianzas cuyos cuantiles z/t se
+# tabulan juntos en el primer cálculo y grados de libertad con t exacta
+TIPOS_TAMANO_MUESTRA = ('atributos', 'variables')
+CONFIANZAS_TABULADAS = (0.80, 0.85, 0.90, 0.95, 0.975, 0.99, 0.995, 0.999)
+CUANTILES_T_GL_MAXIMO = 120
+MUESTREO_GRILLA_MAXIMA = 100000  # Combinaciones por grilla de planeación
+
+# Caché de resultados de /api/valorar por huella de los datos (0 = desactivada)
+CACHE_VALORACIONES_ELEMENTOS = int(os.environ.get('VALORACION_CACHE_ELEMENTOS', '1024'))
+CACHE_VALORACIONES_TTL = float(os.environ.get('VALORACION_CACHE_TTL', '300'))  # Segundos
+
+# Devolver la valoración ya guardada para datos idénticos en lugar de insertar otra
+DEDUPLICAR_VALORACIONES = os.environ.get('VALORACION_DEDUPLICAR', '0') == '1'
+
+# Escritura diferida (write-behind): responder sin esperar el commit en SQLite
+ESCRITURA_DIFERIDA = os.environ.get('VALORACION_ESCRITURA_DIFERIDA', '0') == '1'
+ESCRITURA_COLA_MAXIMA = int(os.environ.get('VALORACION_ESCRITURA_COLA', '10000'))
+ESCRITURA_LOTE_MAXIMO = 500       # Filas por transacción
+ESCRITURA_INTERVALO = 0.05        # Segundos que se espera para completar un lote
+ESCRITURA_ESPERA_MAXIMA = 5.0     # Segundos de contrapresión antes de escribir en línea
+ESCRITURA_REINTENTOS = 3          # Intentos del lote completo antes de escribir fila por fila
+
+# Simulación Monte Carlo del rango de valoración (requiere NumPy)
+MONTE_CARLO_ACTIVO = os.environ.get('VALORACION_MONTE_CARLO', '0') == '1'
+MONTE_CARLO_ITERACIONES = int(os.environ.get('VALORACION_MONTE_CARLO_ITERACIONES', '100000'))
+MONTE_CARLO_ITERACIONES_MAXIMAS = 1000000
+MONTE_CARLO_INTERVALOS = 30  # Barras del histograma
+
+# Tamaño máximo de la caché de reportes PDF en memoria (MB, 0 = desactivada)
+PDF_CACHE_MB = float(os.environ.get('VALORACION_PDF_CACHE_MB', '64'))
+
+# Procesos dedicados a renderizar PDF (0 = un hilo auxiliar, sin procesos)
+PDF_WORKERS = int(os.environ.get('VALORACION_PDF_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Los pools de procesos arrancan con 'spawn': se crean desde un hilo de solicitud
+# y con fork el hijo heredaría locks tomados por otros hilos (escritor diferido,
+# tabla de calidad, servidor) y podría bloquearse. Importar app no tiene efectos
+# secundarios, así que cada hijo parte limpio.
+CONTEXTO_PROCESOS = multiprocessing.get_context('spawn')
+
+# Trabajos de PDF terminados que se conservan para consulta y descarga
+PDF_TRABAJOS_MAXIMOS = 500
+
+# Métricas en /metrics (formato Prometheus); 0 quita toda la instrumentación
+METRICAS_ACTIVAS = os.environ.get('VALORACION_METRICAS', '1') == '1'
+METRICAS_LIMITES = [  # Segundos, límites de los histogramas de duración
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+]
+
+# Perfilado de solicitudes lentas (cabecera X-Perfilar o muestreo al azar)
+PERFILADO_ACTIVO = os.environ.get('VALORACION_PERFILADO', '0') == '1'
+PERFILADO_MUESTREO = float(os.environ.get('VALORACION_PERFILADO_MUESTREO', '0'))  # Fracción de solicitudes
+PERFILADO_UMBRAL_MS = float(os.environ.get('VALORACION_PERFILADO_UMBRAL_MS', '1000'))
+PERFILADO_MODO = os.environ.get('VALORACION_PERFILADO_MODO', 'muestreo')  # muestreo o cprofile
+PERFILADO_DIRECTORIO = os.environ.get(
+    'VALORACION_PERFILADO_DIR', os.path.join(tempfile.gettempdir(), 'valoracion_perfiles')
+)
+PERFILADO_INTERVALO = 0.005  # Segundos entre muestras de pila
+PERFILADO_MAXIMOS = 200      # Perfiles guardados que se conservan
+
+# Token para las rutas /api/admin (obligatorio: vacío = rutas cerradas)
+ADMIN_TOKEN = os.environ.get('VALORACION_ADMIN_TOKEN', '')
+
+# Almacenamiento columnar de las respuestas (ver CodificadorRespuestas).
+# Vocabularios, banderas y conjuntos solo pueden crecer al final de cada lista:
+# el código (posición + 1) o el bit ya guardado no puede cambiar de significado.
+# Agregar valores no requiere subir ESQUEMA_VERSION: los códigos nuevos se
+# copian a catalogo_respuestas al migrar y en asegurar_esquema.
+VOCABULARIOS_RESPUESTAS = {
+    'sector': ['privado', 'publico', 'financiero', 'salud', 'educacion', 'otro'],
+    'arquitectura': ['monolitica', 'capas', 'cliente_servidor', 'web_multicapa', 'soa', 'microservicios'],
+    'volumen_datos': ['pequeno', 'medio', 'grande', 'muy_grande'],
+    'base_datos_tipo': ['local', 'sql_server_express', 'mysql', 'postgresql', 'sql_server', 'oracle', 'nosql'],
+    'tipo_valoracion': ['conservadora', 'equilibrada', 'optimista'],
+    'nivel_certeza': ['baja', 'media', 'alta'],
+    'en_uso_activo': ['true', 'false'],
+    'conoce_tiempo_desarrollo': ['si', 'no', 'aproximado'],
+    'conoce_inversion': ['si', 'no', 'rango'],
+    'conoce_ahorros': ['si', 'no', 'aproximado']
+}
+
+CAMPOS_ENTEROS_RESPUESTAS = [
+    'usuarios_concurrentes', 'usuarios_totales', 'integraciones_externas',
+    'criticidad_negocio', 'ahorro_anual_cop', 'inversion_original_cop'
+]
+
+CAMPOS_REALES_RESPUESTAS = ['antiguedad_anos', 'tiempo_desarrollo_meses']
+
+BANDERAS_RESPUESTAS = [
+    'genera_reportes_oficiales', 'requiere_auditoria_logs', 'interoperabilidad_govco',
+    'maneja_datos_personales', 'decreto_648', 'iso_27001', 'sarlaft', 'contraloria',
+    'tiempo_calculado_por_fechas', 'inversion_es_estimada', 'ahorros_son_estimados'
+]
+
+CONJUNTOS_RESPUESTAS = {
+    'funcionalidades': [
+        'autenticacion_avanzada', 'reportes_complejos', 'integracion_externa',
+        'workflow_aprobaciones', 'dashboard_ejecutivo', 'api_rest', 'notificaciones',
+        'backup_automatico', 'auditoria_logs'
+    ],
+    'contexto_desarrollo': [
+        'desarrollo_interno', 'tiempo_parcial', 'aprendizaje_tecnologia',
+        'sin_metodologia', 'urgencia_tiempo', 'prototipo_iterativo'
+    ]
+}
+
+# Puntajes ISO 25010 empaquetados en un entero en base 6 (0 = sin respuesta)
+CARACTERISTICAS_ISO_EMPAQUETADAS = [
+    'security', 'functional_suitability', 'reliability', 'maintainability',
+    'performance_efficiency', 'usability', 'compatibility', 'portability', 'flexibility'
+]
+
+# Comprimir con zlib los textos libres guardados en valoraciones_texto
+COMPRIMIR_TEXTO = os.environ.get('VALORACION_COMPRIMIR_TEXTO', '1') == '1'
+
+# Versión del esquema de la base de datos (PRAGMA user_version)
+ESQUEMA_VERSION = 2
+
+# Migrar el esquema en la primera solicitud si está atrasado; con 0 hay que
+# ejecutar `python app.py migrar` antes de arrancar los workers
+MIGRACION_AUTOMATICA = os.environ.get('VALORACION_MIGRACION_AUTOMATICA', '1') == '1'
+
+# Ruta absoluta de la base de datos (configurable por variable de entorno)
+DB_PATH = os.path.abspath(os.environ.get(
+    'VALORACION_DB_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'valoraciones.db')
+))
+
+# ================================
+# MÉTRICAS (formato Prometheus)
+# ================================
+
+class Cronometro:
+    """Marca el fin de cada etapa y registra todas las duraciones de una vez"""
+    
+    __slots__ = ('metricas', 'nombre', 'etiqueta', 'mediciones', '_ultimo')
+    
+    def __init__(self, metricas, nombre, etiqueta):
+        self.metricas = metricas
+        self.nombre = nombre
+        self.etiqueta = etiqueta
+        self.mediciones = []
+        self._ultimo = time.perf_counter()
+    
+    def marcar(self, etapa):
+        ahora = time.perf_counter()
+        self.mediciones.append((etapa, ahora - self._ultimo))
+        self._ultimo = ahora
+    
+    def reanudar(self):
+        """Descarta el tiempo transcurrido desde la última marca"""
+        self._ultimo = time.perf_counter()
+    
+    def registrar(self):
+        self.metricas.observar_varias(self.nombre, self.etiqueta, self.mediciones)
+
+class _CronometroNulo:
+    """Cronómetro de las métricas desactivadas: no mide nada"""
+    
+    def marcar(self, etapa):
+        pass
+    
+    def reanudar(self):
+        pass
+    
+    def registrar(self):
+        pass
+
+class Metricas:
+    """
+    Contadores e histogramas en memoria, expuestos en formato Prometheus
+    
+    Registrar una observación es una búsqueda en un diccionario y una suma
+    bajo un candado. Las series son por proceso: con varios workers de
+    gunicorn cada uno expone las suyas. Con activas=False todos los métodos
+    son no-ops y la instrumentación no cuesta nada.
+    """
+    
+    def __init__(self, activas, limites):
+        self.activas = activas
+        self.limites = limites
+        self._descripciones = {}
+        self._histogramas = {}   # (nombre, etiquetas) -> conteos por límite (+Inf al final) y suma
+        self._contadores = {}    # (nombre, etiquetas) -> valor
+        self._lock = threading.Lock()
+        self._cronometro_nulo = _CronometroNulo()
+    
+    def describir(self, nombre, tipo, ayuda):
+        self._descripciones[nombre] = (tipo, ayuda)
+    
+    def _serie(self, nombre, etiquetas):
+        serie = self._histogramas.get((nombre, etiquetas))
+        if serie is None:
+            serie = self._histogramas[(nombre, etiquetas)] = [0] * (len(self.limites) + 1) + [0.0]
+        return serie
+    
+    def observar(self, nombre, segundos, **etiquetas):
+        if not self.activas:
+            return
+        clave = tuple(sorted(etiquetas.items()))
+        with self._lock:
+            serie = self._serie(nombre, clave)
+            serie[bisect_left(self.limites, segundos)] += 1
+            serie[-1] += segundos
+    
+    def observar_varias(self, nombre, etiqueta, mediciones):
+        """Registra [(valor de la etiqueta, segundos), ...] con una sola toma del candado"""
+        if not self.activas:
+            return
+        with self._lock:
+            for valor, segundos in mediciones:
+                serie = self._serie(nombre, ((etiqueta, valor),))
+                serie[bisect_left(self.limites, segundos)] += 1
+                serie[-1] += segundos
+    
+    def incrementar(self, nombre, valor=1, **etiquetas):
+        if not self.activas:
+            return
+        clave = (nombre, tuple(sorted(etiquetas.items())))
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + valor
+    
+    def cronometro(self, nombre, etiqueta):
+        """Cronometro para medir etapas consecutivas con `etiqueta`=nombre de la etapa"""
+        if not self.activas:
+            return self._cronometro_nulo
+        return Cronometro(self, nombre, etiqueta)
+    
+    @staticmethod
+    def _etiquetas(etiquetas, extra=()):
+        pares = list(etiquetas) + list(extra)
+        if not pares:
+            return ''
+        texto = ','.join(
+            '{}="{}"'.format(clave, str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+            for clave, valor in pares
+        )
+        return '{' + texto + '}'
+    
+    def exponer(self):
+        """Texto en el formato de exposición de Prometheus (versión 0.0.4)"""
+        with self._lock:
+            histogramas = {clave: list(serie) for clave, serie in self._histogramas.items()}
+            contadores = dict(self._contadores)
+        
+        por_nombre = {}
+        for (nombre, etiquetas), serie in histogramas.items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, serie))
+        for (nombre, etiquetas), valor in contadores.items():
+            por_nombre.setdefault(nombre, []).append((etiquetas, valor))
+        
+        lineas = []
+        for nombre in sorted(por_nombre):
+            tipo, ayuda = self._descripciones.get(nombre, ('untyped', ''))
+            lineas.append(f'# HELP {nombre} {ayuda}')
+            lineas.append(f'# TYPE {nombre} {tipo}')
+            for etiquetas, valor in sorted(por_nombre[nombre]):
+                if tipo != 'histogram':
+                    lineas.append(f'{nombre}{self._etiquetas(etiquetas)} {valor}')
+                    continue
+                acumulado = 0
+                for limite, conteo in zip(self.limites + [float('inf')], valor):
+                    acumulado += conteo
+                    le = '+Inf' if limite == float('inf') else repr(limite)
+                    lineas.append(f'{nombre}_bucket{self._etiquetas(etiquetas, [("le", le)])} {acumulado}')
+                lineas.append(f'{nombre}_sum{self._etiquetas(etiquetas)} {valor[-1]!r}')
+                lineas.append(f'{nombre}_count{self._etiquetas(etiquetas)} {acumulado}')
+        return '\n'.join(lineas) + '\n'
+
+metricas = Metricas(METRICAS_ACTIVAS, METRICAS_LIMITES)
+metricas.describir('http_solicitud_segundos', 'histogram', 'Duración de las solicitudes HTTP por ruta y método')
+metricas.describir('http_solicitudes_total', 'counter', 'Solicitudes HTTP por ruta, método y código de estado')
+metricas.describir('valoracion_etapa_segundos', 'histogram', 'Duración de cada etapa de una valoración')
+metricas.describir('valoracion_cache_total', 'counter', 'Consultas a la caché de valoraciones por resultado')
+metricas.describir('sqlite_sentencia_segundos', 'histogram',
+                   'Duración de cada sentencia SQL (hasta la primera fila si se itera el cursor)')
+metricas.describir('sqlite_errores_total', 'counter', 'Sentencias SQL que terminaron con error')
+metricas.describir('sqlite_transaccion_segundos', 'histogram', 'Duración de las transacciones de escritura, con el commit')
+metricas.describir('pdf_generacion_segundos', 'histogram', 'Tiempo desde que se encola un PDF hasta que está listo')
+metricas.describir('pdf_reportes_total', 'counter', 'Reportes PDF generados por resultado')
+metricas.describir('errores_total', 'counter', 'Errores internos registrados por origen')
+
+_ETIQUETAS_SQL = {}
+
+def etiqueta_sql(sql):
+    """'SELECT id FROM valoraciones WHERE ...' -> 'SELECT valoraciones'"""
+    etiqueta = _ETIQUETAS_SQL.get(sql)
+    if etiqueta is None:
+        palabras = sql.split()
+        tabla = next((
+            siguiente.strip('(),;') for palabra, siguiente in zip(palabras, palabras[1:])
+            if palabra.upper() in ('FROM', 'INTO', 'UPDATE', 'TABLE', 'EXISTS')
+        ), '')
+        etiqueta = f'{palabras[0].upper() if palabras else ""} {tabla}'.strip()
+        # Las consultas armadas con filtros variables no deben crecer sin límite
+        if len(_ETIQUETAS_SQL) > 1000:
+            _ETIQUETAS_SQL.clear()
+        _ETIQUETAS_SQL[sql] = etiqueta
+    return etiqueta
+
+class ConexionInstrumentada(sqlite3.Connection):
+    """Conexión SQLite que registra en `metricas` la duración de cada sentencia"""
+    
+    def _medir(self, metodo, sql, *args):
+        inicio = time.perf_counter()
+        try:
+            return metodo(sql, *args)
+        except sqlite3.Error:
+            metricas.incrementar('sqlite_errores_total', sentencia=etiqueta_sql(sql))
+            raise
+        finally:
+            metricas.observar('sqlite_sentencia_segundos', time.perf_counter() - inicio, sentencia=etiqueta_sql(sql))
+    
+    def execute(self, sql, *args):
+        return self._medir(super().execute, sql, *args)
+    
+    def executemany(self, sql, *args):
+        return self._medir(super().executemany, sql, *args)
+
+class TransaccionMedida:
+    """`with` sobre una conexión que además mide la transacción completa y su commit"""
+    
+    __slots__ = ('conn', '_inicio')
+    
+    def __init__(self, conn):
+        self.conn = conn
+    
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self.conn.__enter__()
+    
+    def __exit__(self, *exc):
+        inicio_commit = time.perf_counter()
+        try:
+            return self.conn.__exit__(*exc)
+        finally:
+            fin = time.perf_counter()
+            metricas.observar('sqlite_sentencia_segundos', fin - inicio_commit,
+                              sentencia='ROLLBACK' if exc[0] else 'COMMIT')
+            metricas.observar('sqlite_transaccion_segundos', fin - self._inicio)
+
+# ================================
+# PERFILADO DE SOLICITUDES LENTAS
+# ================================
+
+class CapturaCProfile:
+    """Perfil determinista (cProfile) del hilo de la solicitud; se guarda en formato pstats"""
+    
+    extension = 'prof'
+    
     def __init__(self):
-        self.init_database()
+        self._perfil = cProfile.Profile()
+        self._perfil.enable()
     
-    def init_database(self):
-        """Inicializa la base de datos SQLite"""
-        conn = sqlite3.connect('valoraciones.db')
-        cursor = conn.cursor()
-        
-        # Tabla de valoraciones
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS valoraciones (
-                id TEXT PRIMARY KEY,
-                fecha_creacion DATETIME,
-                tipo_software TEXT,
-                tecnologia_principal TEXT,
-                respuestas_json TEXT,
-                valor_minimo REAL,
-                valor_maximo REAL,
-                factor_confianza REAL,
-                desglose_json TEXT
-            )
-        ''')
+    def detener(self):
+        self._perfil.disable()
+    
+    def guardar(self, ruta):
+        self._perfil.dump_stats(ruta)
+
+class CapturaMuestreo:
+    """
+    Perfil por muestreo del hilo de la solicitud, en pilas colapsadas
+    
+    Un hilo auxiliar toma la pila del hilo perfilado cada
+    PERFILADO_INTERVALO segundos; el resultado ('a;b;c cantidad' por línea)
+    se abre con flamegraph.pl o speedscope. El costo no depende de cuántas
+    funciones llame la solicitud.
+    """
+    
+    extension = 'txt'
+    
+    def __init__(self, intervalo):
+        self._hilo_perfilado = threading.get_ident()
+        self._pilas = {}
+        self._detener = threading.Event()
+        self._hilo = threading.Thread(target=self._muestrear, args=(intervalo,), daemon=True)
+        self._hilo.start()
+    
+    def _muestrear(self, intervalo):
+        while not self._detener.wait(intervalo):
+            marco = sys._current_frames().get(self._hilo_perfilado)
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                pila.append(f'{os.path.basename(codigo.co_filename)}:{codigo.co_name}:{codigo.co_firstlineno}')
+                marco = marco.f_back
+            if pila:
+                clave = ';'.join(reversed(pila))
+                self._pilas[clave] = self._pilas.get(clave, 0) + 1
+    
+    def detener(self):
+        self._detener.set()
+        self._hilo.join()
+    
+    def guardar(self, ruta):
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            for pila, cantidad in sorted(self._pilas.items()):
+                archivo.write(f'{pila} {cantidad}\n')
+
+class Perfilador:
+    """
+    Perfilado opcional de solicitudes, guardado solo si resultan lentas
+    
+    Se perfila una solicitud si trae la cabecera X-Perfilar (cprofile o
+    muestreo) o al azar con probabilidad PERFILADO_MUESTREO. Al terminar, si
+    tardó al menos PERFILADO_UMBRAL_MS, el perfil se guarda en
+    PERFILADO_DIRECTORIO junto a un JSON con ruta, duración y archivos;
+    si no, se descarta. Los PDF se generan en otro proceso: ColaPDF pide
+    aquí un archivo auxiliar para que el worker guarde su propio perfil.
+    """
+    
+    MODOS = {'cprofile': CapturaCProfile, 'muestreo': CapturaMuestreo}
+    AUXILIARES_MAXIMOS = 5  # Perfiles de workers por solicitud
+    
+    def __init__(self, directorio, umbral_ms, muestreo, modo, maximos):
+        self.directorio = directorio
+        self.umbral_ms = umbral_ms
+        self.muestreo = muestreo
+        self.modo = modo
+        self.maximos = maximos
+        self._local = threading.local()
+        self._lock = threading.Lock()
+    
+    def modo_solicitado(self, cabecera):
+        """Modo de perfilado para una solicitud, o None si no se perfila"""
+        if cabecera:
+            cabecera = cabecera.strip().lower()
+            return cabecera if cabecera in self.MODOS else self.modo
+        if self.muestreo > 0 and random.random() < self.muestreo:
+            return self.modo
+        return None
+    
+    def iniciar(self, modo):
+        """Comienza a perfilar el hilo actual y devuelve la captura en curso"""
+        if modo == 'muestreo':
+            perfil = CapturaMuestreo(PERFILADO_INTERVALO)
+        else:
+            perfil = self.MODOS[modo]()
+        captura = {
+            'id': f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}",
+            'modo': modo,
+            'perfil': perfil,
+            'inicio': time.perf_counter(),
+            'auxiliares': []
+        }
+        self._local.captura = captura
+        return captura
+    
+    def archivo_auxiliar(self, sufijo):
+        """Ruta para el perfil de un worker si el hilo actual se está perfilando, o None"""
+        captura = getattr(self._local, 'captura', None)
+        if captura is None or len(captura['auxiliares']) >= self.AUXILIARES_MAXIMOS:
+            return None
+        nombre = f"{captura['id']}.{sufijo}{len(captura['auxiliares']) + 1}.prof"
+        captura['auxiliares'].append(nombre)
+        os.makedirs(self.directorio, exist_ok=True)
+        return os.path.join(self.directorio, nombre)
+    
+    def finalizar(self, captura, ruta, metodo, codigo):
+        """Detiene la captura; guarda el perfil si superó el umbral y devuelve su id (o None)"""
+        duracion_ms = (time.perf_counter() - captura['inicio']) * 1000
+        captura['perfil'].detener()
+        if getattr(self._local, 'captura', None) is captura:
+            self._local.captura = None
+        
+        if duracion_ms < self.umbral_ms:
+            for nombre in captura['auxiliares']:
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except OSError:
+                    pass
+            return None
         
-        # Tabla de tecnologías
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tecnologias (
-                id INTEGER PRIMARY KEY,
-                nombre TEXT,
-                categoria TEXT,
-                factor_costo REAL,
-                nivel_complejidad TEXT,
-                popularidad_colombia REAL
+        os.makedirs(self.directorio, exist_ok=True)
+        principal = f"{captura['id']}.{captura['perfil'].extension}"
+        captura['perfil'].guardar(os.path.join(self.directorio, principal))
+        archivos = [principal] + [
+            nombre for nombre in captura['auxiliares'] if os.path.exists(os.path.join(self.directorio, nombre))
+        ]
+        metadatos = {
+            'id': captura['id'],
+            'fecha': datetime.now().isoformat(),
+            'ruta': ruta,
+            'metodo': metodo,
+            'codigo': codigo,
+            'duracion_ms': round(duracion_ms, 1),
+            'modo': captura['modo'],
+            'archivos': archivos
+        }
+        with open(os.path.join(self.directorio, f"{captura['id']}.json"), 'w', encoding='utf-8') as archivo:
+            json.dump(metadatos, archivo, ensure_ascii=False)
+        self._depurar()
+        return captura['id']
+    
+    def listar(self):
+        """Metadatos de los perfiles guardados, del más reciente al más antiguo"""
+        perfiles = []
+        try:
+            nombres = os.listdir(self.directorio)
+        except OSError:
+            return []
+        for nombre in nombres:
+            if nombre.endswith('.json'):
+                try:
+                    with open(os.path.join(self.directorio, nombre), encoding='utf-8') as archivo:
+                        perfiles.append(json.load(archivo))
+                except (OSError, ValueError):
+                    continue
+        return sorted(perfiles, key=lambda perfil: perfil['id'], reverse=True)
+    
+    def ruta_archivo(self, perfil_id, nombre):
+        """Ruta de un archivo de un perfil guardado, o None si no le pertenece"""
+        for perfil in self.listar():
+            if perfil['id'] == perfil_id and nombre in perfil['archivos']:
+                return os.path.join(self.directorio, nombre)
+        return None
+    
+    def _depurar(self):
+        """Conserva solo los `maximos` perfiles más recientes"""
+        with self._lock:
+            for perfil in self.listar()[self.maximos:]:
+                for nombre in perfil['archivos'] + [f"{perfil['id']}.json"]:
+                    try:
+                        os.remove(os.path.join(self.directorio, nombre))
+                    except OSError:
+                        pass
+
+perfilador = Perfilador(PERFILADO_DIRECTORIO, PERFILADO_UMBRAL_MS, PERFILADO_MUESTREO, PERFILADO_MODO, PERFILADO_MAXIMOS)
+
+# ================================
+# ALMACENAMIENTO (SQLite)
+# ================================
+
+class CodificadorRespuestas:
+    """
+    Traduce entre las respuestas/desglose de una valoración y columnas tipadas
+    
+    Cada campo conocido va a su columna solo si el valor se puede recuperar
+    exactamente: enteros y reales, textos de VOCABULARIOS_RESPUESTAS como
+    código entero, booleanos como bits (más una máscara de presentes),
+    conjuntos de banderas verdaderas como máscara y puntajes ISO 25010
+    enteros 1-5 empaquetados en base 6. Todo lo demás (descripción,
+    observaciones, campos desconocidos o valores atípicos) queda como
+    sobrante y se guarda aparte, comprimido, en valoraciones_texto.
+    """
+    
+    CLAVE_DESGLOSE = '__desglose__'  # Sobrantes del desglose dentro del texto
+    
+    COLUMNAS_BASE = [
+        ('id', 'TEXT PRIMARY KEY'),
+        ('fecha_creacion', 'DATETIME'),
+        ('tipo_software', 'TEXT'),
+        ('tecnologia_principal', 'TEXT'),
+        ('valor_minimo', 'REAL'),
+        ('valor_maximo', 'REAL'),
+        ('valor_promedio', 'REAL'),
+        ('factor_confianza', 'REAL'),
+        ('huella', 'TEXT')
+    ]
+    
+    def __init__(self):
+        self.codigos = {
+            campo: {valor: codigo for codigo, valor in enumerate(vocabulario, start=1)}
+            for campo, vocabulario in VOCABULARIOS_RESPUESTAS.items()
+        }
+        self.columnas_desglose = [
+            (factor, 'INTEGER' if factor == 'horas_estimadas' else 'REAL') for factor in FACTORES_DESGLOSE
+        ]
+        self.columnas_respuestas = (
+            [(campo, 'INTEGER') for campo in CAMPOS_ENTEROS_RESPUESTAS]
+            + [(campo, 'REAL') for campo in CAMPOS_REALES_RESPUESTAS]
+            + [(campo, 'INTEGER') for campo in VOCABULARIOS_RESPUESTAS]
+            + [('banderas', 'INTEGER'), ('banderas_presentes', 'INTEGER')]
+            + [(campo, 'INTEGER') for campo in CONJUNTOS_RESPUESTAS]
+            + [('iso25010', 'INTEGER')]
+        )
+        self.columnas = [nombre for nombre, _ in self.COLUMNAS_BASE + self.columnas_desglose + self.columnas_respuestas]
+        
+        # Para filas_lote: qué hacer con cada campo de las respuestas en una sola pasada
+        indices = {nombre: indice for indice, (nombre, _) in enumerate(self.columnas_respuestas)}
+        self.indices_respuestas = indices
+        self.despacho = {'tipo_software': ('propia',), 'tecnologia_principal': ('propia',)}
+        self.despacho.update({campo: ('entero', indices[campo]) for campo in CAMPOS_ENTEROS_RESPUESTAS})
+        self.despacho.update({campo: ('real', indices[campo]) for campo in CAMPOS_REALES_RESPUESTAS})
+        self.despacho.update({campo: ('vocabulario', indices[campo], codigos) for campo, codigos in self.codigos.items()})
+        self.despacho.update({campo: ('bandera', 1 << bit) for bit, campo in enumerate(BANDERAS_RESPUESTAS)})
+        self.despacho.update({
+            campo: ('conjunto', indices[campo], {clave: 1 << bit for bit, clave in enumerate(claves)})
+            for campo, claves in CONJUNTOS_RESPUESTAS.items()
+        })
+        self.despacho['iso25010'] = ('iso', indices['iso25010'],
+                                     {caracteristica: 6 ** posicion for posicion, caracteristica
+                                      in enumerate(CARACTERISTICAS_ISO_EMPAQUETADAS)})
+    
+    def definicion_tabla(self, nombre):
+        columnas = ',\n    '.join(f'{columna} {tipo}' for columna, tipo in
+                                  self.COLUMNAS_BASE + self.columnas_desglose + self.columnas_respuestas)
+        return f'CREATE TABLE IF NOT EXISTS {nombre} (\n    {columnas}\n)'
+    
+    def codificar(self, datos, desglose):
+        """Devuelve ({columna: valor}, sobrantes) a partir de respuestas y desglose"""
+        pendientes = dict(datos)
+        columnas = {}
+        
+        for campo in CAMPOS_ENTEROS_RESPUESTAS:
+            valor = pendientes.get(campo)
+            if type(valor) is int and -2**63 <= valor < 2**63:
+                columnas[campo] = pendientes.pop(campo)
+        
+        for campo in CAMPOS_REALES_RESPUESTAS:
+            if type(pendientes.get(campo)) is float:
+                columnas[campo] = pendientes.pop(campo)
+        
+        for campo, codigos in self.codigos.items():
+            valor = pendientes.get(campo)
+            if type(valor) is str and valor in codigos:
+                columnas[campo] = codigos[pendientes.pop(campo)]
+        
+        banderas = presentes = 0
+        for bit, campo in enumerate(BANDERAS_RESPUESTAS):
+            valor = pendientes.get(campo)
+            if type(valor) is bool:
+                presentes |= 1 << bit
+                if pendientes.pop(campo):
+                    banderas |= 1 << bit
+        columnas['banderas'] = banderas
+        columnas['banderas_presentes'] = presentes
+        
+        for campo, claves in CONJUNTOS_RESPUESTAS.items():
+            conjunto = pendientes.get(campo)
+            if isinstance(conjunto, dict):
+                mascara = 0
+                resto = {}
+                for clave, valor in pendientes.pop(campo).items():
+                    if valor is True and clave in claves:
+                        mascara |= 1 << claves.index(clave)
+                    else:
+                        resto[clave] = valor
+                columnas[campo] = mascara
+                if resto:
+                    pendientes[campo] = resto
+        
+        iso = pendientes.get('iso25010')
+        if (isinstance(iso, dict) and all(caracteristica in CARACTERISTICAS_ISO_EMPAQUETADAS for caracteristica in iso)
+                and all(type(puntaje) is int and 1 <= puntaje <= 5 for puntaje in iso.values())):
+            columnas['iso25010'] = sum(
+                iso.get(caracteristica, 0) * 6 ** posicion
+                for posicion, caracteristica in enumerate(CARACTERISTICAS_ISO_EMPAQUETADAS)
             )
-        ''')
-        
-        conn.commit()
-        conn.close()
+            del pendientes['iso25010']
+        
+        resto_desglose = dict(desglose)
+        for factor, tipo in self.columnas_desglose:
+            valor = resto_desglose.get(factor)
+            tipos_validos = (int,) if tipo == 'INTEGER' else (int, float)
+            if type(valor) in tipos_validos:
+                columnas[factor] = resto_desglose.pop(factor)
+        if resto_desglose:
+            pendientes[self.CLAVE_DESGLOSE] = resto_desglose
+        
+        return columnas, pendientes
+    
+    def decodificar(self, fila, sobrantes):
+        """Reconstruye (respuestas, desglose) desde una fila (dict por columna) y sus sobrantes"""
+        datos = dict(sobrantes)
+        desglose = datos.pop(self.CLAVE_DESGLOSE, {})
+        
+        for factor, _ in self.columnas_desglose:
+            if fila.get(factor) is not None:
+                desglose[factor] = fila[factor]
+        
+        for campo in CAMPOS_ENTEROS_RESPUESTAS + CAMPOS_REALES_RESPUESTAS:
+            if fila.get(campo) is not None:
+                datos[campo] = fila[campo]
+        
+        for campo, vocabulario in VOCABULARIOS_RESPUESTAS.items():
+            if fila.get(campo) is not None:
+                datos[campo] = vocabulario[fila[campo] - 1]
+        
+        banderas = fila.get('banderas') or 0
+        presentes = fila.get('banderas_presentes') or 0
+        for bit, campo in enumerate(BANDERAS_RESPUESTAS):
+            if presentes >> bit & 1:
+                datos[campo] = bool(banderas >> bit & 1)
+        
+        for campo, claves in CONJUNTOS_RESPUESTAS.items():
+            mascara = fila.get(campo)
+            if mascara is not None:
+                conjunto = {clave: True for bit, clave in enumerate(claves) if mascara >> bit & 1}
+                conjunto.update(datos.get(campo, {}))
+                datos[campo] = conjunto
+        
+        iso = fila.get('iso25010')
+        if iso is not None:
+            datos['iso25010'] = {}
+            for caracteristica in CARACTERISTICAS_ISO_EMPAQUETADAS:
+                iso, puntaje = divmod(iso, 6)
+                if puntaje:
+                    datos['iso25010'][caracteristica] = puntaje
+        
+        return datos, desglose
     
-    def calcular_valor(self, datos_software):
+    @staticmethod
+    def empaquetar_texto(sobrantes):
+        """(comprimido, contenido) de los sobrantes, o None si no hay"""
+        if not sobrantes:
+            return None
+        contenido = json.dumps(sobrantes, ensure_ascii=False).encode('utf-8')
+        if COMPRIMIR_TEXTO:
+            comprimido = zlib.compress(contenido, 6)
+            if len(comprimido) < len(contenido):
+                return 1, comprimido
+        return 0, contenido
+    
+    @staticmethod
+    def desempaquetar_texto(comprimido, contenido):
+        if contenido is None:
+            return {}
+        if comprimido:
+            contenido = zlib.decompress(contenido)
+        return json.loads(contenido)
+    
+    def filas(self, valoracion_id, fecha, datos, resultado, huella):
+        """Parámetros de SQL_INSERTAR_VALORACION y de SQL_INSERTAR_TEXTO (o None)"""
+        columnas, sobrantes = self.codificar(datos, resultado['desglose'])
+        columnas.update({
+            'id': valoracion_id,
+            'fecha_creacion': fecha,
+            'tipo_software': datos.get('tipo_software'),
+            'tecnologia_principal': datos.get('tecnologia_principal'),
+            'valor_minimo': resultado['valor_minimo'],
+            'valor_maximo': resultado['valor_maximo'],
+            'valor_promedio': resultado.get('valor_promedio'),
+            'factor_confianza': resultado['factor_confianza'],
+            'huella': huella
+        })
+        # tipo_software y tecnologia_principal tienen columna propia
+        sobrantes.pop('tipo_software', None)
+        sobrantes.pop('tecnologia_principal', None)
+        
+        texto = self.empaquetar_texto(sobrantes)
+        return (
+            tuple(columnas.get(columna) for columna in self.columnas),
+            (valoracion_id,) + texto if texto else None
+        )
+
+    def filas_lote(self, ids, fecha, lista_datos, columnas, huellas=None):
         """
-        Algoritmo principal de valoración
+        Parámetros de SQL_INSERTAR_VALORACION y de SQL_INSERTAR_TEXTO para un lote
         
-        Fórmula: Valor = (Horas_Estimadas × Costo_Hora × Factor_Tecnología × Factor_Calidad × Factor_Negocio) ± Rango_Incertidumbre
+        Mismo resultado que filas() fila por fila, pero los valores y el
+        desglose se toman de `columnas` (una lista por nombre, como las que
+        produce MotorValoracionLote.calcular) y cada respuesta se recorre una
+        sola vez según `despacho`. Solo las filas con sobrantes generan JSON y
+        fila de texto. Sin `huellas` la columna huella queda en NULL.
         """
-        try:
-            # 1. Estimación de horas basada en complejidad
-            horas_estimadas = self._estimar_horas(datos_software)
-            
-            # 2. Costo por hora según tecnología
-            costo_hora = self._calcular_costo_hora(datos_software['tecnologia_principal'])
-            
-            # 3. Factor de calidad ISO 25010
-            factor_calidad = self._calcular_factor_calidad(datos_software.get('iso25010', {}))
-            
-            # 4. Factor de complejidad técnica
-            factor_complejidad = self._calcular_factor_complejidad(datos_software)
-            
-            # 5. Factor de valor de negocio
-            factor_negocio = self._calcular_factor_negocio(datos_software)
-            
-            # 6. Factor específico Colombia (cumplimiento normativo)
-            factor_colombia = self._calcular_factor_colombia(datos_software)
-            
-            # 7. Aplicar ajustes por tipo de valoración y contexto
-            factor_ajuste_valoracion = self._calcular_factor_valoracion(datos_software)
-            
-            # Cálculo base
-            valor_base = horas_estimadas * costo_hora
-            valor_ajustado = valor_base * factor_calidad * factor_complejidad * factor_negocio * factor_colombia * factor_ajuste_valoracion
-            
-            # Ajustar rango de incertidumbre según nivel de información disponible
-            margen_error = self._calcular_margen_incertidumbre(datos_software)
-            valor_minimo = valor_ajustado * (1 - margen_error)
-            valor_maximo = valor_ajustado * (1 + margen_error)
-            
-            # Factor de confianza basado en completitud de datos
-            factor_confianza = self._calcular_confianza(datos_software)
-            
-            resultado = {
-                'valor_minimo': round(valor_minimo),
-                'valor_maximo': round(valor_maximo),
-                'valor_promedio': round(valor_ajustado),
-                'factor_confianza': factor_confianza,
-                'desglose': {
-                    'horas_estimadas': horas_estimadas,
-                    'costo_hora': costo_hora,
-                    'valor_base': valor_base,
-                    'factor_calidad': factor_calidad,
-                    'factor_complejidad': factor_complejidad,
-                    'factor_negocio': factor_negocio,
-                    'factor_colombia': factor_colombia,
-                    'factor_ajuste_valoracion': factor_ajuste_valoracion,
-                    'margen_incertidumbre': margen_error
-                },
-                'metodologia': 'ISO 25010:2023 + COCOMO Adaptado + Mercado Colombia 2025'
-            }
-            
-            # Guardar en base de datos y obtener ID
-            valoracion_id = self._guardar_valoracion(datos_software, resultado)
-            if valoracion_id:
-                resultado['id'] = valoracion_id  # Agregar ID al resultado
+        tipos_desglose = [(int,) if tipo == 'INTEGER' else (int, float) for _, tipo in self.columnas_desglose]
+        base = zip(ids, lista_datos, columnas['valor_minimo'], columnas['valor_maximo'],
+                   columnas['valor_promedio'], columnas['factor_confianza'], huellas or itertools.repeat(None))
+        desgloses = zip(*(columnas[factor] for factor in FACTORES_DESGLOSE))
+        vacia = [None] * len(self.columnas_respuestas)
+        indice_banderas = self.indices_respuestas['banderas']
+        indice_presentes = self.indices_respuestas['banderas_presentes']
+        
+        filas_valoracion = []
+        filas_texto = []
+        for (valoracion_id, datos, minimo, maximo, promedio, confianza, huella), desglose in zip(base, desgloses):
+            if not all(type(valor) in tipos for valor, tipos in zip(desglose, tipos_desglose)):
+                # Desglose atípico: el camino general lo deja en los sobrantes
+                fila_valoracion, fila_texto = self.filas(valoracion_id, fecha, datos, {
+                    'valor_minimo': minimo, 'valor_maximo': maximo, 'valor_promedio': promedio,
+                    'factor_confianza': confianza, 'desglose': dict(zip(FACTORES_DESGLOSE, desglose))
+                }, huella)
+                filas_valoracion.append(fila_valoracion)
+                if fila_texto:
+                    filas_texto.append(fila_texto)
+                continue
             
-            return resultado
+            respuestas = list(vacia)
+            banderas = presentes = 0
+            sobrantes = {}
+            restos = {}
+            for campo, valor in datos.items():
+                regla = self.despacho.get(campo)
+                tipo = regla[0] if regla else None
+                if tipo == 'propia':
+                    continue
+                if tipo == 'entero':
+                    if type(valor) is int and -2**63 <= valor < 2**63:
+                        respuestas[regla[1]] = valor
+                        continue
+                elif tipo == 'real':
+                    if type(valor) is float:
+                        respuestas[regla[1]] = valor
+                        continue
+                elif tipo == 'vocabulario':
+                    if type(valor) is str and valor in regla[2]:
+                        respuestas[regla[1]] = regla[2][valor]
+                        continue
+                elif tipo == 'bandera':
+                    if type(valor) is bool:
+                        presentes |= regla[1]
+                        if valor:
+                            banderas |= regla[1]
+                        continue
+                elif tipo == 'conjunto':
+                    if isinstance(valor, dict):
+                        mascara = 0
+                        resto = {}
+                        for clave, activa in valor.items():
+                            if activa is True and clave in regla[2]:
+                                mascara |= regla[2][clave]
+                            else:
+                                resto[clave] = activa
+                        respuestas[regla[1]] = mascara
+                        if resto:
+                            restos[campo] = resto
+                        continue
+                elif tipo == 'iso':
+                    if (isinstance(valor, dict) and all(caracteristica in regla[2] for caracteristica in valor)
+                            and all(type(puntaje) is int and 1 <= puntaje <= 5 for puntaje in valor.values())):
+                        respuestas[regla[1]] = sum(puntaje * regla[2][caracteristica]
+                                                   for caracteristica, puntaje in valor.items())
+                        continue
+                sobrantes[campo] = valor
+            respuestas[indice_banderas] = banderas
+            respuestas[indice_presentes] = presentes
+            # Como en codificar(): lo que sobra de los conjuntos va al final
+            for campo in CONJUNTOS_RESPUESTAS:
+                if campo in restos:
+                    sobrantes[campo] = restos[campo]
             
-        except Exception as e:
-            return {'error': f'Error en cálculo: {str(e)}'}
+            filas_valoracion.append((
+                valoracion_id, fecha, datos.get('tipo_software'), datos.get('tecnologia_principal'),
+                minimo, maximo, promedio, confianza, huella, *desglose, *respuestas
+            ))
+            if sobrantes:
+                filas_texto.append((valoracion_id,) + self.empaquetar_texto(sobrantes))
+        
+        return filas_valoracion, filas_texto
+
+codificador = CodificadorRespuestas()
+
+# Sentencias SQL reutilizadas. sqlite3 mantiene compiladas por conexión las
+# sentencias con el mismo texto, por lo que usar siempre estas constantes
+# evita volver a preparar cada consulta en cada solicitud.
+SQL_INSERTAR_VALORACION = 'INSERT INTO valoraciones ({}) VALUES ({})'.format(
+    ', '.join(codificador.columnas), ', '.join('?' * len(codificador.columnas))
+)
+
+SQL_INSERTAR_TEXTO = 'INSERT INTO valoraciones_texto (valoracion_id, comprimido, contenido) VALUES (?, ?, ?)'
+SQL_INSERTAR_CATALOGO = 'INSERT OR IGNORE INTO catalogo_respuestas (campo, codigo, valor) VALUES (?, ?, ?)'
+
+SQL_OBTENER_VALORACION = '''
+    SELECT {}, t.comprimido, t.contenido
+    FROM valoraciones v LEFT JOIN valoraciones_texto t ON t.valoracion_id = v.id
+    WHERE v.id = ?
+'''.format(', '.join('v.' + columna for columna in codificador.columnas))
+
+SQL_BUSCAR_POR_HUELLA = '''
+    SELECT id FROM valoraciones WHERE huella = ?
+    ORDER BY fecha_creacion DESC, id DESC LIMIT 1
+'''
+
+SQL_ACUMULAR_ESTADISTICAS = '''
+    INSERT INTO estadisticas_resumen (dimension, clave, cantidad, suma_valor)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (dimension, clave) DO UPDATE SET
+        cantidad = cantidad + excluded.cantidad,
+        suma_valor = suma_valor + excluded.suma_valor
+'''
+
+class BaseDatos:
+    """
+    Capa de acceso a SQLite con una conexión persistente por hilo
+    
+    Cada hilo (y cada proceso, tras un fork) reutiliza su propia conexión, ya
+    configurada con journaling WAL para que las lecturas no bloqueen la
+    escritura entre workers de gunicorn.
+    """
+    
+    PRAGMAS = [
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',     # Seguro con WAL, evita un fsync por commit
+        'PRAGMA cache_size=-16000',      # ~16 MB de caché de páginas por conexión
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA busy_timeout=30000'      # Esperar en lugar de fallar con "database is locked"
+    ]
+    
+    def __init__(self, ruta):
+        self.ruta = os.path.abspath(ruta)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexiones = []
     
-    def _estimar_horas(self, datos):
+    def _abrir(self):
+        conn = sqlite3.connect(self.ruta, timeout=30, cached_statements=256, check_same_thread=False,
+                               factory=ConexionInstrumentada if metricas.activas else sqlite3.Connection)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        with self._lock:
+            self._conexiones.append(conn)
+        return conn
+    
+    def conexion(self):
+        """Devuelve la conexión del hilo actual, abriéndola si es necesario"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._abrir()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def transaccion(self):
+        """Conexión usable con `with`: confirma al salir o revierte si hay excepción"""
+        conn = self.conexion()
+        return TransaccionMedida(conn) if metricas.activas else conn
+    
+    def _medir_consulta(self, sql, parametros, leer):
+        # Cursor sin instrumentar: se mide la consulta completa, incluida la lectura de filas
+        inicio = time.perf_counter()
+        resultado = leer(self.conexion().cursor().execute(sql, parametros))
+        metricas.observar('sqlite_sentencia_segundos', time.perf_counter() - inicio, sentencia=etiqueta_sql(sql))
+        return resultado
+    
+    def consultar(self, sql, parametros=()):
+        """Ejecuta una consulta y devuelve todas las filas"""
+        if metricas.activas:
+            return self._medir_consulta(sql, parametros, sqlite3.Cursor.fetchall)
+        return self.conexion().execute(sql, parametros).fetchall()
+    
+    def consultar_uno(self, sql, parametros=()):
+        """Ejecuta una consulta y devuelve la primera fila (o None)"""
+        if metricas.activas:
+            return self._medir_consulta(sql, parametros, sqlite3.Cursor.fetchone)
+        return self.conexion().execute(sql, parametros).fetchone()
+    
+    def abrir_lectura(self):
         """
-        Estimación técnica de horas de desarrollo basada en análisis científico
-        
-        Metodología:
-        1. Horas base por tipo de sistema (COCOMO adaptado)
-        2. Ajustes por funcionalidades implementadas
-        3. Factores de tecnología y arquitectura
-        4. Complejidad operacional y de datos
-        5. Factor de incertidumbre y contexto
+        Conexión exclusiva de solo lectura para recorridos largos
         
-        Referencias: COCOMO II, Function Point Analysis, experiencia mercado colombiano
+        No se comparte con el hilo: un cursor que se consume durante toda una
+        descarga no puede interferir con las transacciones de otras
+        solicitudes. Quien la abre debe cerrarla.
         """
+        conn = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False,
+                               factory=ConexionInstrumentada if metricas.activas else sqlite3.Connection)
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        conn.execute('PRAGMA query_only=1')
+        return conn
+    
+    def cerrar(self):
+        """Cierra todas las conexiones abiertas por este proceso"""
+        with self._lock:
+            conexiones, self._conexiones = self._conexiones, []
+        for conn in conexiones:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+db = BaseDatos(DB_PATH)
+
+def cargar_valoracion(valoracion_id):
+    """
+    Lee una valoración guardada como diccionario, o None si no existe
+    
+    Incluye las columnas de la fila más 'respuestas' y 'desglose'
+    reconstruidos a partir de las columnas tipadas y del texto aparte.
+    """
+    fila = db.consultar_uno(SQL_OBTENER_VALORACION, (valoracion_id,))
+    if fila is None:
+        return None
+    valoracion = dict(zip(codificador.columnas, fila))
+    sobrantes = codificador.desempaquetar_texto(*fila[len(codificador.columnas):])
+    for campo in ('tipo_software', 'tecnologia_principal'):
+        if valoracion[campo] is not None:
+            sobrantes[campo] = valoracion[campo]
+    valoracion['respuestas'], valoracion['desglose'] = codificador.decodificar(valoracion, sobrantes)
+    return valoracion
+
+# ================================
+# VALIDACIÓN DE DATOS DE ENTRADA
+# ================================
+
+def safe_int(value, default=0):
+    """Convierte un valor del formulario a entero, con valor por defecto"""
+    if value is None or value == '' or value == 'None':
+        return default
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return default
+
+def safe_float(value, default=0.0):
+    """Convierte un valor del formulario a flotante, con valor por defecto"""
+    if value is None or value == '' or value == 'None':
+        return default
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return default
+
+def validar_datos_software(datos):
+    """
+    Valida y limpia en sitio los datos de un software a valorar
+    
+    Devuelve un mensaje de error si faltan campos requeridos, o None si los
+    datos quedaron listos para el motor de valoración.
+    """
+    if not isinstance(datos, dict) or not datos:
+        return 'No se recibieron datos'
+    
+    if 'tipo_software' not in datos:
+        return 'tipo_software es requerido'
+    
+    if 'tecnologia_principal' not in datos:
+        return 'tecnologia_principal es requerido'
+    
+    if not isinstance(datos['tecnologia_principal'], str):
+        return 'tecnologia_principal debe ser texto'
+    
+    if not isinstance(datos['tipo_software'], str):
+        return 'tipo_software debe ser texto'
+    
+    # Campos anidados: el motor los recorre como diccionarios de valores simples
+    for campo in CONJUNTOS_RESPUESTAS:
+        if campo in datos and not isinstance(datos[campo], dict):
+            return f'{campo} debe ser un objeto'
+    if 'iso25010' in datos:
+        if not isinstance(datos['iso25010'], dict):
+            return 'iso25010 debe ser un objeto'
+        for caracteristica, puntaje in datos['iso25010'].items():
+            if type(puntaje) not in (int, float):
+                return f'iso25010.{caracteristica} debe ser numérico'
+    
+    # Limpiar campos numéricos críticos
+    datos['usuarios_concurrentes'] = safe_int(datos.get('usuarios_concurrentes'), 1)
+    datos['usuarios_totales'] = safe_int(datos.get('usuarios_totales'), 1)
+    datos['integraciones_externas'] = safe_int(datos.get('integraciones_externas'), 0)
+    datos['antiguedad_anos'] = safe_float(datos.get('antiguedad_anos'), 0.0)
+    datos['criticidad_negocio'] = safe_int(datos.get('criticidad_negocio'), 3)
+    datos['tiempo_desarrollo_meses'] = safe_float(datos.get('tiempo_desarrollo_meses'), 0.0)
+    datos['ahorro_anual_cop'] = safe_int(datos.get('ahorro_anual_cop'), 0)
+    datos['inversion_original_cop'] = safe_int(datos.get('inversion_original_cop'), 0)
+    
+    # Validar rangos
+    if datos['usuarios_concurrentes'] < 1:
+        datos['usuarios_concurrentes'] = 1
+    if datos['criticidad_negocio'] < 1 or datos['criticidad_negocio'] > 5:
+        datos['criticidad_negocio'] = 3
+    
+    return None
+
+def huella_datos(datos):
+    """
+    Hash canónico de unos datos ya validados
+    
+    Se calcula sobre el JSON con claves ordenadas y sin espacios, de modo que
+    el mismo formulario produce la misma huella sin importar el orden de los
+    campos ni si los números llegaron como texto.
+    """
+    canonico = json.dumps(datos, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonico.encode('utf-8')).hexdigest()
+
+# ================================
+# REGLAS COMPILADAS
+# ================================
+
+class ReglasCompiladas:
+    """
+    Tablas de búsqueda construidas una sola vez a partir de las reglas declarativas
+    
+    - Las categorías (arquitectura, volumen, base de datos, ...) se convierten en
+      códigos enteros que indexan listas de factores. El último código de cada
+      categoría corresponde a un valor desconocido (factor 1.0).
+    - Los umbrales se guardan como (mayor_o_igual, umbral, factor).
+    - Las banderas (funcionalidades, cumplimientos, contexto) se agrupan en
+      máscaras de bits que indexan tablas precalculadas.
+    - Los factores que solo dependen de categorías y banderas (Colombia,
+      valoración, margen) se precalculan completos aplicando cada regla en el
+      mismo orden de siempre, por lo que el resultado es idéntico al de
+      evaluarlas paso a paso.
+    - El aporte (factor × peso) y el peso de cada característica ISO 25010 se
+      tabulan por puntaje 0-5 (0 = sin respuesta); sumarlos en el orden de
+      PESOS_ISO25010 da exactamente el mismo factor de calidad que la fórmula.
+    
+    MotorValoracion usa las listas de Python; MotorValoracionLote usa las mismas
+    tablas como arreglos NumPy (atributo `arreglos`).
+    """
+    
+    def __init__(self):
+        # === CATEGORÍAS ===
+        self.codigos_volumen, self.factores_volumen = self._compilar_categoria(FACTORES_VOLUMEN_DATOS)
+        self.codigos_arquitectura, self.factores_arquitectura = self._compilar_categoria(FACTORES_ARQUITECTURA)
+        self.codigos_base_datos, self.factores_base_datos = self._compilar_categoria(FACTORES_BASE_DATOS)
+        self.codigos_criticidad, self.factores_criticidad = self._compilar_categoria(FACTORES_CRITICIDAD)
+        self.codigos_sector_negocio, self.factores_sector_negocio = self._compilar_categoria(FACTORES_SECTOR_NEGOCIO)
+        self.codigos_certeza, self.factores_certeza = self._compilar_categoria(AJUSTES_CERTEZA_CONFIANZA)
+        self.codigos_tipo_confianza, self.factores_tipo_confianza = self._compilar_categoria(AJUSTES_TIPO_CONFIANZA)
+        self.codigos_tipo_valoracion, self.factores_tipo_valoracion = self._compilar_categoria(AJUSTES_TIPO_VALORACION)
+        
+        # === UMBRALES ===
+        self.umbrales = {
+            'usuarios_horas': self._compilar_umbrales(UMBRALES_USUARIOS_HORAS),
+            'concurrencia': self._compilar_umbrales(UMBRALES_CONCURRENCIA),
+            'integraciones': self._compilar_umbrales(UMBRALES_INTEGRACIONES),
+            'ahorro_anual': self._compilar_umbrales(UMBRALES_AHORRO_ANUAL),
+            'usuarios_totales': self._compilar_umbrales(UMBRALES_USUARIOS_TOTALES),
+            'roi': self._compilar_umbrales(UMBRALES_ROI),
+            'bono_cumplimiento': self._compilar_umbrales(UMBRALES_BONO_CUMPLIMIENTO)
+        }
         
-        # === PASO 1: HORAS BASE POR TIPO DE SISTEMA ===
-        # Basado en análisis de proyectos similares en el mercado colombiano
-        horas_base = {
-            'sistema_auditoria': 140,        # Complejidad normativa alta
-            'aplicativo_gestion': 100,       # Gestión estándar de datos
-            'sistema_reportes': 80,          # Enfoque específico en reportes
-            'erp_basico': 160,              # Múltiples módulos integrados
-            'crm_sistema': 120,             # Gestión de relaciones
-            'aplicativo_inventarios': 90,   # Control de stock y movimientos
-            'gestion_documental': 110,      # Manejo de archivos y metadatos
-            'sistema_contable': 130,        # Complejidad contable y fiscal
-            'otro': 100                     # Promedio general
-        }
-        
-        tipo_software = datos.get('tipo_software', 'otro')
-        horas = horas_base.get(tipo_software, 100)
-        
-        # === PASO 2: AJUSTES POR FUNCIONALIDADES ESPECÍFICAS ===
-        # Cada funcionalidad agrega complejidad medida en horas adicionales
-        funcionalidades = datos.get('funcionalidades', {})
-        ajustes_funcionalidades = []
-        
-        if funcionalidades.get('autenticacion_avanzada'):
-            ajuste = 35
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Autenticación avanzada: +{ajuste}h")
-        
-        if funcionalidades.get('reportes_complejos'):
-            ajuste = 45
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Reportes complejos: +{ajuste}h")
-        
-        if funcionalidades.get('integracion_externa'):
-            ajuste = 60
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Integración externa: +{ajuste}h")
-        
-        if funcionalidades.get('workflow_aprobaciones'):
-            ajuste = 70
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Workflows: +{ajuste}h")
-        
-        if funcionalidades.get('dashboard_ejecutivo'):
-            ajuste = 40
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Dashboard ejecutivo: +{ajuste}h")
-        
-        if funcionalidades.get('api_rest'):
-            ajuste = 55
-            horas += ajuste
-            ajustes_funcionalidades.append(f"APIs REST: +{ajuste}h")
-        
-        if funcionalidades.get('notificaciones'):
-            ajuste = 25
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Notificaciones: +{ajuste}h")
-        
-        if funcionalidades.get('backup_automatico'):
-            ajuste = 20
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Backup automático: +{ajuste}h")
-        
-        if funcionalidades.get('auditoria_logs'):
-            ajuste = 30
-            horas += ajuste
-            ajustes_funcionalidades.append(f"Logs auditoría: +{ajuste}h")
-        
-        # === PASO 3: FACTOR DE TECNOLOGÍA ===
-        tecnologia = datos.get('tecnologia_principal', '')
-        factor_tecnologia = 1.0
+        # === TECNOLOGÍAS CONOCIDAS ===
+        self.perfiles_tecnologia = {
+            tecnologia: self._perfilar_tecnologia(tecnologia) for tecnologia in FACTORES_TECNOLOGIA
+        }
+        
+        # === FUNCIONALIDADES: horas adicionales y etiquetas por máscara ===
+        self.claves_funcionalidades = [clave for clave, _, _ in AJUSTES_FUNCIONALIDADES]
+        self.horas_funcionalidades = []
+        self.etiquetas_funcionalidades = []
+        for mascara in range(1 << len(AJUSTES_FUNCIONALIDADES)):
+            horas = 0
+            etiquetas = []
+            for bit, (_, ajuste, etiqueta) in enumerate(AJUSTES_FUNCIONALIDADES):
+                if mascara >> bit & 1:
+                    horas += ajuste
+                    etiquetas.append(f"{etiqueta}: +{ajuste}h")
+            self.horas_funcionalidades.append(horas)
+            self.etiquetas_funcionalidades.append(tuple(etiquetas))
+        
+        # === COMPLEJIDAD: factores de funcionalidades a aplicar por máscara ===
+        self.claves_complejidad = [clave for clave, _ in FACTORES_FUNCIONALIDADES_COMPLEJIDAD]
+        self.factores_complejidad = self._compilar_secuencias(FACTORES_FUNCIONALIDADES_COMPLEJIDAD)
+        
+        # === CONFIANZA: factores de contexto a aplicar por máscara ===
+        self.claves_contexto_confianza = [clave for clave, _ in AJUSTES_CONTEXTO_CONFIANZA]
+        self.factores_contexto_confianza = self._compilar_secuencias(AJUSTES_CONTEXTO_CONFIANZA)
+        
+        # === COLOMBIA: factor completo y detalles por máscara de cumplimientos ===
+        self.condiciones_colombia = [
+            ('sector', condicion[len('sector='):]) if condicion.startswith('sector=') else (condicion, None)
+            for condicion, _, _ in CUMPLIMIENTOS_COLOMBIA
+        ]
+        self.factor_colombia = []
+        self.detalles_colombia = []
+        for mascara in range(1 << len(CUMPLIMIENTOS_COLOMBIA)):
+            factor = 1.0
+            detalles = []
+            for bit, (_, prima, etiqueta) in enumerate(CUMPLIMIENTOS_COLOMBIA):
+                if mascara >> bit & 1:
+                    factor *= prima
+                    detalles.append(etiqueta)
+            factor *= self.factor_umbral('bono_cumplimiento', len(detalles))
+            factor *= FACTOR_MERCADO_COLOMBIA
+            self.factor_colombia.append(min(factor, 2.2))  # Máximo 2.2x
+            self.detalles_colombia.append(tuple(detalles))
+        
+        # === VALORACIÓN: factor completo por (tipo, contexto, tecnología, datos faltantes) ===
+        self.claves_contexto_valoracion = [clave for clave, _ in AJUSTES_CONTEXTO_VALORACION]
+        self.dimensiones_valoracion = (
+            len(self.factores_tipo_valoracion),
+            1 << len(AJUSTES_CONTEXTO_VALORACION),
+            len(AJUSTES_TECNOLOGIA_BAJO_COSTO) + 1,
+            1 << len(AJUSTES_DATOS_FALTANTES)
+        )
+        self.factor_valoracion = []
+        for tipo, contexto, clase, faltantes in itertools.product(*map(range, self.dimensiones_valoracion)):
+            factor = 1.0
+            factor *= self.factores_tipo_valoracion[tipo]
+            for bit, (_, ajuste) in enumerate(AJUSTES_CONTEXTO_VALORACION):
+                if contexto >> bit & 1:
+                    factor *= ajuste
+            if clase < len(AJUSTES_TECNOLOGIA_BAJO_COSTO):
+                factor *= AJUSTES_TECNOLOGIA_BAJO_COSTO[clase][1]
+            for bit, (_, ajuste) in enumerate(AJUSTES_DATOS_FALTANTES):
+                if faltantes >> bit & 1:
+                    factor *= ajuste
+            self.factor_valoracion.append(max(0.4, factor))  # Mínimo 40% del valor base
+        
+        # === MARGEN: por (sin tiempo, sin inversión, certeza, tecnología básica) ===
+        self.dimensiones_margen = (2, 2, 3, 2)
+        self.margen = [
+            self._margen_por_regla(*combinacion)
+            for combinacion in itertools.product(*map(range, self.dimensiones_margen))
+        ]
+        
+        # === CALIDAD ISO 25010: aporte y peso por (característica, puntaje) ===
+        self.aportes_calidad = [
+            [self.aporte_calidad(caracteristica, puntaje) if puntaje else 0.0 for puntaje in range(6)]
+            for caracteristica in PESOS_ISO25010
+        ]
+        self.pesos_calidad = [[peso if puntaje else 0.0 for puntaje in range(6)] for peso in PESOS_ISO25010.values()]
+        
+        # === ARREGLOS PARA EL MOTOR POR LOTES ===
+        self.arreglos = {}
+        if NUMPY_AVAILABLE:
+            for nombre in ['factores_volumen', 'factores_arquitectura', 'factores_base_datos',
+                           'factores_criticidad', 'factores_sector_negocio', 'factores_certeza',
+                           'factores_tipo_confianza', 'horas_funcionalidades', 'factor_colombia',
+                           'factor_valoracion', 'margen', 'aportes_calidad', 'pesos_calidad']:
+                self.arreglos[nombre] = np.array(getattr(self, nombre), dtype=float)
+    
+    @staticmethod
+    def _compilar_categoria(tabla):
+        """Devuelve ({valor: código}, [factor por código] + [1.0 para desconocidos])"""
+        return {valor: codigo for codigo, valor in enumerate(tabla)}, list(tabla.values()) + [1.0]
+    
+    @staticmethod
+    def _compilar_umbrales(reglas):
+        return [(operador == '>=', umbral, factor) for operador, umbral, factor in reglas]
+    
+    @staticmethod
+    def _compilar_secuencias(ajustes):
+        """Para cada máscara, la tupla ordenada de factores de las banderas activas"""
+        return [
+            tuple(factor for bit, (_, factor) in enumerate(ajustes) if mascara >> bit & 1)
+            for mascara in range(1 << len(ajustes))
+        ]
+    
+    @staticmethod
+    def _perfilar_tecnologia(tecnologia):
+        """(factor de horas, costo por hora, clase de bajo costo, es básica) de una tecnología"""
+        tec = tecnologia.lower()
         
         if tecnologia in FACTORES_TECNOLOGIA:
-            factor_tecnologia = FACTORES_TECNOLOGIA[tecnologia]['factor']
+            factor = FACTORES_TECNOLOGIA[tecnologia]['factor']
+            costo_hora = COSTOS_BASE[FACTORES_TECNOLOGIA[tecnologia]['nivel']] * factor
+        else:
+            factor = 1.0
+            costo_hora = COSTOS_BASE['medio']  # Default
         
         # Para tecnologías legacy como Access, el desarrollo es más directo pero menos escalable
-        if 'access' in tecnologia.lower():
-            factor_tecnologia = 0.85  # 15% menos por simplicidad de desarrollo
+        factor_horas = 0.85 if 'access' in tec else factor  # 15% menos por simplicidad de desarrollo
+        
+        clase = len(AJUSTES_TECNOLOGIA_BAJO_COSTO)
+        for indice, (patron, _) in enumerate(AJUSTES_TECNOLOGIA_BAJO_COSTO):
+            if patron in tec:
+                clase = indice
+                break
+        
+        es_basica = any(patron in tec for patron in TECNOLOGIAS_BASICAS)
+        return factor_horas, costo_hora, clase, es_basica
+    
+    @staticmethod
+    def _margen_por_regla(sin_tiempo, sin_inversion, certeza, es_basica):
+        """Margen de incertidumbre; certeza: 0 = media, 1 = baja, 2 = alta"""
+        margen_base = 0.20  # 20% base según literatura científica
+        
+        if sin_tiempo:
+            margen_base += 0.10  # +10% sin datos de tiempo
+        if sin_inversion:
+            margen_base += 0.08  # +8% sin datos de inversión
+        if certeza == 1:
+            margen_base += 0.12  # +12% baja certeza general
+        elif certeza == 2:
+            margen_base -= 0.05  # -5% alta certeza
+        
+        # Para tecnologías básicas, reducir incertidumbre (son más predecibles)
+        if es_basica:
+            margen_base *= 0.8  # -20% más predecible
+        
+        return min(0.45, max(0.10, margen_base))  # Entre 10% y 45%
+    
+    # === EVALUACIÓN ESCALAR ===
+    
+    @staticmethod
+    def codigo(codigos, valor):
+        """Código de un valor categórico (len(codigos) si es desconocido)"""
+        try:
+            return codigos.get(valor, len(codigos))
+        except TypeError:  # Valores no hashables (listas, objetos JSON)
+            return len(codigos)
+    
+    @staticmethod
+    def mascara(banderas, claves):
+        """Máscara de bits con las claves activas (verdaderas) de un diccionario"""
+        mascara = 0
+        for bit, clave in enumerate(claves):
+            if banderas.get(clave):
+                mascara |= 1 << bit
+        return mascara
+    
+    def factor_umbral(self, nombre, valor):
+        """Factor de la primera regla de umbral que se cumple, o 1.0"""
+        for mayor_o_igual, umbral, factor in self.umbrales[nombre]:
+            if (valor >= umbral) if mayor_o_igual else (valor > umbral):
+                return factor
+        return 1.0
+    
+    def perfil_tecnologia(self, tecnologia):
+        perfil = self.perfiles_tecnologia.get(tecnologia)
+        if perfil is None:
+            perfil = self._perfilar_tecnologia(tecnologia)
+        return perfil
+    
+    def mascara_colombia(self, datos):
+        sector = datos.get('sector', 'privado')
+        mascara = 0
+        for bit, (clave, valor_sector) in enumerate(self.condiciones_colombia):
+            cumple = (sector == valor_sector) if valor_sector is not None else datos.get(clave, False)
+            if cumple:
+                mascara |= 1 << bit
+        return mascara
+    
+    def indice_valoracion(self, datos, perfil):
+        tipo = self.codigo(self.codigos_tipo_valoracion, datos.get('tipo_valoracion', 'equilibrada'))
+        contexto = self.mascara(datos.get('contexto_desarrollo', {}), self.claves_contexto_valoracion)
+        faltantes = 0
+        for bit, (campo, _) in enumerate(AJUSTES_DATOS_FALTANTES):
+            if datos.get(campo) == 'no':
+                faltantes |= 1 << bit
+        
+        _, dim_contexto, dim_clase, dim_faltantes = self.dimensiones_valoracion
+        return ((tipo * dim_contexto + contexto) * dim_clase + perfil[2]) * dim_faltantes + faltantes
+    
+    @staticmethod
+    def aporte_calidad(caracteristica, valor):
+        """Aporte de una característica ISO 25010 al factor de calidad (antes de dividir por el peso)"""
+        # Escala 1-5, convertir a factor 0.3-1.3 (más realista)
+        factor_caracteristica = 0.3 + (valor - 1) * 0.25  # Mapeo 1-5 -> 0.3-1.3
+        
+        # Penalizar especialmente seguridad deficiente
+        if caracteristica == 'security' and valor <= 2:
+            factor_caracteristica *= 0.8  # Penalización adicional del 20%
+        
+        return factor_caracteristica * PESOS_ISO25010[caracteristica]
+    
+    def indice_margen(self, datos, perfil):
+        certeza = {'baja': 1, 'alta': 2}.get(datos.get('nivel_certeza'), 0)
+        return (((datos.get('conoce_tiempo_desarrollo') == 'no') * 2
+                 + (datos.get('conoce_inversion') == 'no')) * 3 + certeza) * 2 + perfil[3]
+    
+    # === EVALUACIÓN VECTORIZADA ===
+    
+    def factores_umbral(self, nombre, valores):
+        """Versión NumPy de factor_umbral sobre un arreglo de valores"""
+        factores = np.ones(len(valores))
+        # En orden inverso para que la primera regla que se cumple prevalezca
+        for mayor_o_igual, umbral, factor in reversed(self.umbrales[nombre]):
+            cumple = (valores >= umbral) if mayor_o_igual else (valores > umbral)
+            factores = np.where(cumple, factor, factores)
+        return factores
+
+REGLAS = ReglasCompiladas()
+
+# ================================
+# CACHÉ DE VALORACIONES
+# ================================
+
+class CacheValoraciones:
+    """
+    Caché LRU con expiración de resultados de valoración, por huella de los datos
+    
+    Cada entrada guarda el resultado (sin id) y el id de la última fila
+    guardada con esos datos, para reutilizarla en modo de deduplicación.
+    """
+    
+    def __init__(self, max_elementos, ttl):
+        self.max_elementos = max_elementos
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def obtener(self, huella):
+        """Devuelve (resultado, valoracion_id) o None si no existe o expiró"""
+        with self._lock:
+            entrada = self._entradas.get(huella)
+            if entrada is None:
+                return None
+            expira, resultado, valoracion_id = entrada
+            if expira < time.monotonic():
+                del self._entradas[huella]
+                return None
+            self._entradas.move_to_end(huella)
+        return copy.deepcopy(resultado), valoracion_id
+    
+    def guardar(self, huella, resultado, valoracion_id):
+        if self.max_elementos <= 0:
+            return
+        resultado = {clave: valor for clave, valor in resultado.items() if clave != 'id'}
+        with self._lock:
+            self._entradas.pop(huella, None)
+            self._entradas[huella] = (time.monotonic() + self.ttl, copy.deepcopy(resultado), valoracion_id)
+            while len(self._entradas) > self.max_elementos:
+                self._entradas.popitem(last=False)
+    
+    def descartar(self, valoraciones_ids):
+        """Elimina las entradas que apuntan a alguno de esos ids"""
+        valoraciones_ids = set(valoraciones_ids)
+        with self._lock:
+            for huella in [huella for huella, (_, _, valoracion_id) in self._entradas.items()
+                           if valoracion_id in valoraciones_ids]:
+                del self._entradas[huella]
+    
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+cache_valoraciones = CacheValoraciones(CACHE_VALORACIONES_ELEMENTOS, CACHE_VALORACIONES_TTL)
+
+# ================================
+# MOTOR DE VALORACIÓN
+# ================================
+
+class MotorValoracion:
+    """
+    Motor de valoración sin estado
+    
+    Los métodos no escriben en la instancia: los detalles intermedios van en
+    la traza de cada llamada (calcular_traza), así que una sola instancia
+    atiende a todos los hilos de un worker.
+    """
+    
+    def init_database(self):
+        """Inicializa la base de datos SQLite"""
+        with db.transaccion() as conn:
+            # Bloqueo de escritura desde el inicio: si varios workers arrancan a
+            # la vez, solo uno reconstruye el resumen de estadísticas
+            conn.execute('BEGIN IMMEDIATE')
+            self._crear_esquema(conn)
+    
+    def _crear_esquema(self, conn):
+        """Crea las tablas del sistema si no existen"""
+        cursor = conn.cursor()
+        
+        # Bases de datos anteriores (respuestas y desglose como JSON)
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version < ESQUEMA_VERSION:
+            self._migrar_a_columnar(conn)
+        
+        # Tabla de valoraciones: factores y respuestas en columnas tipadas
+        cursor.execute(codificador.definicion_tabla('valoraciones'))
+        
+        # Textos libres y campos sin columna propia (JSON, comprimido con zlib)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS valoraciones_texto (
+                valoracion_id TEXT PRIMARY KEY,
+                comprimido INTEGER NOT NULL DEFAULT 0,
+                contenido BLOB NOT NULL
+            )
+        ''')
+        
+        # Significado de los códigos categóricos, para reportes en SQL puro
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS catalogo_respuestas (
+                campo TEXT NOT NULL,
+                codigo INTEGER NOT NULL,
+                valor TEXT NOT NULL,
+                PRIMARY KEY (campo, codigo)
+            ) WITHOUT ROWID
+        ''')
+        cursor.executemany(SQL_INSERTAR_CATALOGO, self._filas_catalogo())
+        
+        # Tabla de tecnologías
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS tecnologias (
+                id INTEGER PRIMARY KEY,
+                nombre TEXT,
+                categoria TEXT,
+                factor_costo REAL,
+                nivel_complejidad TEXT,
+                popularidad_colombia REAL
+            )
+        ''')
+        
+        # Índices para el histórico: orden por fecha y filtros frecuentes.
+        # Incluyen el id para paginar por cursor (fecha, id) sin ordenar en memoria.
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_valoraciones_fecha ON valoraciones (fecha_creacion, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_valoraciones_tipo ON valoraciones (tipo_software, fecha_creacion, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_valoraciones_tecnologia ON valoraciones (tecnologia_principal, fecha_creacion, id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_valoraciones_huella ON valoraciones (huella, fecha_creacion, id)')
+        
+        # Agregados mantenidos en cada inserción, para que /api/estadisticas
+        # no recorra la tabla de valoraciones. Dimensiones: global,
+        # tecnologia, tipo_software y mes (AAAA-MM).
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS estadisticas_resumen (
+                dimension TEXT NOT NULL,
+                clave TEXT NOT NULL,
+                cantidad INTEGER NOT NULL DEFAULT 0,
+                suma_valor REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (dimension, clave)
+            ) WITHOUT ROWID
+        ''')
+        
+        # Bases de datos anteriores: poblar el resumen una sola vez
+        resumen_vacio = cursor.execute('SELECT 1 FROM estadisticas_resumen LIMIT 1').fetchone() is None
+        hay_valoraciones = cursor.execute('SELECT 1 FROM valoraciones LIMIT 1').fetchone() is not None
+        if resumen_vacio and hay_valoraciones:
+            self._reconstruir_estadisticas(conn)
+        
+        cursor.execute(f'PRAGMA user_version = {ESQUEMA_VERSION}')
+    
+    @staticmethod
+    def _filas_catalogo():
+        return [
+            (campo, codigo, valor)
+            for campo, vocabulario in VOCABULARIOS_RESPUESTAS.items()
+            for codigo, valor in enumerate(vocabulario, start=1)
+        ]
+    
+    def sincronizar_catalogo(self):
+        """
+        Agrega a catalogo_respuestas los códigos de vocabulario que le falten
+        
+        Los vocabularios crecen sin cambiar ESQUEMA_VERSION, así que una base
+        ya migrada no los recibiría. Solo escribe si el catálogo tiene menos
+        filas que los vocabularios; devuelve cuántas faltaban.
+        """
+        filas = self._filas_catalogo()
+        faltantes = len(filas) - db.consultar_uno('SELECT COUNT(*) FROM catalogo_respuestas')[0]
+        if faltantes > 0:
+            with db.transaccion() as conn:
+                conn.executemany(SQL_INSERTAR_CATALOGO, filas)
+        return max(faltantes, 0)
+    
+    def _migrar_a_columnar(self, conn):
+        """
+        Convierte la tabla de valoraciones con respuestas_json/desglose_json al
+        formato columnar, conservando ids y fechas. Calcula la huella de las
+        filas que no la tienen y el valor promedio como (mínimo + máximo) / 2.
+        """
+        columnas = [fila[1] for fila in conn.execute('PRAGMA table_info(valoraciones)')]
+        if 'respuestas_json' not in columnas:
+            return  # Base nueva o ya migrada
+        
+        for indice in ('idx_valoraciones_fecha', 'idx_valoraciones_tipo',
+                       'idx_valoraciones_tecnologia', 'idx_valoraciones_huella'):
+            conn.execute(f'DROP INDEX IF EXISTS {indice}')
+        conn.execute('ALTER TABLE valoraciones RENAME TO valoraciones_json')
+        conn.execute(codificador.definicion_tabla('valoraciones'))
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS valoraciones_texto (
+                valoracion_id TEXT PRIMARY KEY,
+                comprimido INTEGER NOT NULL DEFAULT 0,
+                contenido BLOB NOT NULL
+            )
+        ''')
+        
+        huella = 'huella' if 'huella' in columnas else 'NULL'
+        lectura = conn.execute(f'''
+            SELECT id, fecha_creacion, tipo_software, tecnologia_principal, respuestas_json,
+                   valor_minimo, valor_maximo, factor_confianza, desglose_json, {huella}
+            FROM valoraciones_json
+        ''')
+        while True:
+            filas = lectura.fetchmany(1000)
+            if not filas:
+                break
+            valoraciones = []
+            textos = []
+            for (valoracion_id, fecha, tipo_software, tecnologia, respuestas_json,
+                 valor_minimo, valor_maximo, factor_confianza, desglose_json, huella_fila) in filas:
+                datos = json.loads(respuestas_json) if respuestas_json else {}
+                datos.setdefault('tipo_software', tipo_software)
+                datos.setdefault('tecnologia_principal', tecnologia)
+                resultado = {
+                    'valor_minimo': valor_minimo,
+                    'valor_maximo': valor_maximo,
+                    'valor_promedio': round((valor_minimo + valor_maximo) / 2)
+                    if valor_minimo is not None and valor_maximo is not None else None,
+                    'factor_confianza': factor_confianza,
+                    'desglose': json.loads(desglose_json) if desglose_json else {}
+                }
+                fila_valoracion, fila_texto = codificador.filas(
+                    valoracion_id, fecha, datos, resultado,
+                    huella_fila or (huella_datos(datos) if respuestas_json else None)
+                )
+                valoraciones.append(fila_valoracion)
+                if fila_texto:
+                    textos.append(fila_texto)
+            conn.executemany(SQL_INSERTAR_VALORACION, valoraciones)
+            conn.executemany(SQL_INSERTAR_TEXTO, textos)
+        
+        conn.execute('DROP TABLE valoraciones_json')
+    
+    def _reconstruir_estadisticas(self, conn):
+        """Recalcula el resumen de estadísticas a partir de todas las valoraciones"""
+        conn.execute('DELETE FROM estadisticas_resumen')
+        for dimension, expresion in [
+            ('global', "''"),
+            ('tecnologia', "COALESCE(tecnologia_principal, '')"),
+            ('tipo_software', "COALESCE(tipo_software, '')"),
+            ('mes', "COALESCE(substr(fecha_creacion, 1, 7), '')")
+        ]:
+            conn.execute(f'''
+                INSERT INTO estadisticas_resumen (dimension, clave, cantidad, suma_valor)
+                SELECT ?, {expresion}, COUNT(*), COALESCE(SUM((valor_minimo + valor_maximo) / 2), 0)
+                FROM valoraciones
+                GROUP BY {expresion}
+            ''', (dimension,))
+    
+    def _acumular_estadisticas(self, conn, filas):
+        """
+        Suma nuevas valoraciones al resumen de estadísticas
+        
+        filas: iterable de (fecha, tipo_software, tecnologia, valor_minimo, valor_maximo).
+        Debe llamarse dentro de la misma transacción que inserta las valoraciones.
+        """
+        acumulado = {}
+        for fecha, tipo_software, tecnologia, valor_minimo, valor_maximo in filas:
+            valor = (valor_minimo + valor_maximo) / 2
+            for clave in [('global', ''),
+                          ('tecnologia', '' if tecnologia is None else str(tecnologia)),
+                          ('tipo_software', '' if tipo_software is None else str(tipo_software)),
+                          ('mes', fecha.strftime('%Y-%m'))]:
+                cantidad, suma = acumulado.get(clave, (0, 0.0))
+                acumulado[clave] = (cantidad + 1, suma + valor)
+        
+        conn.executemany(SQL_ACUMULAR_ESTADISTICAS, [
+            (dimension, clave, cantidad, suma)
+            for (dimension, clave), (cantidad, suma) in acumulado.items()
+        ])
+    
+    def calcular_valor(self, datos_software, deduplicar=False):
+        """
+        Algoritmo principal de valoración
+        
+        Fórmula: Valor = (Horas_Estimadas × Costo_Hora × Factor_Tecnología × Factor_Calidad × Factor_Negocio) ± Rango_Incertidumbre
+        
+        Los resultados se reutilizan desde cache_valoraciones para datos
+        idénticos. Con deduplicar=True, si ya existe una valoración guardada con
+        la misma huella se devuelve esa (con su id) en lugar de insertar otra.
+        """
+        cronometro = metricas.cronometro('valoracion_etapa_segundos', 'etapa')
+        try:
+            huella = huella_datos(datos_software)
+            en_cache = cache_valoraciones.obtener(huella)
+            cronometro.marcar('cache')
+            if en_cache is not None:
+                metricas.incrementar('valoracion_cache_total', resultado='acierto')
+                resultado, valoracion_id = en_cache
+            else:
+                metricas.incrementar('valoracion_cache_total', resultado='fallo')
+                resultado, valoracion_id = self._calcular_resultado(datos_software), None
+                cronometro.reanudar()  # _calcular_resultado registra sus propias etapas
+            
+            if deduplicar:
+                if valoracion_id is None:
+                    valoracion_id = escritor_diferido.buscar_huella(huella)
+                if valoracion_id is None:
+                    fila = db.consultar_uno(SQL_BUSCAR_POR_HUELLA, (huella,))
+                    valoracion_id = fila[0] if fila else None
+                cronometro.marcar('deduplicar')
+                if valoracion_id is not None:
+                    cache_valoraciones.guardar(huella, resultado, valoracion_id)
+                    resultado['id'] = valoracion_id
+                    resultado['deduplicada'] = True
+                    return resultado
+            
+            # Guardar en base de datos y obtener ID
+            valoracion_id = self._guardar_valoracion(datos_software, resultado, huella)
+            cache_valoraciones.guardar(huella, resultado, valoracion_id)
+            cronometro.marcar('guardar')
+            if valoracion_id:
+                resultado['id'] = valoracion_id  # Agregar ID al resultado
+            
+            return resultado
+            
+        except Exception as e:
+            metricas.incrementar('errores_total', origen='calcular_valor')
+            return {'error': f'Error en cálculo: {str(e)}'}
+        finally:
+            cronometro.registrar()
+    
+    def calcular_traza(self, datos_software):
+        """
+        Calcula la valoración sin guardarla y devuelve (resultado, traza)
+        
+        La traza reúne los detalles intermedios de esta llamada (cálculo de
+        horas y cumplimientos normativos). El motor no guarda estado entre
+        llamadas, así que puede usarse desde varios hilos a la vez.
+        """
+        traza = {}
+        return self._calcular_resultado(datos_software, traza), traza
+    
+    def _calcular_resultado(self, datos_software, traza=None):
+        """Calcula la valoración completa sin guardarla (con `traza`, anota los detalles en ese dict)"""
+        cronometro = metricas.cronometro('valoracion_etapa_segundos', 'etapa')
+        
+        # 1. Estimación de horas basada en complejidad
+        horas_estimadas = self._estimar_horas(datos_software, traza)
+        cronometro.marcar('estimar_horas')
+        
+        # 2. Costo por hora según tecnología
+        costo_hora = self._calcular_costo_hora(datos_software['tecnologia_principal'])
+        cronometro.marcar('costo_hora')
+        
+        # 3. Factor de calidad ISO 25010
+        factor_calidad = self._calcular_factor_calidad(datos_software.get('iso25010', {}))
+        cronometro.marcar('factor_calidad')
+        
+        # 4. Factor de complejidad técnica
+        factor_complejidad = self._calcular_factor_complejidad(datos_software)
+        cronometro.marcar('factor_complejidad')
+        
+        # 5. Factor de valor de negocio
+        factor_negocio = self._calcular_factor_negocio(datos_software)
+        cronometro.marcar('factor_negocio')
+        
+        # 6. Factor específico Colombia (cumplimiento normativo)
+        factor_colombia = self._calcular_factor_colombia(datos_software, traza)
+        cronometro.marcar('factor_colombia')
+        
+        # 7. Aplicar ajustes por tipo de valoración y contexto
+        factor_ajuste_valoracion = self._calcular_factor_valoracion(datos_software)
+        cronometro.marcar('factor_valoracion')
+        
+        # Cálculo base
+        valor_base = horas_estimadas * costo_hora
+        valor_ajustado = valor_base * factor_calidad * factor_complejidad * factor_negocio * factor_colombia * factor_ajuste_valoracion
+        
+        # Ajustar rango de incertidumbre según nivel de información disponible
+        margen_error = self._calcular_margen_incertidumbre(datos_software)
+        valor_minimo = valor_ajustado * (1 - margen_error)
+        valor_maximo = valor_ajustado * (1 + margen_error)
+        cronometro.marcar('margen_incertidumbre')
+        
+        # Factor de confianza basado en completitud de datos
+        factor_confianza = self._calcular_confianza(datos_software)
+        cronometro.marcar('confianza')
+        cronometro.registrar()
+        
+        resultado = {
+            'valor_minimo': round(valor_minimo),
+            'valor_maximo': round(valor_maximo),
+            'valor_promedio': round(valor_ajustado),
+            'factor_confianza': factor_confianza,
+            'desglose': {
+                'horas_estimadas': horas_estimadas,
+                'costo_hora': costo_hora,
+                'valor_base': valor_base,
+                'factor_calidad': factor_calidad,
+                'factor_complejidad': factor_complejidad,
+                'factor_negocio': factor_negocio,
+                'factor_colombia': factor_colombia,
+                'factor_ajuste_valoracion': factor_ajuste_valoracion,
+                'margen_incertidumbre': margen_error
+            },
+            'metodologia': 'ISO 25010:2023 + COCOMO Adaptado + Mercado Colombia 2025'
+        }
+        
+        return resultado
+    
+    def _estimar_horas(self, datos, traza=None):
+        """
+        Estimación técnica de horas de desarrollo basada en análisis científico
+        
+        Metodología:
+        1. Horas base por tipo de sistema (COCOMO adaptado)
+        2. Ajustes por funcionalidades implementadas
+        3. Factores de tecnología y arquitectura
+        4. Complejidad operacional y de datos
+        5. Factor de incertidumbre y contexto
+        
+        Referencias: COCOMO II, Function Point Analysis, experiencia mercado colombiano
+        """
+        
+        # === PASO 1: HORAS BASE POR TIPO DE SISTEMA ===
+        # Basado en análisis de proyectos similares en el mercado colombiano
+        tipo_software = datos.get('tipo_software', 'otro')
+        horas = HORAS_BASE_TIPO.get(tipo_software, 100)
+        
+        # === PASO 2: AJUSTES POR FUNCIONALIDADES ESPECÍFICAS ===
+        # Cada funcionalidad agrega complejidad medida en horas adicionales
+        mascara = REGLAS.mascara(datos.get('funcionalidades', {}), REGLAS.claves_funcionalidades)
+        horas += REGLAS.horas_funcionalidades[mascara]
         
+        # === PASO 3: FACTOR DE TECNOLOGÍA ===
+        factor_tecnologia = REGLAS.perfil_tecnologia(datos.get('tecnologia_principal', ''))[0]
         horas *= factor_tecnologia
         
         # === PASO 4: AJUSTES POR COMPLEJIDAD DE DATOS Y USUARIOS ===
-        usuarios_concurrentes = datos.get('usuarios_concurrentes', 1)
-        if usuarios_concurrentes > 20:
-            horas *= 1.15  # +15% por complejidad de concurrencia
-        elif usuarios_concurrentes > 5:
-            horas *= 1.08  # +8% por usuarios múltiples
+        horas *= REGLAS.factor_umbral('usuarios_horas', datos.get('usuarios_concurrentes', 1))
         
         # Volumen de datos
-        volumen_datos = datos.get('volumen_datos', 'pequeno')
-        factor_datos = {
-            'pequeno': 1.0,
-            'medio': 1.12,
-            'grande': 1.25,
-            'muy_grande': 1.40
-        }.get(volumen_datos, 1.0)
-        
+        factor_datos = REGLAS.factores_volumen[
+            REGLAS.codigo(REGLAS.codigos_volumen, datos.get('volumen_datos', 'pequeno'))
+        ]
         horas *= factor_datos
         
         # === PASO 5: FACTOR DE ARQUITECTURA ===
-        arquitectura = datos.get('arquitectura', 'monolitica')
-        factor_arquitectura = {
-            'monolitica': 1.0,
-            'capas': 1.15,
-            'cliente_servidor': 1.20,
-            'web_multicapa': 1.30,
-            'soa': 1.45,
-            'microservicios': 1.70
-        }.get(arquitectura, 1.0)
-        
+        factor_arquitectura = REGLAS.factores_arquitectura[
+            REGLAS.codigo(REGLAS.codigos_arquitectura, datos.get('arquitectura', 'monolitica'))
+        ]
         horas *= factor_arquitectura
+        horas_modelo = horas
         
         # === PASO 6: AJUSTE POR TIEMPO DE DESARROLLO CONOCIDO ===
         # Si se conoce el tiempo real de desarrollo, calibrar estimación
@@ -345,28 +2189,24 @@ class MotorValoracion:
         # === RESULTADO FINAL ===
         horas_finales = round(horas)
         
-        # Guardar detalles del cálculo para transparencia
-        self.detalles_calculo_horas = {
-            'horas_base': horas_base.get(tipo_software, 100),
-            'ajustes_funcionalidades': ajustes_funcionalidades,
-            'factor_tecnologia': factor_tecnologia,
-            'factor_datos': factor_datos,
-            'factor_arquitectura': factor_arquitectura,
-            'factor_legacy': 1.15 if (en_uso and antiguedad > 8) else 1.0,
-            'horas_finales': horas_finales
-        }
+        # Detalles del cálculo para transparencia (en la traza de esta llamada)
+        if traza is not None:
+            traza['calculo_horas'] = {
+                'horas_base': HORAS_BASE_TIPO.get(tipo_software, 100),
+                'ajustes_funcionalidades': list(REGLAS.etiquetas_funcionalidades[mascara]),
+                'factor_tecnologia': factor_tecnologia,
+                'factor_datos': factor_datos,
+                'factor_arquitectura': factor_arquitectura,
+                'factor_legacy': 1.15 if (en_uso and antiguedad > 8) else 1.0,
+                'horas_modelo': horas_modelo,
+                'horas_finales': horas_finales
+            }
         
         return horas_finales
     
     def _calcular_costo_hora(self, tecnologia):
         """Calcula el costo por hora según la tecnología"""
-        if tecnologia in FACTORES_TECNOLOGIA:
-            nivel = FACTORES_TECNOLOGIA[tecnologia]['nivel']
-            factor = FACTORES_TECNOLOGIA[tecnologia]['factor']
-            costo_base = COSTOS_BASE[nivel]
-            return costo_base * factor
-        else:
-            return COSTOS_BASE['medio']  # Default
+        return REGLAS.perfil_tecnologia(tecnologia)[1]
     
     def _calcular_factor_calidad(self, respuestas_iso):
         """Calcula factor de calidad basado en ISO 25010:2023 - Corregido para penalizar deficiencias"""
@@ -376,17 +2216,13 @@ class MotorValoracion:
         puntuacion_total = 0
         peso_total = 0
         
-        for caracteristica, peso in PESOS_ISO25010.items():
+        for aportes, (caracteristica, peso) in zip(REGLAS.aportes_calidad, PESOS_ISO25010.items()):
             if caracteristica in respuestas_iso:
-                # Escala 1-5, convertir a factor 0.3-1.3 (más realista)
                 valor = respuestas_iso[caracteristica]
-                factor_caracteristica = 0.3 + (valor - 1) * 0.25  # Mapeo 1-5 -> 0.3-1.3
-                
-                # Penalizar especialmente seguridad deficiente
-                if caracteristica == 'security' and valor <= 2:
-                    factor_caracteristica *= 0.8  # Penalización adicional del 20%
-                
-                puntuacion_total += factor_caracteristica * peso
+                if type(valor) is int and 1 <= valor <= 5:
+                    puntuacion_total += aportes[valor]
+                else:
+                    puntuacion_total += REGLAS.aporte_calidad(caracteristica, valor)
                 peso_total += peso
         
         if peso_total > 0:
@@ -410,85 +2246,26 @@ class MotorValoracion:
         factor = 1.0
         
         # === COMPLEJIDAD DE ARQUITECTURA ===
-        arquitectura = datos.get('arquitectura', 'monolitica')
-        factor_arq = {
-            'monolitica': 1.0,
-            'capas': 1.15,
-            'cliente_servidor': 1.20,
-            'web_multicapa': 1.30,
-            'soa': 1.45,
-            'microservicios': 1.70
-        }.get(arquitectura, 1.0)
-        factor *= factor_arq
+        factor *= REGLAS.factores_arquitectura[
+            REGLAS.codigo(REGLAS.codigos_arquitectura, datos.get('arquitectura', 'monolitica'))
+        ]
         
         # === COMPLEJIDAD DE DATOS ===
-        volumen_datos = datos.get('volumen_datos', 'pequeno')
-        bd_tipo = datos.get('base_datos_tipo', 'local')
-        
-        # Factor por volumen
-        factor_volumen = {
-            'pequeno': 1.0,
-            'medio': 1.12,
-            'grande': 1.25,
-            'muy_grande': 1.40
-        }.get(volumen_datos, 1.0)
-        factor *= factor_volumen
-        
-        # Factor por tipo de BD
-        factor_bd = {
-            'local': 1.0,           # Access, SQLite, Excel
-            'sql_server_express': 1.15,
-            'mysql': 1.20,
-            'postgresql': 1.25,
-            'sql_server': 1.35,
-            'oracle': 1.50,
-            'nosql': 1.30
-        }.get(bd_tipo, 1.0)
-        factor *= factor_bd
-        
-        # === CONCURRENCIA DE USUARIOS ===
-        usuarios_concurrentes = datos.get('usuarios_concurrentes', 1)
-        if usuarios_concurrentes >= 200:
-            factor *= 1.50  # Sistemas de alta concurrencia
-        elif usuarios_concurrentes >= 50:
-            factor *= 1.35  # Media-alta concurrencia
-        elif usuarios_concurrentes >= 20:
-            factor *= 1.20  # Media concurrencia
-        elif usuarios_concurrentes >= 10:
-            factor *= 1.10  # Baja-media concurrencia
-        elif usuarios_concurrentes > 5:
-            factor *= 1.05  # Multiusuario básico
-        # <= 5 usuarios: factor = 1.0 (sin cambio)
-        
-        # === INTEGRACIÓN EXTERNA ===
-        integraciones = datos.get('integraciones_externas', 0)
-        if integraciones > 10:
-            factor *= 1.60  # Altamente integrado
-        elif integraciones > 5:
-            factor *= 1.40  # Múltiples integraciones
-        elif integraciones > 2:
-            factor *= 1.25  # Varias integraciones
-        elif integraciones > 0:
-            factor *= 1.15  # Algunas integraciones
-        
-        # === FUNCIONALIDADES COMPLEJAS ===
-        funcionalidades = datos.get('funcionalidades', {})
-        
-        # APIs y servicios web
-        if funcionalidades.get('api_rest'):
-            factor *= 1.12
-        
-        # Workflows avanzados
-        if funcionalidades.get('workflow_aprobaciones'):
-            factor *= 1.08
+        factor *= REGLAS.factores_volumen[
+            REGLAS.codigo(REGLAS.codigos_volumen, datos.get('volumen_datos', 'pequeno'))
+        ]
+        factor *= REGLAS.factores_base_datos[
+            REGLAS.codigo(REGLAS.codigos_base_datos, datos.get('base_datos_tipo', 'local'))
+        ]
         
-        # Sistemas de notificaciones
-        if funcionalidades.get('notificaciones'):
-            factor *= 1.05
+        # === CONCURRENCIA DE USUARIOS E INTEGRACIÓN EXTERNA ===
+        factor *= REGLAS.factor_umbral('concurrencia', datos.get('usuarios_concurrentes', 1))
+        factor *= REGLAS.factor_umbral('integraciones', datos.get('integraciones_externas', 0))
         
-        # Dashboards ejecutivos complejos
-        if funcionalidades.get('dashboard_ejecutivo'):
-            factor *= 1.06
+        # === FUNCIONALIDADES COMPLEJAS ===
+        mascara = REGLAS.mascara(datos.get('funcionalidades', {}), REGLAS.claves_complejidad)
+        for factor_funcionalidad in REGLAS.factores_complejidad[mascara]:
+            factor *= factor_funcionalidad
         
         # Limitar factor máximo para evitar valores exagerados
         return min(factor, 2.8)  # Máximo 2.8x
@@ -508,61 +2285,24 @@ class MotorValoracion:
         factor = 1.0
         
         # === CRITICIDAD OPERACIONAL ===
-        criticidad = datos.get('criticidad_negocio', 3)  # 1-5
-        # Factor base por criticidad (más granular)
-        factor_criticidad = {
-            1: 0.75,  # Experimental, no crítico
-            2: 0.90,  # Soporte, baja criticidad
-            3: 1.00,  # Operaciones normales
-            4: 1.25,  # Procesos críticos
-            5: 1.50   # Operación central, misión crítica
-        }.get(criticidad, 1.0)
-        factor *= factor_criticidad
-        
-        # === AHORROS ECONÓMICOS ANUALES ===
+        factor *= REGLAS.factores_criticidad[
+            REGLAS.codigo(REGLAS.codigos_criticidad, datos.get('criticidad_negocio', 3))
+        ]
+        
+        # === AHORROS ECONÓMICOS Y USUARIOS BENEFICIADOS ===
         ahorro_anual = datos.get('ahorro_anual_cop', 0)
-        if ahorro_anual > 50000000:  # > 50M COP
-            factor *= 1.40  # Alto impacto económico
-        elif ahorro_anual > 20000000:  # > 20M COP
-            factor *= 1.30  # Medio-alto impacto
-        elif ahorro_anual > 10000000:  # > 10M COP
-            factor *= 1.20  # Medio impacto
-        elif ahorro_anual > 5000000:   # > 5M COP
-            factor *= 1.15  # Bajo-medio impacto
-        elif ahorro_anual > 1000000:   # > 1M COP
-            factor *= 1.08  # Bajo impacto
-        # Sin ahorros = sin ajuste
-        
-        # === NÚMERO DE USUARIOS BENEFICIADOS ===
-        usuarios_totales = datos.get('usuarios_totales', 1)
-        if usuarios_totales > 500:
-            factor *= 1.25  # Amplio impacto organizacional
-        elif usuarios_totales > 100:
-            factor *= 1.15  # Medio impacto
-        elif usuarios_totales > 50:
-            factor *= 1.08  # Impacto departamental
-        elif usuarios_totales > 20:
-            factor *= 1.04  # Impacto de equipo
+        factor *= REGLAS.factor_umbral('ahorro_anual', ahorro_anual)
+        factor *= REGLAS.factor_umbral('usuarios_totales', datos.get('usuarios_totales', 1))
         
         # === ANÁLISIS DE ROI (Return on Investment) ===
         inversion_original = datos.get('inversion_original_cop', 0)
         if ahorro_anual > 0 and inversion_original > 0:
-            roi_anual = ahorro_anual / inversion_original
-            if roi_anual > 2.0:  # ROI > 200%
-                factor *= 1.30  # Excelente ROI
-            elif roi_anual > 1.0:  # ROI > 100%
-                factor *= 1.20  # Buen ROI
-            elif roi_anual > 0.5:  # ROI > 50%
-                factor *= 1.10  # ROI aceptable
+            factor *= REGLAS.factor_umbral('roi', ahorro_anual / inversion_original)
         
         # === SECTOR Y CONTEXTO ESPECÍFICO ===
-        sector = datos.get('sector', 'privado')
-        if sector == 'publico':
-            factor *= 1.12  # Mayor valor social y regulatorio
-        elif sector == 'financiero':
-            factor *= 1.18  # Alta regulación y criticidad
-        elif sector == 'salud':
-            factor *= 1.15  # Impacto en vidas humanas
+        factor *= REGLAS.factores_sector_negocio[
+            REGLAS.codigo(REGLAS.codigos_sector_negocio, datos.get('sector', 'privado'))
+        ]
         
         # === TIEMPO DE DESARROLLO vs VALOR ===
         tiempo_desarrollo = datos.get('tiempo_desarrollo_meses', 0)
@@ -576,7 +2316,7 @@ class MotorValoracion:
         # Limitar factor para mantener realismo
         return min(factor, 3.5)  # Máximo 3.5x
     
-    def _calcular_factor_colombia(self, datos):
+    def _calcular_factor_colombia(self, datos, traza=None):
         """
         Factor específico para el contexto normativo y regulatorio colombiano
         
@@ -587,130 +2327,45 @@ class MotorValoracion:
         - Requisitos de auditoría y trazabilidad
         - Protección de datos personales
         - Reportes a entes de control
-        """
-        factor = 1.0
-        detalles_cumplimiento = []
         
-        # === REPORTES OFICIALES Y ENTES DE CONTROL ===
-        if datos.get('genera_reportes_oficiales', False):
-            factor *= 1.18  # Prima significativa por generación de reportes oficiales
-            detalles_cumplimiento.append("Reportes oficiales para entes de control")
+        El factor (primas, bonificación por múltiples cumplimientos, mercado
+        colombiano y tope de 2.2x) está precalculado por máscara de cumplimientos.
+        """
+        mascara = REGLAS.mascara_colombia(datos)
         
-        # === LOGS Y AUDITORÍA DETALLADA ===
-        if datos.get('requiere_auditoria_logs', False):
-            factor *= 1.12  # Prima por trazabilidad completa
-            detalles_cumplimiento.append("Logs de auditoría detallados")
+        # Detalles para el reporte
+        if traza is not None:
+            traza['cumplimiento'] = list(REGLAS.detalles_colombia[mascara])
         
-        # === SECTOR ESPECÍFICO ===
-        sector = datos.get('sector', 'privado')
-        if sector == 'publico':
-            factor *= 1.15   # Sector público con requerimientos especiales
-            detalles_cumplimiento.append("Sector público colombiano")
-        elif sector == 'financiero':
-            factor *= 1.25   # Alta regulación financiera
-            detalles_cumplimiento.append("Sector financiero regulado")
-        
-        # === NORMATIVAS ESPECÍFICAS COLOMBIANAS ===
-        
-        # Interoperabilidad Gobierno Digital
-        if datos.get('interoperabilidad_govco', False):
-            factor *= 1.10
-            detalles_cumplimiento.append("Estándares interoperabilidad Gov.co")
-        
-        # Ley Habeas Data (Protección de datos personales)
-        if datos.get('maneja_datos_personales', False):
-            factor *= 1.08
-            detalles_cumplimiento.append("Cumplimiento Ley Habeas Data")
-        
-        # Decreto 648 de 2017 (Auditoría Interna)
-        if datos.get('decreto_648', False):
-            factor *= 1.15
-            detalles_cumplimiento.append("Decreto 648/2017 - Auditoría Interna")
-        
-        # ISO 27001 (Seguridad de la información)
-        if datos.get('iso_27001', False):
-            factor *= 1.12
-            detalles_cumplimiento.append("Controles ISO 27001")
-        
-        # SARLAFT (Sistema de Administración de Riesgo de Lavado de Activos)
-        if datos.get('sarlaft', False):
-            factor *= 1.20
-            detalles_cumplimiento.append("Cumplimiento SARLAFT")
-        
-        # Reportes específicos a Contraloría
-        if datos.get('contraloria', False):
-            factor *= 1.10
-            detalles_cumplimiento.append("Reportes Contraloría General")
-        
-        # === BONIFICACIÓN POR MÚLTIPLES CUMPLIMIENTOS ===
-        # Si cumple con múltiples normativas, bonificación adicional
-        num_cumplimientos = len(detalles_cumplimiento)
-        if num_cumplimientos >= 5:
-            factor *= 1.08  # Bonus por alta complejidad normativa
-        elif num_cumplimientos >= 3:
-            factor *= 1.05  # Bonus por complejidad normativa media
-        
-        # === CONSIDERACIONES DE MERCADO COLOMBIANO ===
-        # Factor base por desarrollo en Colombia (costos laborales, infraestructura)
-        factor *= 1.05  # Factor base del mercado colombiano 2025
-        
-        # Guardar detalles para el reporte
-        self.detalles_cumplimiento = detalles_cumplimiento
-        
-        # Limitar factor máximo para mantener realismo
-        return min(factor, 2.2)  # Máximo 2.2x
+        return REGLAS.factor_colombia[mascara]
     
     def _calcular_confianza(self, datos):
         """Calcula el nivel de confianza basado en completitud de datos y validaciones del usuario"""
-        campos_criticos = [
-            'tipo_software', 'tecnologia_principal', 'antiguedad_anos',
-            'usuarios_concurrentes', 'criticidad_negocio'
-        ]
-        
-        campos_completos = sum(1 for campo in campos_criticos if datos.get(campo) is not None)
-        confianza_base = campos_completos / len(campos_criticos)
+        campos_completos = sum(1 for campo in CAMPOS_CRITICOS_CONFIANZA if datos.get(campo) is not None)
+        confianza_base = campos_completos / len(CAMPOS_CRITICOS_CONFIANZA)
         
         # === AJUSTES POR NIVEL DE CERTEZA DECLARADO ===
-        nivel_certeza = datos.get('nivel_certeza', 'media')
-        if nivel_certeza == 'alta':
-            confianza_base *= 1.1
-        elif nivel_certeza == 'baja':
-            confianza_base *= 0.8
-            
+        confianza_base *= REGLAS.factores_certeza[
+            REGLAS.codigo(REGLAS.codigos_certeza, datos.get('nivel_certeza', 'media'))
+        ]
+        
         # === AJUSTES POR INFORMACIÓN DISPONIBLE ===
-        # Penalizar si no conoce datos importantes
-        if datos.get('conoce_tiempo_desarrollo') == 'no':
-            confianza_base *= 0.9  # -10% por no conocer tiempo
-        elif datos.get('tiempo_calculado_por_fechas'):
-            confianza_base *= 0.95  # -5% por tiempo calculado de fechas
-            
-        if datos.get('conoce_inversion') == 'no':
-            confianza_base *= 0.85  # -15% por no conocer inversión
-        elif datos.get('inversion_es_estimada'):
-            confianza_base *= 0.9   # -10% por inversión estimada
-            
-        if datos.get('conoce_ahorros') == 'no':
-            confianza_base *= 0.9   # -10% por no conocer ahorros
-        elif datos.get('ahorros_son_estimados'):
-            confianza_base *= 0.95  # -5% por ahorros estimados
-            
+        # Penalizar si no conoce datos importantes o si son estimados
+        for campo, bandera_estimado, factor_desconocido, factor_estimado in AJUSTES_INFORMACION_CONFIANZA:
+            if datos.get(campo) == 'no':
+                confianza_base *= factor_desconocido
+            elif datos.get(bandera_estimado):
+                confianza_base *= factor_estimado
+        
         # === AJUSTES POR CONTEXTO DE DESARROLLO ===
-        contexto = datos.get('contexto_desarrollo', {})
-        if contexto.get('desarrollo_interno'):
-            confianza_base *= 1.05  # +5% por desarrollo interno (más control)
-        if contexto.get('sin_metodologia'):
-            confianza_base *= 0.85  # -15% por falta de metodología
-        if contexto.get('urgencia_tiempo'):
-            confianza_base *= 0.9   # -10% por desarrollo con urgencia
-        if contexto.get('tiempo_parcial'):
-            confianza_base *= 0.95  # -5% por desarrollo tiempo parcial
-            
+        mascara = REGLAS.mascara(datos.get('contexto_desarrollo', {}), REGLAS.claves_contexto_confianza)
+        for factor_contexto in REGLAS.factores_contexto_confianza[mascara]:
+            confianza_base *= factor_contexto
+        
         # === AJUSTES POR TIPO DE VALORACIÓN ===
-        tipo_valoracion = datos.get('tipo_valoracion', 'equilibrada')
-        if tipo_valoracion == 'conservadora':
-            confianza_base *= 1.05  # Mayor confianza en estimaciones conservadoras
-        elif tipo_valoracion == 'optimista':
-            confianza_base *= 0.9   # Menor confianza en estimaciones optimistas
+        confianza_base *= REGLAS.factores_tipo_confianza[
+            REGLAS.codigo(REGLAS.codigos_tipo_confianza, datos.get('tipo_valoracion', 'equilibrada'))
+        ]
 
         # Bonus por datos ISO 25010
         if datos.get('iso25010'):
@@ -721,332 +2376,2726 @@ class MotorValoracion:
         return min(1.0, confianza_base)
     
     def _calcular_factor_valoracion(self, datos):
-        """Aplica ajustes específicos según el tipo de valoración y contexto de desarrollo"""
-        factor = 1.0
+        """
+        Aplica ajustes específicos según el tipo de valoración y contexto de desarrollo
         
-        # === AJUSTE POR TIPO DE VALORACIÓN ===
-        tipo_valoracion = datos.get('tipo_valoracion', 'equilibrada')
-        if tipo_valoracion == 'conservadora':
-            factor *= 0.85  # -15% para valoración conservadora
-        elif tipo_valoracion == 'optimista':
-            factor *= 1.15  # +15% para valoración optimista
+        El factor completo (tipo, contexto, tecnología de bajo costo, datos
+        faltantes y mínimo del 40%) está precalculado en REGLAS.factor_valoracion.
+        """
+        perfil = REGLAS.perfil_tecnologia(datos.get('tecnologia_principal', ''))
+        return REGLAS.factor_valoracion[REGLAS.indice_valoracion(datos, perfil)]
+    
+    def _calcular_margen_incertidumbre(self, datos):
+        """Calcula el margen de incertidumbre basado en la calidad de la información"""
+        perfil = REGLAS.perfil_tecnologia(datos.get('tecnologia_principal', ''))
+        return REGLAS.margen[REGLAS.indice_margen(datos, perfil)]
+    
+    def simular_valor(self, datos, iteraciones=MONTE_CARLO_ITERACIONES, semilla=None):
+        """
+        Simulación Monte Carlo del valor (requiere NumPy)
         
-        # === AJUSTES POR CONTEXTO DE DESARROLLO ===
-        contexto = datos.get('contexto_desarrollo', {})
+        Sustituye el rango fijo valor ± margen por una distribución empírica.
+        Se muestrean las entradas inciertas y se mantienen fijas las respuestas
+        categóricas (complejidad, negocio, Colombia, ajuste de valoración):
         
-        if contexto.get('desarrollo_interno'):
-            factor *= 0.9   # -10% desarrollo interno suele ser más económico
-            
-        if contexto.get('tiempo_parcial'):
-            factor *= 0.85  # -15% desarrollo tiempo parcial es más barato
-            
-        if contexto.get('aprendizaje_tecnologia'):
-            factor *= 1.2   # +20% tiempo de aprendizaje influyó en el costo
-            
-        if contexto.get('sin_metodologia'):
-            factor *= 0.8   # -20% sin metodología reduce valor profesional
-            
-        if contexto.get('urgencia_tiempo'):
-            factor *= 1.1   # +10% desarrollo urgente cuesta más
-            
-        if contexto.get('prototipo_iterativo'):
-            factor *= 0.95  # -5% desarrollo iterativo puede ser menos eficiente inicialmente
-        
-        # === AJUSTE ESPECIAL POR TECNOLOGÍA DE BAJO COSTO ===
-        tecnologia = datos.get('tecnologia_principal', '')
-        if 'access' in tecnologia.lower():
-            factor *= 0.7   # -30% Access es tecnología de bajo costo
-        elif 'excel' in tecnologia.lower():
-            factor *= 0.6   # -40% Excel VBA es muy básico
-        elif 'vb_net' in tecnologia.lower():
-            factor *= 0.8   # -20% VB.NET es menos demandado
-        
-        # === AJUSTE POR AUSENCIA DE DATOS CRÍTICOS ===
-        if datos.get('conoce_tiempo_desarrollo') == 'no':
-            factor *= 0.9   # -10% por falta de datos temporales
-            
-        if datos.get('conoce_inversion') == 'no':
-            factor *= 0.9   # -10% por falta de datos de inversión
-            
-        return max(0.4, factor)  # Mínimo 40% del valor base
-    
-    def _calcular_margen_incertidumbre(self, datos):
-        """Calcula el margen de incertidumbre basado en la calidad de la información"""
-        margen_base = 0.20  # 20% base según literatura científica
+        - Horas del modelo: error lognormal de mediana 1 cuya desviación
+          logarítmica es el margen de incertidumbre heurístico (10%-45%)
+        - Costo por hora: triangular entre -15% y +20% de la tarifa de mercado
+        - Puntajes ISO 25010: normal (σ = 0.5) alrededor de cada respuesta,
+          limitada a la escala 1-5
+        - Tiempo de desarrollo (si se conoce): triangular entre -20% y +25%,
+          o ±10% cuando fue calculado a partir de fechas
         
-        # Incrementar margen si falta información crítica
-        if datos.get('conoce_tiempo_desarrollo') == 'no':
-            margen_base += 0.10  # +10% sin datos de tiempo
-            
-        if datos.get('conoce_inversion') == 'no':
-            margen_base += 0.08  # +8% sin datos de inversión
-            
-        if datos.get('nivel_certeza') == 'baja':
-            margen_base += 0.12  # +12% baja certeza general
-        elif datos.get('nivel_certeza') == 'alta':
-            margen_base -= 0.05  # -5% alta certeza
-            
-        # Para tecnologías básicas, reducir incertidumbre (son más predecibles)
-        tecnologia = datos.get('tecnologia_principal', '')
-        if any(tech in tecnologia.lower() for tech in ['access', 'excel', 'vba']):
-            margen_base *= 0.8  # -20% más predecible
-            
-        return min(0.45, max(0.10, margen_base))  # Entre 10% y 45%
+        Devuelve percentiles P10/P50/P90, media, desviación e histograma.
+        """
+        rng = np.random.default_rng(semilla)
+        n = iteraciones
+        
+        # Componentes deterministas (mismas reglas que calcular_valor)
+        traza = {}
+        self._estimar_horas(datos, traza)
+        horas_modelo = traza['calculo_horas']['horas_modelo']
+        factor_legacy = traza['calculo_horas']['factor_legacy']
+        costo_hora = self._calcular_costo_hora(datos['tecnologia_principal'])
+        factor_fijo = (self._calcular_factor_complejidad(datos) * self._calcular_factor_negocio(datos)
+                       * self._calcular_factor_colombia(datos) * self._calcular_factor_valoracion(datos))
+        margen_error = self._calcular_margen_incertidumbre(datos)
+        
+        # === HORAS Y TIEMPO DE DESARROLLO ===
+        horas = horas_modelo * rng.lognormal(0.0, margen_error, n)
+        tiempo_desarrollo = datos.get('tiempo_desarrollo_meses', 0)
+        if tiempo_desarrollo > 0:
+            if datos.get('tiempo_calculado_por_fechas'):
+                tiempo = rng.triangular(0.9 * tiempo_desarrollo, tiempo_desarrollo, 1.1 * tiempo_desarrollo, n)
+            else:
+                tiempo = rng.triangular(0.8 * tiempo_desarrollo, tiempo_desarrollo, 1.25 * tiempo_desarrollo, n)
+            horas = (horas * 0.7) + ((tiempo * 160) * 0.3)
+        horas *= factor_legacy
+        
+        # === COSTO POR HORA ===
+        costo = rng.triangular(0.85 * costo_hora, costo_hora, 1.20 * costo_hora, n)
+        
+        # === CALIDAD ISO 25010 ===
+        respuestas_iso = datos.get('iso25010', {})
+        if respuestas_iso:
+            claves_iso = list(PESOS_ISO25010.keys())
+            presentes = np.array([caracteristica in respuestas_iso for caracteristica in claves_iso])
+            puntajes = np.array([float(respuestas_iso.get(caracteristica, 0)) for caracteristica in claves_iso])
+            puntajes = np.clip(puntajes + rng.normal(0.0, 0.5, (n, len(claves_iso))), 1, 5)
+            factor_calidad = MotorValoracionLote._calcular_factor_calidad({
+                'iso_puntajes': puntajes,
+                'iso_presentes': np.broadcast_to(presentes, puntajes.shape)
+            })
+        else:
+            factor_calidad = 1.0
+        
+        valores = horas * costo * factor_calidad * factor_fijo
+        
+        # === RESUMEN ===
+        p10, p50, p90 = np.percentile(valores, [10, 50, 90])
+        frecuencias, limites = np.histogram(valores, bins=MONTE_CARLO_INTERVALOS)
+        return {
+            'iteraciones': n,
+            'semilla': semilla,
+            'p10': round(float(p10)),
+            'p50': round(float(p50)),
+            'p90': round(float(p90)),
+            'media': round(float(valores.mean())),
+            'desviacion': round(float(valores.std())),
+            'histograma': {
+                'limites': [round(float(limite)) for limite in limites],
+                'frecuencias': frecuencias.tolist()
+            }
+        }
     
-    def _guardar_valoracion(self, datos, resultado):
+    def _guardar_valoracion(self, datos, resultado, huella=None):
         """Guarda la valoración en la base de datos y devuelve el ID"""
         try:
-            conn = sqlite3.connect('valoraciones.db')
-            cursor = conn.cursor()
-            
             valoracion_id = str(uuid.uuid4())
             fecha_actual = datetime.now()
             
-            cursor.execute('''
-                INSERT INTO valoraciones 
-                (id, fecha_creacion, tipo_software, tecnologia_principal, 
-                 respuestas_json, valor_minimo, valor_maximo, factor_confianza, desglose_json)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                valoracion_id,
+            huella = huella or huella_datos(datos)
+            fila_valoracion, fila_texto = codificador.filas(valoracion_id, fecha_actual, datos, resultado, huella)
+            fila_estadisticas = (
                 fecha_actual,
                 datos.get('tipo_software'),
                 datos.get('tecnologia_principal'),
-                json.dumps(datos),
                 resultado['valor_minimo'],
-                resultado['valor_maximo'],
-                resultado['factor_confianza'],
-                json.dumps(resultado['desglose'])
-            ))
+                resultado['valor_maximo']
+            )
             
-            conn.commit()
-            conn.close()
+            # Modo diferido: el hilo escritor hará el INSERT en un lote posterior
+            if ESCRITURA_DIFERIDA and escritor_diferido.encolar(
+                    valoracion_id, huella, fila_valoracion, fila_texto, fila_estadisticas):
+                return valoracion_id
+            
+            with db.transaccion() as conn:
+                conn.execute(SQL_INSERTAR_VALORACION, fila_valoracion)
+                if fila_texto:
+                    conn.execute(SQL_INSERTAR_TEXTO, fila_texto)
+                self._acumular_estadisticas(conn, [fila_estadisticas])
             
             return valoracion_id  # Devolver el ID generado
             
         except Exception as e:
+            metricas.incrementar('errores_total', origen='guardar_valoracion')
             print(f"Error guardando valoración: {e}")
             return None
+    
+    def _guardar_valoraciones_lote(self, lista_datos, resultados, columnas=None, deduplicar=None):
+        """
+        Guarda un lote de valoraciones en una sola transacción y devuelve sus IDs
+        
+        `columnas` (una lista por nombre, como en MotorValoracionLote.calcular)
+        evita volver a recorrer los resultados. La huella solo se calcula si el
+        lote participa en la deduplicación (por defecto DEDUPLICAR_VALORACIONES).
+        """
+        try:
+            fecha_actual = datetime.now()
+            ids = [str(uuid.uuid4()) for _ in lista_datos]
+            
+            if columnas is None:
+                columnas = {
+                    nombre: [resultado.get(nombre) for resultado in resultados]
+                    for nombre in ('valor_minimo', 'valor_maximo', 'valor_promedio', 'factor_confianza')
+                }
+                columnas.update({
+                    factor: [resultado['desglose'].get(factor) for resultado in resultados]
+                    for factor in FACTORES_DESGLOSE
+                })
+            if deduplicar is None:
+                deduplicar = DEDUPLICAR_VALORACIONES
+            huellas = [huella_datos(datos) for datos in lista_datos] if deduplicar else None
+            
+            filas_valoracion, filas_texto = codificador.filas_lote(ids, fecha_actual, lista_datos, columnas, huellas)
+            
+            with db.transaccion() as conn:
+                conn.executemany(SQL_INSERTAR_VALORACION, filas_valoracion)
+                conn.executemany(SQL_INSERTAR_TEXTO, filas_texto)
+                self._acumular_estadisticas(conn, (
+                    (fecha_actual, datos.get('tipo_software'), datos.get('tecnologia_principal'), minimo, maximo)
+                    for datos, minimo, maximo in zip(lista_datos, columnas['valor_minimo'], columnas['valor_maximo'])
+                ))
+            
+            return ids
+            
+        except Exception as e:
+            metricas.incrementar('errores_total', origen='guardar_lote')
+            print(f"Error guardando lote de valoraciones: {e}")
+            return None
+
+# ================================
+# ESCRITURA DIFERIDA
+# ================================
+
+class ErrorEscrituraDiferida(RuntimeError):
+    """Una valoración ya devuelta al cliente no se pudo guardar"""
+
+
+class EscritorDiferido:
+    """
+    Persistencia write-behind de valoraciones individuales
+    
+    _guardar_valoracion encola la fila ya codificada y devuelve el id de
+    inmediato; un hilo la inserta junto con las demás pendientes en una sola
+    transacción (hasta ESCRITURA_LOTE_MAXIMO filas), así el fsync del commit
+    no queda en la latencia de la solicitud.
+    
+    - La cola es acotada: si se llena, quien encola espera hasta
+      ESCRITURA_ESPERA_MAXIMA segundos y, si sigue llena, escribe en línea.
+    - Los ids pendientes se pueden esperar (esperar) antes de leerlos, como
+      hace la generación de PDF.
+    - Si el lote falla se reintenta; si sigue fallando se escribe fila por
+      fila, así solo se pierden las filas con error. Sus ids salen de
+      cache_valoraciones y quedan registrados: esperar() levanta
+      ErrorEscrituraDiferida para ellos.
+    - cerrar() vacía la cola y se registra con atexit.
+    """
+    
+    def __init__(self, capacidad, tamano_lote, intervalo):
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola = queue.Queue(capacidad)
+        self._pendientes = {}   # id -> huella
+        self._huellas = {}      # huella -> id
+        self._fallidas = OrderedDict()  # id -> error (las más recientes)
+        self._condicion = threading.Condition()
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def _asegurar_hilo(self):
+        with self._lock:
+            # Tras un fork el hilo del proceso padre no existe en el hijo
+            if self._hilo is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._hilo = threading.Thread(target=self._trabajar, name='escritor-valoraciones', daemon=True)
+                self._hilo.start()
+    
+    def encolar(self, valoracion_id, huella, fila_valoracion, fila_texto, fila_estadisticas):
+        """Encola una valoración; devuelve False si la cola siguió llena (escribir en línea)"""
+        self._asegurar_hilo()
+        with self._condicion:
+            self._pendientes[valoracion_id] = huella
+            self._huellas[huella] = valoracion_id
+        try:
+            self._cola.put((valoracion_id, fila_valoracion, fila_texto, fila_estadisticas),
+                           timeout=ESCRITURA_ESPERA_MAXIMA)
+            return True
+        except queue.Full:
+            self._liberar([valoracion_id])
+            return False
+    
+    def _liberar(self, ids):
+        with self._condicion:
+            for valoracion_id in ids:
+                huella = self._pendientes.pop(valoracion_id, None)
+                if self._huellas.get(huella) == valoracion_id:
+                    del self._huellas[huella]
+            self._condicion.notify_all()
+    
+    def _trabajar(self):
+        while True:
+            elemento = self._cola.get()
+            if elemento is None:
+                return
+            
+            # Completar el lote con lo que llegue durante el intervalo
+            lote = [elemento]
+            detener = False
+            limite = time.monotonic() + self.intervalo
+            while len(lote) < self.tamano_lote:
+                restante = limite - time.monotonic()
+                try:
+                    elemento = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if elemento is None:
+                    detener = True
+                    break
+                lote.append(elemento)
+            
+            self._escribir(lote)
+            if detener:
+                return
+    
+    @staticmethod
+    def _insertar(lote):
+        with db.transaccion() as conn:
+            conn.executemany(SQL_INSERTAR_VALORACION, [fila_valoracion for _, fila_valoracion, _, _ in lote])
+            conn.executemany(SQL_INSERTAR_TEXTO, [fila_texto for _, _, fila_texto, _ in lote if fila_texto])
+            motor._acumular_estadisticas(conn, [fila_estadisticas for _, _, _, fila_estadisticas in lote])
+    
+    def _escribir(self, lote):
+        fallidas = {}
+        try:
+            for intento in range(ESCRITURA_REINTENTOS):
+                try:
+                    self._insertar(lote)
+                    return
+                except sqlite3.Error:
+                    metricas.incrementar('errores_total', origen='escritura_diferida')
+                    if intento + 1 < ESCRITURA_REINTENTOS:
+                        time.sleep(0.1 * 2 ** intento)
+            
+            # El lote sigue fallando: aislar las filas con error
+            for elemento in lote:
+                try:
+                    self._insertar([elemento])
+                except Exception as e:
+                    fallidas[elemento[0]] = e
+        except Exception as e:  # Error que no es de SQLite: se pierde el lote completo
+            fallidas = {elemento[0]: e for elemento in lote}
+        finally:
+            if fallidas:
+                metricas.incrementar('errores_total', valor=len(fallidas), origen='escritura_diferida_perdida')
+                cache_valoraciones.descartar(fallidas)
+                with self._condicion:
+                    for valoracion_id, error in fallidas.items():
+                        self._fallidas[valoracion_id] = error
+                    while len(self._fallidas) > ESCRITURA_COLA_MAXIMA:
+                        self._fallidas.popitem(last=False)
+            self._liberar([valoracion_id for valoracion_id, _, _, _ in lote])
+    
+    def esperar(self, valoracion_id, timeout=ESCRITURA_ESPERA_MAXIMA):
+        """
+        Bloquea hasta que la valoración deje de estar pendiente (o se agote el tiempo)
+        
+        Levanta ErrorEscrituraDiferida si la valoración no se pudo guardar.
+        """
+        with self._condicion:
+            escrita = self._condicion.wait_for(lambda: valoracion_id not in self._pendientes, timeout)
+            error = self._fallidas.get(valoracion_id)
+        if error is not None:
+            raise ErrorEscrituraDiferida(f'La valoración {valoracion_id} no se pudo guardar: {error}') from error
+        return escrita
+    
+    def buscar_huella(self, huella):
+        """Id de una valoración pendiente con esa huella, o None"""
+        with self._condicion:
+            return self._huellas.get(huella)
+    
+    def cerrar(self):
+        """Escribe todo lo pendiente y detiene el hilo"""
+        with self._lock:
+            hilo = self._hilo if self._pid == os.getpid() else None
+            self._hilo = None
+        if hilo is not None and hilo.is_alive():
+            self._cola.put(None)
+            hilo.join()
+
+escritor_diferido = EscritorDiferido(ESCRITURA_COLA_MAXIMA, ESCRITURA_LOTE_MAXIMO, ESCRITURA_INTERVALO)
+atexit.register(escritor_diferido.cerrar)
+
+# ================================
+# MOTOR DE VALORACIÓN POR LOTES
+# ================================
+
+class MotorValoracionLote:
+    """
+    Valoración vectorizada de portafolios completos
+    
+    Aplica exactamente las mismas reglas de MotorValoracion, pero cada factor se
+    evalúa como operación sobre columnas NumPy (una fila por software). El
+    orden de las multiplicaciones se conserva para que cada resultado coincida
+    con el de calcular_valor; las categorías y banderas se codifican una vez por
+    fila y se resuelven con las mismas tablas de REGLAS. Las filas se guardan
+    en una sola transacción.
+    """
+    
+    def __init__(self, motor):
+        self.motor = motor
+    
+    def _extraer_columnas(self, lista_datos):
+        """Convierte la lista de diccionarios en columnas NumPy de valores y códigos"""
+        n = len(lista_datos)
+        claves_iso = list(PESOS_ISO25010.keys())
+        
+        filas = []
+        iso_puntajes = np.zeros((n, len(claves_iso)))
+        iso_presentes = np.zeros((n, len(claves_iso)), dtype=bool)
+        iso_digitos = np.zeros((n, len(claves_iso)), dtype=np.int8)  # -1 = puntaje no entero 1-5
+        
+        for i, datos in enumerate(lista_datos):
+            perfil = REGLAS.perfil_tecnologia(datos.get('tecnologia_principal', ''))
+            funcionalidades = datos.get('funcionalidades', {})
+            contexto = datos.get('contexto_desarrollo', {})
+            iso = datos.get('iso25010', {})
+            
+            if iso:
+                for j, caracteristica in enumerate(claves_iso):
+                    if caracteristica in iso:
+                        puntaje = iso[caracteristica]
+                        iso_puntajes[i, j] = puntaje
+                        iso_presentes[i, j] = True
+                        iso_digitos[i, j] = puntaje if type(puntaje) is int and 1 <= puntaje <= 5 else -1
+            
+            filas.append((
+                # Horas y costo
+                HORAS_BASE_TIPO.get(datos.get('tipo_software', 'otro'), 100),
+                REGLAS.mascara(funcionalidades, REGLAS.claves_funcionalidades),
+                perfil[0],
+                perfil[1],
+                datos.get('usuarios_concurrentes', 1),
+                REGLAS.codigo(REGLAS.codigos_volumen, datos.get('volumen_datos', 'pequeno')),
+                REGLAS.codigo(REGLAS.codigos_arquitectura, datos.get('arquitectura', 'monolitica')),
+                datos.get('tiempo_desarrollo_meses', 0),
+                datos.get('antiguedad_anos', 0),
+                datos.get('en_uso_activo', 'false') == 'true',
+                # Complejidad
+                REGLAS.codigo(REGLAS.codigos_base_datos, datos.get('base_datos_tipo', 'local')),
+                datos.get('integraciones_externas', 0),
+                REGLAS.mascara(funcionalidades, REGLAS.claves_complejidad),
+                # Negocio
+                REGLAS.codigo(REGLAS.codigos_criticidad, datos.get('criticidad_negocio', 3)),
+                datos.get('ahorro_anual_cop', 0),
+                datos.get('usuarios_totales', 1),
+                datos.get('inversion_original_cop', 0),
+                REGLAS.codigo(REGLAS.codigos_sector_negocio, datos.get('sector', 'privado')),
+                # Colombia, valoración e incertidumbre
+                REGLAS.mascara_colombia(datos),
+                REGLAS.indice_valoracion(datos, perfil),
+                REGLAS.indice_margen(datos, perfil),
+                # Confianza
+                sum(1 for campo in CAMPOS_CRITICOS_CONFIANZA if datos.get(campo) is not None),
+                REGLAS.codigo(REGLAS.codigos_certeza, datos.get('nivel_certeza', 'media')),
+                # 0 = sin ajuste, 1 = desconocido, 2 = estimado (por cada fila de AJUSTES_INFORMACION_CONFIANZA)
+                tuple(1 if datos.get(campo) == 'no' else 2 if datos.get(bandera) else 0
+                      for campo, bandera, _, _ in AJUSTES_INFORMACION_CONFIANZA),
+                REGLAS.mascara(contexto, REGLAS.claves_contexto_confianza),
+                REGLAS.codigo(REGLAS.codigos_tipo_confianza, datos.get('tipo_valoracion', 'equilibrada')),
+                len(iso) if iso else 0
+            ))
+        
+        nombres = [
+            'horas_base', 'mascara_funcionalidades', 'factor_tecnologia', 'costo_hora',
+            'usuarios_concurrentes', 'codigo_volumen', 'codigo_arquitectura', 'tiempo_desarrollo',
+            'antiguedad', 'en_uso', 'codigo_bd', 'integraciones', 'mascara_complejidad',
+            'codigo_criticidad', 'ahorro_anual', 'usuarios_totales', 'inversion_original',
+            'codigo_sector', 'mascara_colombia', 'indice_valoracion', 'indice_margen',
+            'campos_completos', 'codigo_certeza', 'informacion', 'mascara_contexto_confianza',
+            'codigo_tipo_confianza', 'num_iso'
+        ]
+        columnas = dict(zip(nombres, (np.array(col) for col in zip(*filas)))) if filas else {}
+        for nombre in ['horas_base', 'factor_tecnologia', 'costo_hora', 'usuarios_concurrentes',
+                       'tiempo_desarrollo', 'antiguedad', 'integraciones', 'ahorro_anual',
+                       'usuarios_totales', 'inversion_original', 'campos_completos', 'num_iso']:
+            if nombre in columnas:
+                columnas[nombre] = columnas[nombre].astype(float)
+        columnas['iso_puntajes'] = iso_puntajes
+        columnas['iso_presentes'] = iso_presentes
+        columnas['iso_digitos'] = iso_digitos
+        return columnas
+    
+    def _estimar_horas(self, c):
+        """Versión vectorizada de MotorValoracion._estimar_horas"""
+        t = REGLAS.arreglos
+        horas = c['horas_base'] + t['horas_funcionalidades'][c['mascara_funcionalidades']]
+        horas = horas * c['factor_tecnologia']
+        horas = horas * REGLAS.factores_umbral('usuarios_horas', c['usuarios_concurrentes'])
+        horas = horas * t['factores_volumen'][c['codigo_volumen']]
+        horas = horas * t['factores_arquitectura'][c['codigo_arquitectura']]
+        
+        tiempo = c['tiempo_desarrollo']
+        horas = np.where(tiempo > 0, (horas * 0.7) + ((tiempo * 160) * 0.3), horas)
+        
+        horas = horas * np.where(c['en_uso'] & (c['antiguedad'] > 8), 1.15, 1.0)
+        return np.round(horas)
+    
+    @staticmethod
+    def _calcular_factor_calidad(c):
+        """
+        Versión vectorizada de MotorValoracion._calcular_factor_calidad
+        
+        Si todos los puntajes son enteros 1-5 (iso_digitos >= 0), el aporte y
+        el peso de cada característica salen de las tablas de REGLAS por
+        indexación; si no, o con los puntajes continuos de Monte Carlo, se
+        evalúa la fórmula. Ambos caminos suman en el mismo orden.
+        """
+        puntajes = c['iso_puntajes']
+        presentes = c['iso_presentes']
+        puntuacion_total = np.zeros(len(puntajes))
+        peso_total = np.zeros(len(puntajes))
+        
+        digitos = c.get('iso_digitos')
+        if digitos is not None and (digitos >= 0).all():
+            t = REGLAS.arreglos
+            for j in range(len(PESOS_ISO25010)):
+                puntuacion_total = puntuacion_total + t['aportes_calidad'][j][digitos[:, j]]
+                peso_total = peso_total + t['pesos_calidad'][j][digitos[:, j]]
+        else:
+            for j, (caracteristica, peso) in enumerate(PESOS_ISO25010.items()):
+                valor = puntajes[:, j]
+                factor_caracteristica = 0.3 + (valor - 1) * 0.25
+                if caracteristica == 'security':
+                    factor_caracteristica = factor_caracteristica * np.where(valor <= 2, 0.8, 1.0)
+                puntuacion_total = puntuacion_total + np.where(presentes[:, j], factor_caracteristica * peso, 0.0)
+                peso_total = peso_total + np.where(presentes[:, j], peso, 0.0)
+        
+        con_datos = peso_total > 0
+        factor = np.divide(puntuacion_total, peso_total, out=np.ones(len(puntajes)), where=con_datos)
+        return np.where(con_datos, np.clip(factor, 0.3, 1.5), 1.0)
+    
+    def _calcular_factor_complejidad(self, c):
+        """Versión vectorizada de MotorValoracion._calcular_factor_complejidad"""
+        t = REGLAS.arreglos
+        factor = t['factores_arquitectura'][c['codigo_arquitectura']] * t['factores_volumen'][c['codigo_volumen']]
+        factor = factor * t['factores_base_datos'][c['codigo_bd']]
+        factor = factor * REGLAS.factores_umbral('concurrencia', c['usuarios_concurrentes'])
+        factor = factor * REGLAS.factores_umbral('integraciones', c['integraciones'])
+        
+        mascara = c['mascara_complejidad']
+        for bit, (_, factor_funcionalidad) in enumerate(FACTORES_FUNCIONALIDADES_COMPLEJIDAD):
+            factor = factor * np.where(mascara >> bit & 1, factor_funcionalidad, 1.0)
+        return np.minimum(factor, 2.8)
+    
+    def _calcular_factor_negocio(self, c):
+        """Versión vectorizada de MotorValoracion._calcular_factor_negocio"""
+        t = REGLAS.arreglos
+        factor = t['factores_criticidad'][c['codigo_criticidad']]
+        
+        ahorro = c['ahorro_anual']
+        factor = factor * REGLAS.factores_umbral('ahorro_anual', ahorro)
+        factor = factor * REGLAS.factores_umbral('usuarios_totales', c['usuarios_totales'])
+        
+        inversion = c['inversion_original']
+        con_roi = (ahorro > 0) & (inversion > 0)
+        roi = np.divide(ahorro, inversion, out=np.zeros(len(ahorro)), where=con_roi)
+        factor = factor * np.where(con_roi, REGLAS.factores_umbral('roi', roi), 1.0)
+        
+        factor = factor * t['factores_sector_negocio'][c['codigo_sector']]
+        
+        tiempo = c['tiempo_desarrollo']
+        factor = factor * np.select(
+            [(tiempo > 0) & (tiempo < 3) & (factor > 1.2), tiempo > 24],
+            [1.05, 0.95], 1.0)
+        return np.minimum(factor, 3.5)
+    
+    def _calcular_factor_colombia(self, c):
+        """Versión vectorizada de MotorValoracion._calcular_factor_colombia"""
+        return REGLAS.arreglos['factor_colombia'][c['mascara_colombia']]
+    
+    def _calcular_confianza(self, c):
+        """Versión vectorizada de MotorValoracion._calcular_confianza"""
+        t = REGLAS.arreglos
+        confianza = c['campos_completos'] / len(CAMPOS_CRITICOS_CONFIANZA)
+        confianza = confianza * t['factores_certeza'][c['codigo_certeza']]
+        
+        informacion = c['informacion']
+        for j, (_, _, factor_desconocido, factor_estimado) in enumerate(AJUSTES_INFORMACION_CONFIANZA):
+            confianza = confianza * np.select(
+                [informacion[:, j] == 1, informacion[:, j] == 2],
+                [factor_desconocido, factor_estimado], 1.0)
+        
+        mascara = c['mascara_contexto_confianza']
+        for bit, (_, factor_contexto) in enumerate(AJUSTES_CONTEXTO_CONFIANZA):
+            confianza = confianza * np.where(mascara >> bit & 1, factor_contexto, 1.0)
+        
+        confianza = confianza * t['factores_tipo_confianza'][c['codigo_tipo_confianza']]
+        
+        bonus_iso = np.minimum(0.2, c['num_iso'] / len(PESOS_ISO25010) * 0.2)
+        confianza = np.where(c['num_iso'] > 0, confianza + bonus_iso, confianza)
+        return np.minimum(1.0, confianza)
+    
+    def _calcular_factor_valoracion(self, c):
+        """Versión vectorizada de MotorValoracion._calcular_factor_valoracion"""
+        return REGLAS.arreglos['factor_valoracion'][c['indice_valoracion']]
+    
+    def _calcular_margen_incertidumbre(self, c):
+        """Versión vectorizada de MotorValoracion._calcular_margen_incertidumbre"""
+        return REGLAS.arreglos['margen'][c['indice_margen']]
+    
+    def calcular(self, lista_datos):
+        """
+        Evalúa el pipeline completo sobre un lote y devuelve las columnas resultantes
+        
+        No guarda nada en la base de datos; útil para análisis sobre muchas
+        variantes de un mismo software.
+        """
+        c = self._extraer_columnas(lista_datos)
+        
+        horas_estimadas = self._estimar_horas(c)
+        costo_hora = c['costo_hora']
+        factor_calidad = self._calcular_factor_calidad(c)
+        factor_complejidad = self._calcular_factor_complejidad(c)
+        factor_negocio = self._calcular_factor_negocio(c)
+        factor_colombia = self._calcular_factor_colombia(c)
+        factor_ajuste_valoracion = self._calcular_factor_valoracion(c)
+        
+        valor_base = horas_estimadas * costo_hora
+        valor_ajustado = valor_base * factor_calidad * factor_complejidad * factor_negocio * factor_colombia * factor_ajuste_valoracion
+        
+        margen_error = self._calcular_margen_incertidumbre(c)
+        
+        return {
+            'valor_minimo': np.round(valor_ajustado * (1 - margen_error)),
+            'valor_maximo': np.round(valor_ajustado * (1 + margen_error)),
+            'valor_promedio': np.round(valor_ajustado),
+            'factor_confianza': self._calcular_confianza(c),
+            'horas_estimadas': horas_estimadas,
+            'costo_hora': costo_hora,
+            'valor_base': valor_base,
+            'factor_calidad': factor_calidad,
+            'factor_complejidad': factor_complejidad,
+            'factor_negocio': factor_negocio,
+            'factor_colombia': factor_colombia,
+            'factor_ajuste_valoracion': factor_ajuste_valoracion,
+            'margen_incertidumbre': margen_error
+        }
+    
+    COLUMNAS_ENTERAS = ('valor_minimo', 'valor_maximo', 'valor_promedio', 'horas_estimadas')
+    
+    def valorar_lote(self, lista_datos, guardar=True, deduplicar=None):
+        """
+        Valora un lote de softwares y devuelve un resultado por elemento
+        
+        Cada resultado tiene la misma forma que el de calcular_valor. Si se
+        solicita, todas las filas se guardan en una única transacción,
+        codificadas directamente desde las columnas calculadas.
+        """
+        if not lista_datos:
+            return []
+        
+        columnas = self.calcular(lista_datos)
+        columnas = {
+            nombre: (valores.astype(np.int64) if nombre in self.COLUMNAS_ENTERAS else valores).tolist()
+            for nombre, valores in columnas.items()
+        }
+        
+        resultados = []
+        for i in range(len(lista_datos)):
+            resultados.append({
+                'valor_minimo': columnas['valor_minimo'][i],
+                'valor_maximo': columnas['valor_maximo'][i],
+                'valor_promedio': columnas['valor_promedio'][i],
+                'factor_confianza': columnas['factor_confianza'][i],
+                'desglose': {
+                    'horas_estimadas': columnas['horas_estimadas'][i],
+                    'costo_hora': columnas['costo_hora'][i],
+                    'valor_base': columnas['valor_base'][i],
+                    'factor_calidad': columnas['factor_calidad'][i],
+                    'factor_complejidad': columnas['factor_complejidad'][i],
+                    'factor_negocio': columnas['factor_negocio'][i],
+                    'factor_colombia': columnas['factor_colombia'][i],
+                    'factor_ajuste_valoracion': columnas['factor_ajuste_valoracion'][i],
+                    'margen_incertidumbre': columnas['margen_incertidumbre'][i]
+                },
+                'metodologia': 'ISO 25010:2023 + COCOMO Adaptado + Mercado Colombia 2025'
+            })
+        
+        if guardar:
+            ids = self.motor._guardar_valoraciones_lote(lista_datos, resultados, columnas, deduplicar)
+            if ids:
+                for resultado, valoracion_id in zip(resultados, ids):
+                    resultado['id'] = valoracion_id
+        
+        return resultados
+    
+    def _generar_variantes(self, datos):
+        """Lista de (campo, valor, datos variados) para el análisis de sensibilidad"""
+        variantes = []
+        for campo, (modo, opciones) in VARIACIONES_SENSIBILIDAD.items():
+            actual = datos.get(campo)
+            if modo == 'escala':
+                opciones = [actual * multiplicador for multiplicador in opciones] if actual else []
+            vistos = {actual}
+            for valor in opciones:
+                if isinstance(actual, int) and not isinstance(actual, bool):
+                    valor = int(valor)
+                if valor in vistos:
+                    continue
+                vistos.add(valor)
+                variante = copy.deepcopy(datos)
+                variante[campo] = valor
+                variantes.append((campo, valor, variante))
+        
+        respuestas_iso = datos.get('iso25010') or {}
+        for caracteristica, puntaje in respuestas_iso.items():
+            # Solo se mueven los puntajes de la escala (enteros 1-5), como en _extraer_columnas
+            if type(puntaje) is not int or not 1 <= puntaje <= 5:
+                continue
+            for valor in (puntaje - 1, puntaje + 1):
+                if 1 <= valor <= 5:
+                    variante = copy.deepcopy(datos)
+                    variante['iso25010'][caracteristica] = valor
+                    variantes.append((f'iso25010.{caracteristica}', valor, variante))
+        
+        return variantes
+    
+    def analizar_sensibilidad(self, datos):
+        """
+        Sensibilidad uno a la vez y resumen tipo tornado de una valoración
+        
+        La base y todas sus variantes se evalúan en una sola pasada de
+        calcular(); no se guarda nada en la base de datos.
+        """
+        variantes = self._generar_variantes(datos)
+        lista_datos = [datos] + [variante for _, _, variante in variantes]
+        for variante in lista_datos[1:]:
+            validar_datos_software(variante)
+        
+        columnas = self.calcular(lista_datos)
+        columnas = {nombre: valores.tolist() for nombre, valores in columnas.items()}
+        valores = columnas['valor_promedio']
+        valor_base = valores[0]
+        
+        base = {
+            'valor_promedio': int(valor_base),
+            'desglose': {factor: columnas[factor][0] for factor in FACTORES_DESGLOSE}
+        }
+        
+        variaciones = []
+        extremos = {}
+        for i, (campo, valor, _) in enumerate(variantes, start=1):
+            delta = valores[i] - valor_base
+            variaciones.append({
+                'campo': campo,
+                'valor': valor,
+                'valor_promedio': int(valores[i]),
+                'delta': int(delta),
+                'delta_porcentaje': round(delta / valor_base * 100, 2) if valor_base else None,
+                'desglose': {factor: columnas[factor][i] for factor in FACTORES_DESGLOSE}
+            })
+            
+            bajo, alto = extremos.get(campo, (i, i))
+            if valores[i] < valores[bajo]:
+                bajo = i
+            if valores[i] > valores[alto]:
+                alto = i
+            extremos[campo] = (bajo, alto)
+        
+        tornado = []
+        for campo, (bajo, alto) in extremos.items():
+            actual = datos['iso25010'][campo.split('.', 1)[1]] if campo.startswith('iso25010.') else datos.get(campo)
+            minimo = min(valores[bajo], valor_base)
+            maximo = max(valores[alto], valor_base)
+            tornado.append({
+                'campo': campo,
+                'actual': actual,
+                # Si ninguna variante baja (o sube) el valor, el extremo es el valor actual
+                'valor_bajo': variantes[bajo - 1][1] if valores[bajo] < valor_base else actual,
+                'valor_alto': variantes[alto - 1][1] if valores[alto] > valor_base else actual,
+                'minimo': int(minimo),
+                'maximo': int(maximo),
+                'rango': int(maximo - minimo)
+            })
+        tornado.sort(key=lambda fila: fila['rango'], reverse=True)
+        
+        return {
+            'base': base,
+            'variaciones': variaciones,
+            'tornado': tornado,
+            'evaluaciones': len(lista_datos)
+        }
+    
+    def evaluar_escenarios(self, datos, ejes, metricas_pedidas):
+        """
+        Valora el producto cartesiano de los ejes sobre unos datos base
+        
+        `ejes` es una lista de (campo, valores); un campo con punto
+        (iso25010.security, funcionalidades.api_rest) varía una clave del
+        diccionario anidado. Todas las combinaciones se evalúan en una sola
+        pasada de calcular() y cada métrica se devuelve como matriz con un
+        eje por campo, en el mismo orden; no se guarda nada.
+        """
+        lista_datos = []
+        for combinacion in itertools.product(*[valores for _, valores in ejes]):
+            variante = dict(datos)
+            for (campo, _), valor in zip(ejes, combinacion):
+                if '.' in campo:
+                    grupo, clave = campo.split('.', 1)
+                    variante[grupo] = dict(variante.get(grupo) or {})
+                    variante[grupo][clave] = valor
+                else:
+                    variante[campo] = valor
+            error = validar_datos_software(variante)
+            if error:
+                raise ValueError(f'{error} (escenario {dict(zip([campo for campo, _ in ejes], combinacion))})')
+            lista_datos.append(variante)
+        
+        columnas = self.calcular(lista_datos)
+        forma = [len(valores) for _, valores in ejes]
+        matrices = {}
+        for metrica in metricas_pedidas:
+            valores = columnas[metrica]
+            valores = valores.astype(np.int64) if metrica in ESCENARIOS_METRICAS_DEFECTO else np.round(valores, 6)
+            matrices[metrica] = valores.reshape(forma).tolist()
+        
+        promedio = columnas['valor_promedio']
+        extremos = {}
+        for nombre, posicion in (('minimo', int(np.argmin(promedio))), ('maximo', int(np.argmax(promedio)))):
+            indices = np.unravel_index(posicion, forma)
+            extremos[nombre] = {
+                'valor_promedio': int(promedio[posicion]),
+                'escenario': {campo: valores[indice] for (campo, valores), indice in zip(ejes, indices)}
+            }
+        
+        return {
+            'ejes': [{'campo': campo, 'valores': valores} for campo, valores in ejes],
+            'forma': forma,
+            'metricas': matrices,
+            'extremos': extremos,
+            'evaluaciones': len(lista_datos)
+        }
 
 # ================================
 # RUTAS DE LA API
 # ================================
 
 motor = MotorValoracion()
+motor_lote = MotorValoracionLote(motor)
+
+def migrar_base_datos(forzar=True):
+    """
+    Crea o actualiza el esquema de la base de datos y devuelve
+    (versión anterior, versión actual)
+    
+    Es el paso de despliegue `python app.py migrar`; importar el módulo ya no
+    ejecuta DDL. Con forzar=False solo recrea el esquema si PRAGMA
+    user_version es menor que ESQUEMA_VERSION; si está al día, igual copia al
+    catálogo los códigos de vocabulario nuevos.
+    """
+    anterior = db.consultar_uno('PRAGMA user_version')[0]
+    if forzar or anterior < ESQUEMA_VERSION:
+        motor.init_database()
+    else:
+        motor.sincronizar_catalogo()
+    return anterior, ESQUEMA_VERSION
+
+_esquema_verificado = threading.Event()
+_esquema_lock = threading.Lock()
+
+def asegurar_esquema():
+    """Migra la base, si está atrasada, la primera vez que se necesita en este proceso"""
+    if _esquema_verificado.is_set():
+        return
+    with _esquema_lock:
+        if not _esquema_verificado.is_set():
+            migrar_base_datos(forzar=False)
+            _esquema_verificado.set()
+
+if MIGRACION_AUTOMATICA:
+    @app.before_request
+    def _asegurar_esquema():
+        asegurar_esquema()
+
+if metricas.activas:
+    @app.before_request
+    def _iniciar_medicion():
+        request.environ['valoracion.inicio'] = time.perf_counter()
+    
+    @app.after_request
+    def _registrar_medicion(respuesta):
+        inicio = request.environ.get('valoracion.inicio')
+        if inicio is not None:
+            ruta = request.url_rule.rule if request.url_rule else 'sin_ruta'
+            metricas.observar('http_solicitud_segundos', time.perf_counter() - inicio,
+                              ruta=ruta, metodo=request.method)
+            metricas.incrementar('http_solicitudes_total', ruta=ruta, metodo=request.method,
+                                 codigo=respuesta.status_code)
+        return respuesta
+
+if PERFILADO_ACTIVO:
+    @app.before_request
+    def _iniciar_perfilado():
+        modo = perfilador.modo_solicitado(request.headers.get('X-Perfilar'))
+        if modo:
+            request.environ['valoracion.perfil'] = perfilador.iniciar(modo)
+    
+    @app.after_request
+    def _finalizar_perfilado(respuesta):
+        captura = request.environ.pop('valoracion.perfil', None)
+        if captura is None:
+            return respuesta
+        ruta = request.url_rule.rule if request.url_rule else request.path
+        metodo = request.method
+        if respuesta.is_streamed:
+            # El cuerpo (exportaciones, ZIP) se genera después de este punto:
+            # medir hasta que el servidor cierre la respuesta. Las cabeceras ya
+            # salieron, así que el perfil no se anuncia con X-Perfil-Id.
+            respuesta.call_on_close(
+                lambda: perfilador.finalizar(captura, ruta, metodo, respuesta.status_code))
+        else:
+            perfil_id = perfilador.finalizar(captura, ruta, metodo, respuesta.status_code)
+            if perfil_id:
+                respuesta.headers['X-Perfil-Id'] = perfil_id
+        return respuesta
+    
+    @app.teardown_request
+    def _descartar_perfilado(error):
+        # Si after_request no llegó a ejecutarse, detener el hilo de muestreo
+        captura = request.environ.pop('valoracion.perfil', None)
+        if captura is not None:
+            captura['perfil'].detener()
+
+def _verificar_admin():
+    """Respuesta de error si la solicitud no trae el token de administración, o None"""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Defina VALORACION_ADMIN_TOKEN para usar las rutas de administración'}), 403
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Token de administración inválido'}), 403
+    return None
+
+@app.route('/api/admin/perfiles', methods=['GET'])
+def listar_perfiles():
+    """Perfiles guardados de solicitudes lentas (VALORACION_PERFILADO=1)"""
+    if not PERFILADO_ACTIVO:
+        return jsonify({'error': 'Perfilado desactivado'}), 404
+    error = _verificar_admin()
+    if error:
+        return error
+    perfiles = perfilador.listar()
+    return jsonify({
+        'umbral_ms': perfilador.umbral_ms,
+        'muestreo': perfilador.muestreo,
+        'total': len(perfiles),
+        'perfiles': perfiles
+    })
+
+@app.route('/api/admin/perfiles/<perfil_id>/<archivo>', methods=['GET'])
+def descargar_perfil(perfil_id, archivo):
+    """Descarga un archivo de perfil (.prof para pstats/snakeviz, .txt en pilas colapsadas)"""
+    if not PERFILADO_ACTIVO:
+        return jsonify({'error': 'Perfilado desactivado'}), 404
+    error = _verificar_admin()
+    if error:
+        return error
+    ruta = perfilador.ruta_archivo(perfil_id, archivo)
+    if ruta is None or not os.path.exists(ruta):
+        return jsonify({'error': 'Perfil no encontrado'}), 404
+    return send_file(ruta, as_attachment=True, download_name=archivo,
+                     mimetype='text/plain' if archivo.endswith('.txt') else 'application/octet-stream')
+
+@app.route('/metrics')
+def exponer_metricas():
+    """Métricas en formato de texto de Prometheus (VALORACION_METRICAS=0 las desactiva)"""
+    if not metricas.activas:
+        return jsonify({'error': 'Métricas desactivadas'}), 404
+    return Response(metricas.exponer(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/')
 def index():
     """Página principal del sistema con formulario profesional"""
     return render_template('valoracion_detallada.html')
 
-@app.route('/api/tecnologias', methods=['GET'])
-def obtener_tecnologias():
-    """Devuelve la lista de tecnologías disponibles"""
-    return jsonify({
-        'tecnologias': list(FACTORES_TECNOLOGIA.keys()),
-        'detalles': FACTORES_TECNOLOGIA
-    })
+@app.route('/api/tecnologias', methods=['GET'])
+def obtener_tecnologias():
+    """Devuelve la lista de tecnologías disponibles"""
+    return jsonify({
+        'tecnologias': list(FACTORES_TECNOLOGIA.keys()),
+        'detalles': FACTORES_TECNOLOGIA
+    })
+
+def procesar_valoracion(datos, args):
+    """
+    Valida, calcula y (según args) simula una valoración
+    
+    Compartida por la ruta Flask y el punto de entrada ASGI: args es
+    cualquier mapeo con .get (request.args o los parámetros de la URL).
+    Devuelve (cuerpo de la respuesta, código HTTP).
+    """
+    if not datos:
+        return {'error': 'No se recibieron datos'}, 400
+    
+    # Validaciones básicas y limpieza de datos numéricos
+    inicio = time.perf_counter()
+    error_validacion = validar_datos_software(datos)
+    metricas.observar('valoracion_etapa_segundos', time.perf_counter() - inicio, etapa='validar')
+    if error_validacion:
+        return {'error': error_validacion}, 400
+    
+    # Simulación Monte Carlo: por configuración o con ?simulacion=1|0
+    simular = args.get('simulacion', '1' if MONTE_CARLO_ACTIVO else '0') == '1'
+    if simular:
+        if not NUMPY_AVAILABLE:
+            return {'error': 'NumPy no está instalado. Ejecute: pip install numpy'}, 500
+        # Validar antes de calcular: un error aquí no debe dejar la valoración guardada
+        iteraciones = args.get('iteraciones')
+        semilla = args.get('semilla')
+        try:
+            iteraciones = int(iteraciones) if iteraciones not in (None, '') else MONTE_CARLO_ITERACIONES
+        except (TypeError, ValueError):
+            return {'error': 'iteraciones debe ser un entero'}, 400
+        iteraciones = max(1000, min(iteraciones, MONTE_CARLO_ITERACIONES_MAXIMAS))
+        try:
+            semilla = int(semilla) if semilla not in (None, '') else None
+        except (TypeError, ValueError):
+            return {'error': 'semilla debe ser un entero no negativo'}, 400
+        if semilla is not None and semilla < 0:
+            return {'error': 'semilla debe ser un entero no negativo'}, 400
+    
+    # Deduplicación: por configuración o con ?deduplicar=1|0
+    deduplicar = args.get('deduplicar', '1' if DEDUPLICAR_VALORACIONES else '0') == '1'
+    
+    # Calcular valoración
+    resultado = motor.calcular_valor(datos, deduplicar=deduplicar)
+    
+    if 'error' in resultado:
+        return resultado, 500
+    
+    if simular:
+        inicio = time.perf_counter()
+        resultado['simulacion'] = motor.simular_valor(datos, iteraciones, semilla)
+        metricas.observar('valoracion_etapa_segundos', time.perf_counter() - inicio, etapa='simular')
+    
+    return {
+        'success': True,
+        'valoracion': resultado,
+        'timestamp': datetime.now().isoformat()
+    }, 200
+
+@app.route('/api/valorar', methods=['POST'])
+def valorar_software():
+    """Endpoint principal para valorar software"""
+    try:
+        inicio = time.perf_counter()
+        datos = request.get_json()
+        metricas.observar('valoracion_etapa_segundos', time.perf_counter() - inicio, etapa='parsear_json')
+        respuesta, estado = procesar_valoracion(datos, request.args)
+        return jsonify(respuesta), estado
+        
+    except Exception as e:
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
+
+@app.route('/api/valorar/lote', methods=['POST'])
+def valorar_lote():
+    """Valora en una sola pasada un portafolio completo de softwares"""
+    if not NUMPY_AVAILABLE:
+        return jsonify({'error': 'NumPy no está instalado. Ejecute: pip install numpy'}), 500
+    
+    try:
+        cuerpo = request.get_json()
+        lista_datos = cuerpo.get('valoraciones') if isinstance(cuerpo, dict) else cuerpo
+        
+        if not isinstance(lista_datos, list) or not lista_datos:
+            return jsonify({'error': 'Se esperaba una lista no vacía de valoraciones'}), 400
+        
+        if len(lista_datos) > LOTE_MAX_ELEMENTOS:
+            return jsonify({'error': f'El lote supera el máximo de {LOTE_MAX_ELEMENTOS} elementos'}), 400
+        
+        # Validar cada elemento con las mismas reglas de /api/valorar
+        validos = []
+        posiciones = []
+        errores = []
+        for posicion, datos in enumerate(lista_datos):
+            error_validacion = validar_datos_software(datos)
+            if error_validacion:
+                errores.append({'indice': posicion, 'error': error_validacion})
+            else:
+                validos.append(datos)
+                posiciones.append(posicion)
+        
+        # La huella solo hace falta si estas filas entran en la deduplicación
+        deduplicar = request.args.get('deduplicar', '1' if DEDUPLICAR_VALORACIONES else '0') == '1'
+        resultados = motor_lote.valorar_lote(validos, deduplicar=deduplicar)
+        for posicion, resultado in zip(posiciones, resultados):
+            resultado['indice'] = posicion
+        
+        # Sin id no quedó guardada (la transacción del lote falló completa)
+        if any('id' not in resultado for resultado in resultados):
+            return jsonify({
+                'error': 'No se pudieron guardar las valoraciones del lote',
+                'guardado': False,
+                'errores': errores
+            }), 500
+        
+        return jsonify({
+            'success': True,
+            'total': len(resultados),
+            'valoraciones': resultados,
+            'errores': errores,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
+
+@app.route('/api/sensibilidad', methods=['POST'])
+def analizar_sensibilidad():
+    """Análisis de sensibilidad y tornado sobre una valoración base (sin guardar)"""
+    if not NUMPY_AVAILABLE:
+        return jsonify({'error': 'NumPy no está instalado. Ejecute: pip install numpy'}), 500
+    
+    try:
+        datos = request.get_json()
+        
+        error_validacion = validar_datos_software(datos)
+        if error_validacion:
+            return jsonify({'error': error_validacion}), 400
+        
+        analisis = motor_lote.analizar_sensibilidad(datos)
+        
+        return jsonify({
+            'success': True,
+            **analisis,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
+
+def _dominio_eje(campo):
+    """
+    (opciones, validar) de un campo que se puede variar, o None si no lo es
+    
+    `opciones` es la lista que se usa con "todos" (None si el campo es
+    numérico y no la tiene); `validar` dice si un valor enviado sirve para el
+    campo, para que el eje no muestre valores que el motor convertiría en
+    otros (un texto en un campo numérico quedaría en 0).
+    """
+    grupo, _, clave = campo.partition('.')
+    if clave:
+        if grupo == 'iso25010' and clave in PESOS_ISO25010:
+            return [1, 2, 3, 4, 5], lambda valor: type(valor) is int and 1 <= valor <= 5
+        if grupo in CONJUNTOS_RESPUESTAS and clave in CONJUNTOS_RESPUESTAS[grupo]:
+            return [False, True], lambda valor: type(valor) is bool
+        return None
+    
+    opciones = OPCIONES_ESCENARIOS.get(campo) or VOCABULARIOS_RESPUESTAS.get(campo)
+    if campo in ('tecnologia_principal', 'tipo_software'):
+        # El motor también valora tecnologías y tipos fuera del catálogo
+        return opciones, lambda valor: isinstance(valor, str) and valor != ''
+    if opciones is not None:
+        return opciones, lambda valor: type(valor) is not bool and valor in opciones
+    if campo in BANDERAS_RESPUESTAS:
+        return [False, True], lambda valor: type(valor) is bool
+    if campo in CAMPOS_ENTEROS_RESPUESTAS:
+        minimo = 1 if campo == 'usuarios_concurrentes' else 0
+        return None, lambda valor: type(valor) is int and valor >= minimo
+    if campo in CAMPOS_REALES_RESPUESTAS:
+        return None, lambda valor: type(valor) in (int, float) and math.isfinite(valor) and valor >= 0
+    return None
+
+def _leer_ejes_escenarios(ejes_pedidos):
+    """Convierte {campo: lista o "todos"} en [(campo, valores)]; devuelve (ejes, error)"""
+    ejes = []
+    for campo, valores in ejes_pedidos.items():
+        dominio = _dominio_eje(campo)
+        if dominio is None:
+            return None, f'El campo {campo} no se puede variar en la grilla de escenarios'
+        opciones, validar = dominio
+        if valores == 'todos':
+            if opciones is None:
+                return None, f'El eje {campo} no tiene opciones predefinidas; envíe la lista de valores'
+            valores = opciones
+        if not isinstance(valores, list) or not valores:
+            return None, f'El eje {campo} debe ser una lista no vacía o "todos"'
+        invalidos = [valor for valor in valores if not validar(valor)]
+        if invalidos:
+            return None, f'Valores no válidos para el eje {campo}: {", ".join(map(str, invalidos[:10]))}'
+        ejes.append((campo, valores))
+    return ejes, None
+
+@app.route('/api/escenarios', methods=['POST'])
+def evaluar_escenarios():
+    """
+    Valora unos datos base en todas las combinaciones de los ejes pedidos
+    
+    Cuerpo: {"datos_software": {...}, "ejes": {campo: [valores] o "todos"},
+    "metricas": [...]}. Sin ejes se varían tecnologia_principal y
+    arquitectura con todas sus opciones. La respuesta trae una matriz por
+    métrica (un eje por campo, en el orden enviado) y los escenarios de
+    valor mínimo y máximo; no se guarda nada (requiere NumPy).
+    """
+    if not NUMPY_AVAILABLE:
+        return jsonify({'error': 'NumPy no está instalado. Ejecute: pip install numpy'}), 500
+    
+    try:
+        cuerpo = request.get_json(silent=True)
+        if not isinstance(cuerpo, dict):
+            return jsonify({'error': 'No se recibieron datos'}), 400
+        
+        datos = cuerpo.get('datos_software')
+        error_validacion = validar_datos_software(datos)
+        if error_validacion:
+            return jsonify({'error': error_validacion}), 400
+        
+        ejes_pedidos = cuerpo.get('ejes') or {campo: 'todos' for campo in ESCENARIOS_EJES_DEFECTO}
+        if not isinstance(ejes_pedidos, dict):
+            return jsonify({'error': 'ejes debe ser un objeto {campo: valores}'}), 400
+        ejes, error = _leer_ejes_escenarios(ejes_pedidos)
+        if error:
+            return jsonify({'error': error}), 400
+        
+        combinaciones = math.prod(len(valores) for _, valores in ejes)
+        if combinaciones > ESCENARIOS_MAX_COMBINACIONES:
+            return jsonify({'error': f'La grilla tiene {combinaciones} combinaciones; el máximo es {ESCENARIOS_MAX_COMBINACIONES}'}), 400
+        
+        metricas_pedidas = cuerpo.get('metricas') or ESCENARIOS_METRICAS_DEFECTO
+        if not isinstance(metricas_pedidas, list) or not all(isinstance(metrica, str) for metrica in metricas_pedidas):
+            return jsonify({'error': 'metricas debe ser una lista de nombres'}), 400
+        disponibles = ESCENARIOS_METRICAS_DEFECTO + ['factor_confianza'] + FACTORES_DESGLOSE
+        desconocidas = [metrica for metrica in metricas_pedidas if metrica not in disponibles]
+        if desconocidas:
+            return jsonify({'error': f'Métricas desconocidas: {", ".join(map(str, desconocidas))}'}), 400
+        
+        try:
+            escenarios = motor_lote.evaluar_escenarios(datos, ejes, metricas_pedidas)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        return jsonify({
+            'success': True,
+            **escenarios,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except Exception as e:
+        return jsonify({'error': f'Error interno: {str(e)}'}), 500
+
+@app.route('/api/ejemplo-auditoria', methods=['GET'])
+def obtener_ejemplo_auditoria():
+    """Devuelve datos de ejemplo para un sistema de auditoría en Access"""
+    ejemplo_datos = {
+        'tipo_software': 'sistema_auditoria',
+        'tecnologia_principal': 'access_vba',
+        'antiguedad_anos': 2,
+        'en_uso_activo': True,
+        'sector': 'publico',
+        'descripcion': 'El software es una herramienta que facilita la auditoría interna para municipios de sexta categoría de Colombia',
+        'usuarios_concurrentes': 3,  # 2-5 usuarios
+        'usuarios_totales': 2,
+        'base_datos_tipo': 'local',
+        'integraciones_externas': 0,
+        'volumen_datos': 'pequeno',
+        'arquitectura': 'monolitica',
+        'funcionalidades': {
+            'autenticacion_avanzada': True,
+            'reportes_complejos': True,
+            'workflow_aprobaciones': True,
+            'dashboard_ejecutivo': True,
+            'auditoria_logs': True
+        },
+        'iso25010': {
+            'security': 2,
+            'functional_suitability': 3,
+            'reliability': 3,
+            'maintainability': 4,
+            'performance_efficiency': 3,
+            'usability': 4,
+            'compatibility': 4,
+            'portability': 5,
+            'flexibility': 4
+        },
+        'tipo_valoracion': 'conservadora',
+        'nivel_certeza': 'media',
+        'contexto_desarrollo': {
+            'desarrollo_interno': True,
+            'tiempo_parcial': True,
+            'aprendizaje_tecnologia': True,
+            'prototipo_iterativo': True,
+            'sin_metodologia': True
+        },
+        'criticidad_negocio': 2,
+        'conoce_tiempo_desarrollo': 'no',
+        'conoce_inversion': 'no',
+        'conoce_ahorros': 'no',
+        'genera_reportes_oficiales': True,
+        'requiere_auditoria_logs': True,
+        'maneja_datos_personales': True,
+        'decreto_648': True,
+        'observaciones': 'El aplicativo presenta una estructura operativa bien organizada y se encuentra alineado con los lineamientos del Decreto 648 de 2017, lo que evidencia una adecuada comprensión de los requerimientos normativos. Desde el punto de vista técnico, el código desarrollado en VBA muestra una estructura clara y mantenible, con una mínima presencia de código espagueti. Se evidencian buenas prácticas en la separación de funcionalidades mediante módulos, lo que facilita su comprensión, mantenimiento y escalabilidad dentro del entorno de Access.'
+    }
+    
+    return jsonify({
+        'success': True,
+        'datos': ejemplo_datos,
+        'descripcion': 'Sistema de Auditoría Municipal - Caso de Uso Real'
+    })
+
+def _codificar_cursor(fecha, valoracion_id):
+    """Cursor opaco con la última posición (fecha, id) entregada"""
+    return base64.urlsafe_b64encode(json.dumps([fecha, valoracion_id]).encode('utf-8')).decode('ascii')
+
+def _decodificar_cursor(cursor):
+    """Recupera (fecha, id) de un cursor; lanza ValueError si es inválido"""
+    try:
+        fecha, valoracion_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('cursor inválido')
+    return fecha, valoracion_id
+
+def consultar_historico(args):
+    """
+    Obtiene el histórico de valoraciones, paginado por cursor
+    
+    Parámetros opcionales: limite, cursor (siguiente_cursor de la página
+    anterior), tipo_software, tecnologia y orden (desc | asc por fecha).
+    Cada página se resuelve recorriendo un índice desde la posición del
+    cursor, por lo que el costo no crece con el número de filas.
+    Devuelve (cuerpo de la respuesta, código HTTP).
+    """
+    try:
+        limite = safe_int(args.get('limite'), HISTORICO_LIMITE_DEFECTO)
+        limite = max(1, min(limite, HISTORICO_LIMITE_MAXIMO))
+        
+        orden = args.get('orden', 'desc').lower()
+        if orden not in ('asc', 'desc'):
+            return {'error': 'orden debe ser asc o desc'}, 400
+        
+        condiciones = []
+        parametros = []
+        
+        tipo_software = args.get('tipo_software')
+        if tipo_software:
+            condiciones.append('tipo_software = ?')
+            parametros.append(tipo_software)
+        
+        tecnologia = args.get('tecnologia')
+        if tecnologia:
+            condiciones.append('tecnologia_principal = ?')
+            parametros.append(tecnologia)
+        
+        cursor = args.get('cursor')
+        if cursor:
+            try:
+                fecha_cursor, id_cursor = _decodificar_cursor(cursor)
+            except ValueError as e:
+                return {'error': str(e)}, 400
+            condiciones.append('(fecha_creacion, id) %s (?, ?)' % ('<' if orden == 'desc' else '>'))
+            parametros.extend([fecha_cursor, id_cursor])
+        
+        where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+        filas = db.consultar(f'''
+            SELECT id, fecha_creacion, tipo_software, tecnologia_principal, 
+                   valor_minimo, valor_maximo, factor_confianza
+            FROM valoraciones 
+            {where}
+            ORDER BY fecha_creacion {orden.upper()}, id {orden.upper()} 
+            LIMIT ?
+        ''', parametros + [limite + 1])
+        
+        # Se pide una fila extra solo para saber si hay otra página
+        hay_mas = len(filas) > limite
+        filas = filas[:limite]
+        
+        valoraciones = []
+        for row in filas:
+            valoraciones.append({
+                'id': row[0],
+                'fecha': row[1],
+                'tipo_software': row[2],
+                'tecnologia': row[3],
+                'valor_minimo': row[4],
+                'valor_maximo': row[5],
+                'confianza': row[6]
+            })
+        
+        siguiente_cursor = _codificar_cursor(filas[-1][1], filas[-1][0]) if hay_mas else None
+        
+        return {
+            'valoraciones': valoraciones,
+            'total': len(valoraciones),
+            'siguiente_cursor': siguiente_cursor
+        }, 200
+        
+    except Exception as e:
+        return {'error': f'Error consultando histórico: {str(e)}'}, 500
+
+@app.route('/api/historico', methods=['GET'])
+def obtener_historico():
+    """Histórico de valoraciones paginado por cursor (ver consultar_historico)"""
+    respuesta, estado = consultar_historico(request.args)
+    return jsonify(respuesta), estado
+
+def consultar_estadisticas():
+    """
+    Estadísticas del sistema
+    
+    Se leen del resumen mantenido en cada inserción (estadisticas_resumen),
+    de modo que el costo no depende del número de valoraciones guardadas.
+    Devuelve (cuerpo de la respuesta, código HTTP).
+    """
+    try:
+        desglose = {'tecnologia': {}, 'tipo_software': {}, 'mes': {}}
+        total_valoraciones = 0
+        valor_promedio = 0
+        tech_popular = 'N/A'
+        cantidad_popular = 0
+        
+        for dimension, clave, cantidad, suma_valor in db.consultar(
+                'SELECT dimension, clave, cantidad, suma_valor FROM estadisticas_resumen'):
+            promedio = suma_valor / cantidad if cantidad else 0
+            if dimension == 'global':
+                total_valoraciones = cantidad
+                valor_promedio = promedio
+            elif dimension in desglose:
+                desglose[dimension][clave] = {
+                    'cantidad': cantidad,
+                    'valor_promedio': round(promedio)
+                }
+                # Tecnología más valorada (en empate, la primera alfabéticamente)
+                if dimension == 'tecnologia' and cantidad > cantidad_popular:
+                    tech_popular, cantidad_popular = clave, cantidad
+        
+        return {
+            'total_valoraciones': total_valoraciones,
+            'valor_promedio': round(valor_promedio),
+            'tecnologia_mas_valorada': tech_popular,
+            'factores_tecnologia': len(FACTORES_TECNOLOGIA),
+            'por_tecnologia': desglose['tecnologia'],
+            'por_tipo_software': desglose['tipo_software'],
+            'por_mes': desglose['mes'],
+            'version_sistema': '1.0'
+        }, 200
+        
+    except Exception as e:
+        return {'error': f'Error en estadísticas: {str(e)}'}, 500
+
+@app.route('/api/estadisticas', methods=['GET'])
+def obtener_estadisticas():
+    """Estadísticas del sistema (ver consultar_estadisticas)"""
+    respuesta, estado = consultar_estadisticas()
+    return jsonify(respuesta), estado
+
+# Agrupaciones disponibles en /api/reportes/factores
+AGRUPACIONES_REPORTE = ['tecnologia_principal', 'tipo_software', 'mes'] + list(VOCABULARIOS_RESPUESTAS)
+
+@app.route('/api/reportes/factores', methods=['GET'])
+def reporte_factores():
+    """
+    Promedios de valor y de cada factor del desglose por grupo
+    
+    Parámetros: agrupar (tecnologia_principal, tipo_software, mes o un campo
+    categórico como sector o arquitectura) y opcionales desde / hasta
+    (AAAA-MM-DD). Se resuelve solo con las columnas tipadas y el catálogo de
+    códigos, sin leer JSON.
+    """
+    agrupar = request.args.get('agrupar', 'tecnologia_principal')
+    if agrupar not in AGRUPACIONES_REPORTE:
+        return jsonify({'error': f'agrupar debe ser uno de: {", ".join(AGRUPACIONES_REPORTE)}'}), 400
+    
+    condiciones = []
+    parametros = []
+    try:
+        for nombre, operador, dias in (('desde', '>=', 0), ('hasta', '<', 1)):
+            if request.args.get(nombre):
+                fecha = _parsear_fecha(request.args.get(nombre), nombre) + timedelta(days=dias)
+                condiciones.append(f'v.fecha_creacion {operador} ?')
+                parametros.append(fecha.strftime('%Y-%m-%d'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    union = ''
+    if agrupar == 'mes':
+        grupo = "substr(v.fecha_creacion, 1, 7)"
+    elif agrupar in VOCABULARIOS_RESPUESTAS:
+        union = 'LEFT JOIN catalogo_respuestas c ON c.campo = ? AND c.codigo = v.' + agrupar
+        parametros.insert(0, agrupar)
+        grupo = 'c.valor'
+    else:
+        grupo = 'v.' + agrupar
+    
+    where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+    promedios = ', '.join(f'AVG(v.{factor})' for factor in FACTORES_DESGLOSE)
+    
+    try:
+        filas = db.consultar(f'''
+            SELECT COALESCE({grupo}, ''), COUNT(*), AVG(v.valor_promedio), AVG(v.factor_confianza), {promedios}
+            FROM valoraciones v {union}
+            {where}
+            GROUP BY 1
+            ORDER BY 2 DESC, 1
+        ''', parametros)
+        
+        grupos = []
+        for fila in filas:
+            grupos.append({
+                'grupo': fila[0],
+                'cantidad': fila[1],
+                'valor_promedio': round(fila[2]) if fila[2] is not None else None,
+                'factor_confianza': fila[3],
+                'factores': dict(zip(FACTORES_DESGLOSE, fila[4:]))
+            })
+        
+        return jsonify({'agrupar': agrupar, 'grupos': grupos})
+        
+    except Exception as e:
+        return jsonify({'error': f'Error en reporte: {str(e)}'}), 500
+
+# ================================
+# EXPORTACIÓN DE VALORACIONES
+# ================================
+
+# Columnas de cada fila exportada (además de respuestas y desglose si se decodifica)
+COLUMNAS_EXPORTACION = [
+    'id', 'fecha_creacion', 'tipo_software', 'tecnologia_principal',
+    'valor_minimo', 'valor_maximo', 'valor_promedio', 'factor_confianza'
+] + FACTORES_DESGLOSE
+
+FORMATOS_EXPORTACION = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv', 'csv')
+}
+
+def _iterar_exportacion(condiciones, parametros, decodificar):
+    """
+    Recorre las valoraciones filtradas como diccionarios, por fragmentos
+    
+    Usa un cursor sobre una conexión de lectura propia, así que la memoria
+    depende solo de EXPORTACION_FILAS_POR_FRAGMENTO y no del total exportado.
+    Entrega una lista de filas por fragmento.
+    """
+    columnas = codificador.columnas if decodificar else COLUMNAS_EXPORTACION
+    seleccion = ', '.join('v.' + columna for columna in columnas)
+    union = ''
+    if decodificar:
+        seleccion += ', t.comprimido, t.contenido'
+        union = 'LEFT JOIN valoraciones_texto t ON t.valoracion_id = v.id'
+    where = ('WHERE ' + ' AND '.join(condiciones)) if condiciones else ''
+    
+    conn = db.abrir_lectura()
+    try:
+        cursor = conn.execute(f'''
+            SELECT {seleccion}
+            FROM valoraciones v {union}
+            {where}
+            ORDER BY v.fecha_creacion, v.id
+        ''', parametros)
+        while True:
+            filas = cursor.fetchmany(EXPORTACION_FILAS_POR_FRAGMENTO)
+            if not filas:
+                return
+            fragmento = []
+            for fila in filas:
+                valoracion = dict(zip(columnas, fila))
+                if decodificar:
+                    sobrantes = codificador.desempaquetar_texto(*fila[len(columnas):])
+                    for campo in ('tipo_software', 'tecnologia_principal'):
+                        if valoracion[campo] is not None:
+                            sobrantes[campo] = valoracion[campo]
+                    respuestas, desglose = codificador.decodificar(valoracion, sobrantes)
+                    valoracion = {columna: valoracion[columna] for columna in COLUMNAS_EXPORTACION}
+                    valoracion['respuestas'] = respuestas
+                    valoracion['desglose'] = desglose
+                fragmento.append(valoracion)
+            yield fragmento
+    finally:
+        conn.close()
+
+def _fragmentos_ndjson(fragmentos):
+    for fragmento in fragmentos:
+        yield ''.join(json.dumps(valoracion, ensure_ascii=False) + '\n' for valoracion in fragmento)
+
+def _fragmentos_csv(fragmentos, decodificar):
+    encabezados = COLUMNAS_EXPORTACION + (['respuestas', 'desglose'] if decodificar else [])
+    buffer = StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(encabezados)
+    for fragmento in fragmentos:
+        for valoracion in fragmento:
+            if decodificar:
+                valoracion['respuestas'] = json.dumps(valoracion['respuestas'], ensure_ascii=False)
+                valoracion['desglose'] = json.dumps(valoracion['desglose'], ensure_ascii=False)
+            escritor.writerow([valoracion[columna] for columna in encabezados])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@app.route('/api/exportar', methods=['GET'])
+def exportar_valoraciones():
+    """
+    Exporta todas las valoraciones que cumplan los filtros, en streaming
+    
+    Parámetros: formato (ndjson o csv), opcionales desde / hasta
+    (AAAA-MM-DD, ambos inclusive), tecnologia y tipo_software, y
+    decodificar=1 para incluir las respuestas y el desglose completos
+    (en CSV, como JSON dentro de la celda). Las filas se envían a medida que
+    se leen, sin límite de cantidad.
+    """
+    formato = request.args.get('formato', 'ndjson').lower()
+    if formato not in FORMATOS_EXPORTACION:
+        return jsonify({'error': f'formato debe ser uno de: {", ".join(FORMATOS_EXPORTACION)}'}), 400
+    decodificar = request.args.get('decodificar', '0').lower() in ('1', 'true', 'si')
+    
+    condiciones = []
+    parametros = []
+    try:
+        for nombre, operador, dias in (('desde', '>=', 0), ('hasta', '<', 1)):
+            if request.args.get(nombre):
+                fecha = _parsear_fecha(request.args.get(nombre), nombre) + timedelta(days=dias)
+                condiciones.append(f'v.fecha_creacion {operador} ?')
+                parametros.append(fecha.strftime('%Y-%m-%d'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    for nombre, columna in (('tecnologia', 'tecnologia_principal'), ('tipo_software', 'tipo_software')):
+        if request.args.get(nombre):
+            condiciones.append(f'v.{columna} = ?')
+            parametros.append(request.args.get(nombre))
+    
+    fragmentos = _iterar_exportacion(condiciones, parametros, decodificar)
+    if formato == 'csv':
+        cuerpo = _fragmentos_csv(fragmentos, decodificar)
+    else:
+        cuerpo = _fragmentos_ndjson(fragmentos)
+    
+    mimetype, extension = FORMATOS_EXPORTACION[formato]
+    nombre = f"valoraciones_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    return Response(
+        cuerpo,
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={nombre}'}
+    )
+
+# ================================
+# IMPORTACIÓN MASIVA (CSV/XLSX)
+# ================================
+
+# Encabezados abreviados frecuentes en las hojas de inventario
+ALIAS_IMPORTACION = {
+    'tipo': 'tipo_software',
+    'tecnologia': 'tecnologia_principal',
+    'antiguedad': 'antiguedad_anos',
+    'usuarios': 'usuarios_totales',
+    'criticidad': 'criticidad_negocio',
+    'integraciones': 'integraciones_externas',
+    'base_datos': 'base_datos_tipo'
+}
+
+VALORES_VERDADEROS = {'1', 'si', 's', 'true', 'verdadero', 'x'}
+VALORES_FALSOS = {'0', 'no', 'n', 'false', 'falso'}
+
+def _normalizar_clave(texto):
+    """'Tecnología Principal' -> 'tecnologia_principal'"""
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').lower()
+    texto = ''.join(caracter if caracter.isalnum() else '_' for caracter in texto)
+    return '_'.join(parte for parte in texto.split('_') if parte)
+
+def _normalizar_encabezado(encabezado):
+    """Normaliza cada parte de un encabezado; 'ISO25010.Security' -> 'iso25010.security'"""
+    return '.'.join(_normalizar_clave(parte) for parte in str(encabezado).split('.'))
+
+def _convertir_booleano(valor, campo):
+    if isinstance(valor, bool):
+        return valor
+    clave = _normalizar_clave(valor)
+    if clave in VALORES_VERDADEROS:
+        return True
+    if clave in VALORES_FALSOS:
+        return False
+    raise ValueError(f'{campo} debe ser sí o no (se recibió {valor!r})')
+
+def fila_a_datos_software(celdas):
+    """
+    Convierte una fila de la hoja ({encabezado: valor}) en datos_software
+    
+    Los encabezados son los nombres de los campos (o un alias de
+    ALIAS_IMPORTACION); los campos anidados usan punto, p. ej.
+    iso25010.security o funcionalidades.api_rest. Las celdas vacías se
+    omiten. Lanza ValueError si un valor no se puede interpretar o si la
+    fila no pasa validar_datos_software.
+    """
+    datos = {}
+    for encabezado, valor in celdas.items():
+        if isinstance(valor, str):
+            valor = valor.strip()
+        if valor is None or valor == '':
+            continue
+        if isinstance(valor, datetime):
+            valor = valor.isoformat()
+        
+        campo, _, subcampo = encabezado.partition('.')
+        campo = ALIAS_IMPORTACION.get(campo, campo)
+        
+        if subcampo:
+            if campo == 'iso25010':
+                puntaje = safe_float(valor, None)
+                if puntaje is None or not puntaje.is_integer() or not 1 <= puntaje <= 5:
+                    raise ValueError(f'{encabezado} debe ser un entero de 1 a 5')
+                valor = int(puntaje)
+            elif campo in CONJUNTOS_RESPUESTAS:
+                valor = _convertir_booleano(valor, encabezado)
+            datos.setdefault(campo, {})[subcampo] = valor
+        elif campo in BANDERAS_RESPUESTAS:
+            datos[campo] = _convertir_booleano(valor, campo)
+        elif campo == 'en_uso_activo':
+            # El motor espera el texto 'true'/'false' que envía el formulario
+            datos[campo] = 'true' if _convertir_booleano(valor, campo) else 'false'
+        elif campo in CAMPOS_ENTEROS_RESPUESTAS or campo in CAMPOS_REALES_RESPUESTAS:
+            numero = safe_float(valor, None)
+            if numero is None:
+                raise ValueError(f'{campo} debe ser numérico (se recibió {valor!r})')
+            datos[campo] = int(numero) if campo in CAMPOS_ENTEROS_RESPUESTAS else numero
+        elif campo in VOCABULARIOS_RESPUESTAS or campo in ('tipo_software', 'tecnologia_principal'):
+            datos[campo] = _normalizar_clave(valor)
+        else:
+            datos[campo] = valor
+    
+    error = validar_datos_software(datos)
+    if error:
+        raise ValueError(error)
+    return datos
+
+def _filas_con_encabezado(filas):
+    """
+    (número de fila, {encabezado: valor}) de las filas de datos
+    
+    El encabezado es la primera fila con las columnas tipo_software y
+    tecnologia_principal (o sus alias); las filas anteriores, como títulos
+    o fechas de corte, se ignoran, igual que las filas vacías.
+    """
+    encabezados = None
+    for numero, fila in enumerate(filas, start=1):
+        if all(valor is None or valor == '' for valor in fila):
+            continue
+        if encabezados is None:
+            candidatos = [_normalizar_encabezado(valor) if valor is not None else '' for valor in fila]
+            campos = {ALIAS_IMPORTACION.get(candidato, candidato) for candidato in candidatos}
+            if {'tipo_software', 'tecnologia_principal'} <= campos:
+                encabezados = candidatos
+            continue
+        yield numero, {encabezado: valor for encabezado, valor in zip(encabezados, fila) if encabezado}
+    
+    if encabezados is None:
+        raise ValueError('No se encontró la fila de encabezado con las columnas tipo_software y tecnologia_principal')
+
+def _lector_csv(archivo):
+    """csv.reader con el separador detectado (coma, punto y coma o tabulador)"""
+    muestra = archivo.read(64 * 1024)
+    archivo.seek(0)
+    try:
+        dialecto = csv.Sniffer().sniff(muestra, delimiters=',;\t')
+    except csv.Error:
+        dialecto = csv.excel
+    return csv.reader(archivo, dialecto)
+
+def _leer_filas_csv(ruta):
+    """Recorre un CSV (separado por coma, punto y coma o tabulador) fila por fila"""
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        yield from _filas_con_encabezado(_lector_csv(archivo))
+
+def _leer_filas_xlsx(ruta, hoja=None):
+    """Recorre una hoja de un XLSX en modo de solo lectura, sin cargarla completa"""
+    import openpyxl
+    libro = openpyxl.load_workbook(ruta, read_only=True, data_only=True)
+    try:
+        hoja = libro[hoja] if hoja else libro.active
+        yield from _filas_con_encabezado(hoja.iter_rows(values_only=True))
+    finally:
+        libro.close()
+
+def _estimar_filas(ruta, formato, hoja=None):
+    """Número aproximado de filas de datos, solo para informar el avance"""
+    if formato == 'xlsx':
+        import openpyxl
+        libro = openpyxl.load_workbook(ruta, read_only=True)
+        try:
+            maximo = (libro[hoja] if hoja else libro.active).max_row
+        finally:
+            libro.close()
+        return max(0, maximo - 1) if maximo else None
+    
+    lineas = 0
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(1 << 20), b''):
+            lineas += bloque.count(b'\n')
+    return max(0, lineas - 1)
+
+def _valorar_fragmento(lista_datos):
+    """Tarea del pool: resultados (sin guardar) de un fragmento de filas validadas"""
+    if NUMPY_AVAILABLE:
+        return motor_lote.valorar_lote(lista_datos, guardar=False)
+    return [motor._calcular_resultado(datos) for datos in lista_datos]
+
+class ImportadorValoraciones:
+    """
+    Importación masiva de valoraciones desde CSV o XLSX
+    
+    Cada trabajo lee el archivo fila por fila, convierte y valida cada fila,
+    valora fragmentos de IMPORTACION_FILAS_POR_FRAGMENTO filas en un pool de
+    procesos y guarda cada fragmento en una sola transacción. Solo hay unos
+    pocos fragmentos en vuelo por proceso, así que la memoria no depende del
+    tamaño del archivo. Las filas rechazadas se escriben en un CSV de
+    errores. Los trabajos se atienden de a uno, en orden de llegada.
+    """
+    
+    CAMPOS_ESTADO = [
+        'archivo', 'creado', 'finalizado', 'estado', 'error', 'filas_estimadas',
+        'filas_leidas', 'filas_valoradas', 'filas_guardadas', 'filas_con_error'
+    ]
+    
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._hilo = ThreadPoolExecutor(max_workers=1, thread_name_prefix='importacion')
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if self.workers > 0:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=CONTEXTO_PROCESOS)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+            return self._executor
+    
+    def crear_trabajo(self, ruta, formato, hoja=None, archivo=None):
+        """Registra la importación del archivo en `ruta` (que se borra al terminar) y devuelve el id"""
+        trabajo_id = str(uuid.uuid4())
+        trabajo = {
+            'id': trabajo_id,
+            'archivo': archivo,
+            'creado': datetime.now().isoformat(),
+            'finalizado': None,
+            'estado': 'pendiente',
+            'error': None,
+            'filas_estimadas': None,
+            'filas_leidas': 0,
+            'filas_valoradas': 0,
+            'filas_guardadas': 0,
+            'filas_con_error': 0,
+            'ruta_errores': os.path.join(IMPORTACION_DIRECTORIO, f'importacion_{trabajo_id}_errores.csv')
+        }
+        with self._lock:
+            self._trabajos[trabajo_id] = trabajo
+            self._depurar()
+        self._hilo.submit(self._procesar, trabajo, ruta, formato, hoja)
+        return trabajo_id
+    
+    def _depurar(self):
+        """Descarta los trabajos terminados más antiguos (y su archivo de errores)"""
+        exceso = len(self._trabajos) - IMPORTACION_TRABAJOS_MAXIMOS
+        for trabajo_id in list(self._trabajos):
+            if exceso <= 0:
+                break
+            trabajo = self._trabajos[trabajo_id]
+            if trabajo['estado'] in ('completado', 'error'):
+                del self._trabajos[trabajo_id]
+                try:
+                    os.remove(trabajo['ruta_errores'])
+                except OSError:
+                    pass
+                exceso -= 1
+    
+    def _procesar(self, trabajo, ruta, formato, hoja):
+        trabajo['estado'] = 'en_proceso'
+        try:
+            trabajo['filas_estimadas'] = _estimar_filas(ruta, formato, hoja)
+            filas = _leer_filas_xlsx(ruta, hoja) if formato == 'xlsx' else _leer_filas_csv(ruta)
+            with open(trabajo['ruta_errores'], 'w', newline='', encoding='utf-8') as archivo_errores:
+                errores = csv.writer(archivo_errores)
+                errores.writerow(['fila', 'error', 'datos'])
+                self._importar(trabajo, filas, errores)
+            trabajo['estado'] = 'completado'
+        except Exception as e:
+            trabajo['error'] = f'Error importando: {str(e)}'
+            trabajo['estado'] = 'error'
+        finally:
+            trabajo['finalizado'] = datetime.now().isoformat()
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+    
+    def _importar(self, trabajo, filas, errores):
+        en_vuelo = 2 * max(1, self.workers)
+        pendientes = {}
+        
+        def registrar_error(numero, error, datos):
+            errores.writerow([numero, error, json.dumps(datos, ensure_ascii=False, default=str)])
+            trabajo['filas_con_error'] += 1
+        
+        def completar(future):
+            numeros, lista_datos = pendientes.pop(future)
+            try:
+                resultados = future.result()
+            except Exception:
+                # Valorar una a una para aislar las filas que hacen fallar al fragmento
+                validos = []
+                for numero, datos in zip(numeros, lista_datos):
+                    try:
+                        validos.append((numero, datos, motor._calcular_resultado(datos)))
+                    except Exception as e:
+                        registrar_error(numero, f'Error valorando: {str(e)}', datos)
+                numeros = [numero for numero, _, _ in validos]
+                lista_datos = [datos for _, datos, _ in validos]
+                resultados = [resultado for _, _, resultado in validos]
+            
+            trabajo['filas_valoradas'] += len(resultados)
+            if not resultados:
+                return
+            if motor._guardar_valoraciones_lote(lista_datos, resultados) is None:
+                for numero, datos in zip(numeros, lista_datos):
+                    registrar_error(numero, 'Error guardando la valoración', datos)
+            else:
+                trabajo['filas_guardadas'] += len(resultados)
+        
+        def enviar(numeros, lista_datos):
+            while len(pendientes) >= en_vuelo:
+                listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for future in listos:
+                    completar(future)
+            pendientes[self._pool().submit(_valorar_fragmento, lista_datos)] = (numeros, lista_datos)
+        
+        numeros, lista_datos = [], []
+        for numero, celdas in filas:
+            trabajo['filas_leidas'] += 1
+            try:
+                datos = fila_a_datos_software(celdas)
+            except ValueError as e:
+                registrar_error(numero, str(e), celdas)
+                continue
+            numeros.append(numero)
+            lista_datos.append(datos)
+            if len(lista_datos) >= IMPORTACION_FILAS_POR_FRAGMENTO:
+                enviar(numeros, lista_datos)
+                numeros, lista_datos = [], []
+        if lista_datos:
+            enviar(numeros, lista_datos)
+        
+        while pendientes:
+            listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for future in listos:
+                completar(future)
+    
+    def estado(self, trabajo_id):
+        """Devuelve el estado público y el avance de un trabajo, o None si no existe"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+            if trabajo is None:
+                return None
+            estado = {campo: trabajo[campo] for campo in self.CAMPOS_ESTADO}
+        
+        estado['job_id'] = trabajo_id
+        if estado['estado'] == 'completado':
+            estado['porcentaje'] = 100.0
+        elif estado['filas_estimadas']:
+            estado['porcentaje'] = min(99.9, round(100 * estado['filas_leidas'] / estado['filas_estimadas'], 1))
+        else:
+            estado['porcentaje'] = 0.0
+        return estado
+    
+    def ruta_errores(self, trabajo_id):
+        """Ruta del CSV de errores de un trabajo, o None si no existe"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None or not os.path.exists(trabajo['ruta_errores']):
+            return None
+        return trabajo['ruta_errores']
+    
+    def cerrar(self):
+        self._hilo.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+importador = ImportadorValoraciones(IMPORTACION_WORKERS)
+atexit.register(importador.cerrar)
+
+@app.route('/api/importar', methods=['POST'])
+def importar_valoraciones():
+    """
+    Importa valoraciones desde un archivo CSV o XLSX (campo multipart 'archivo')
+    
+    La primera fila no vacía es el encabezado con los nombres de los campos
+    de datos_software (ver fila_a_datos_software); el campo opcional 'hoja'
+    elige la hoja del XLSX. La importación corre en segundo plano: se
+    devuelve el id del trabajo para consultar el avance.
+    """
+    archivo = request.files.get('archivo')
+    if archivo is None or not archivo.filename:
+        return jsonify({'error': 'Debe enviar el archivo en el campo "archivo"'}), 400
+    
+    extension = os.path.splitext(archivo.filename)[1].lower()
+    if extension not in ('.csv', '.xlsx'):
+        return jsonify({'error': 'El archivo debe ser .csv o .xlsx'}), 400
+    
+    if extension == '.xlsx' and not OPENPYXL_AVAILABLE:
+        return jsonify({'error': 'openpyxl no está instalado. Ejecute: pip install openpyxl'}), 500
+    
+    descriptor, ruta = tempfile.mkstemp(prefix='importacion_', suffix=extension, dir=IMPORTACION_DIRECTORIO)
+    os.close(descriptor)
+    archivo.save(ruta)
+    
+    trabajo_id = importador.crear_trabajo(ruta, extension[1:], request.form.get('hoja') or None, archivo.filename)
+    estado = importador.estado(trabajo_id)
+    estado['url_estado'] = f'/api/importar/{trabajo_id}'
+    estado['url_errores'] = f'/api/importar/{trabajo_id}/errores'
+    return jsonify(estado), 202
+
+@app.route('/api/importar/<trabajo_id>', methods=['GET'])
+def obtener_importacion(trabajo_id):
+    """Avance de una importación: filas leídas, valoradas, guardadas y con error"""
+    estado = importador.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(estado)
+
+@app.route('/api/importar/<trabajo_id>/errores', methods=['GET'])
+def descargar_errores_importacion(trabajo_id):
+    """CSV con las filas rechazadas (número de fila, error y datos leídos)"""
+    estado = importador.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    if estado['estado'] in ('pendiente', 'en_proceso'):
+        return jsonify({'error': 'La importación aún no termina', 'estado': estado['estado']}), 409
+    
+    ruta = importador.ruta_errores(trabajo_id)
+    if ruta is None:
+        return jsonify({'error': estado['error'] or 'No hay archivo de errores'}), 404
+    
+    return send_file(
+        ruta,
+        as_attachment=True,
+        download_name=f'errores_importacion_{trabajo_id[:8]}.csv',
+        mimetype='text/csv'
+    )
+
+# ================================
+# MUESTREO ESTADÍSTICO
+# ================================
+
+def muestra_floyd(n, k, rng):
+    """
+    k índices distintos de range(n), por el algoritmo de Floyd
+    
+    Hace exactamente k sorteos y solo guarda los elegidos, así que el costo
+    no crece cuando k se acerca a n (sortear y descartar repetidos, como la
+    macro ALEATORIO, necesita cada vez más intentos).
+    """
+    elegidos = set()
+    for j in range(n - k, n):
+        t = rng.randrange(j + 1)
+        elegidos.add(j if t in elegidos else t)
+    return elegidos
+
+def muestra_sistematica(n, k, rng):
+    """k índices de range(n) cada n/k posiciones, desde un arranque aleatorio"""
+    if k == 0:
+        return set()
+    intervalo = n / k
+    inicio = rng.random() * intervalo
+    return {int(inicio + i * intervalo) for i in range(k)}
+
+def asignar_estratos(tamanos, k, asignacion):
+    """
+    Reparte k elementos entre los estratos {estrato: tamaño}
+    
+    'proporcional' asigna k·N_h/N y 'igual' k/H; las fracciones se
+    completan por mayor residuo y ningún estrato recibe más elementos de los
+    que tiene (el excedente pasa a los demás).
+    """
+    total = sum(tamanos.values())
+    if asignacion == 'proporcional':
+        cuotas = {estrato: k * tamano / total for estrato, tamano in tamanos.items()}
+    else:
+        cuotas = {estrato: k / len(tamanos) for estrato in tamanos}
+    asignados = {estrato: min(int(cuota), tamanos[estrato]) for estrato, cuota in cuotas.items()}
+    
+    restantes = k - sum(asignados.values())
+    orden = sorted(tamanos, key=lambda estrato: cuotas[estrato] - int(cuotas[estrato]), reverse=True)
+    while restantes > 0:
+        for estrato in orden:
+            if restantes and asignados[estrato] < tamanos[estrato]:
+                asignados[estrato] += 1
+                restantes -= 1
+    return asignados
+
+def planificar_muestra(tamanos, parametros):
+    """
+    Índices elegidos dentro de cada estrato y tamaño asignado a cada uno
+    
+    `tamanos` es {estrato: tamaño} en el orden de la población (un solo
+    estrato None si no se estratifica). Los sorteos salen de un
+    random.Random con la semilla de los parámetros, recorriendo los estratos
+    en ese orden, así que la misma población y semilla dan la misma muestra.
+    """
+    rng = random.Random(parametros['semilla'])
+    asignados = asignar_estratos(tamanos, parametros['tamano'], parametros['asignacion'])
+    sortear = muestra_sistematica if parametros['metodo'] == 'sistematico' else muestra_floyd
+    plan = {estrato: sortear(tamanos[estrato], asignados[estrato], rng) for estrato in tamanos}
+    return plan, asignados
+
+def leer_parametros_muestreo(fuente):
+    """
+    Valida tamano, metodo, semilla y asignacion (de JSON o de un formulario)
+    
+    Devuelve (parámetros, error). Sin semilla se sortea una, que se devuelve
+    en la respuesta para poder repetir la muestra.
+    """
+    try:
+        tamano = int(fuente.get('tamano'))
+    except (TypeError, ValueError):
+        return None, 'tamano debe ser un entero mayor que 0'
+    if not 1 <= tamano <= MUESTREO_TAMANO_MAXIMO:
+        return None, f'tamano debe estar entre 1 y {MUESTREO_TAMANO_MAXIMO}'
+    
+    metodo = fuente.get('metodo') or 'aleatorio'
+    if metodo not in METODOS_MUESTREO:
+        return None, f'metodo debe ser uno de: {", ".join(METODOS_MUESTREO)}'
+    
+    asignacion = fuente.get('asignacion') or 'proporcional'
+    if asignacion not in ASIGNACIONES_MUESTREO:
+        return None, f'asignacion debe ser uno de: {", ".join(ASIGNACIONES_MUESTREO)}'
+    
+    semilla = fuente.get('semilla')
+    if semilla is None or semilla == '':
+        semilla = random.SystemRandom().randrange(2 ** 32)
+    try:
+        semilla = int(semilla)
+    except (TypeError, ValueError):
+        return None, 'semilla debe ser un entero'
+    
+    return {'tamano': tamano, 'metodo': metodo, 'asignacion': asignacion, 'semilla': semilla}, None
+
+def _validar_estratos(tamanos, parametros):
+    """Mensaje de error si la población no admite la muestra pedida, o None"""
+    poblacion = sum(tamanos.values())
+    if poblacion == 0:
+        return 'La población está vacía'
+    if parametros['tamano'] > poblacion:
+        return f"La cantidad solicitada ({parametros['tamano']}) es mayor que la población ({poblacion})"
+    if len(tamanos) > MUESTREO_ESTRATOS_MAXIMOS:
+        return f'Hay más de {MUESTREO_ESTRATOS_MAXIMOS} estratos; revise la columna de estrato'
+    return None
+
+def _resumen_muestreo(parametros, tamanos, asignados):
+    resumen = dict(parametros, poblacion=sum(tamanos.values()))
+    if parametros['metodo'] == 'estratificado':
+        resumen['estratos'] = {
+            str(estrato): {'poblacion': tamanos[estrato], 'muestra': asignados[estrato]} for estrato in tamanos
+        }
+    else:
+        del resumen['asignacion']
+    return resumen
+
+@app.route('/api/muestreo', methods=['POST'])
+def generar_muestreo():
+    """
+    Selecciona una muestra sin reemplazo de una población dada en JSON
+    
+    La población es uno de: poblacion (entero N, posiciones 1..N), estratos
+    ({nombre: tamaño}) o registros (lista de valores u objetos; con metodo
+    estratificado, 'estrato' es el campo de cada objeto que define el
+    estrato). Parámetros: tamano, metodo (aleatorio, sistematico o
+    estratificado), semilla y asignacion (proporcional o igual).
+    Cada elemento de la muestra trae su posición en la población.
+    """
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify({'error': 'No se recibieron datos'}), 400
+    
+    parametros, error = leer_parametros_muestreo(datos)
+    if error:
+        return jsonify({'error': error}), 400
+    estratificado = parametros['metodo'] == 'estratificado'
+    
+    registros = datos.get('registros')
+    etiquetas = None  # Estrato de cada registro, en orden
+    if registros is not None:
+        if not isinstance(registros, list):
+            return jsonify({'error': 'registros debe ser una lista'}), 400
+        if estratificado:
+            campo = datos.get('estrato')
+            if not campo or not all(isinstance(registro, dict) for registro in registros):
+                return jsonify({'error': 'El muestreo estratificado de registros requiere objetos y el campo "estrato"'}), 400
+            etiquetas = [registro.get(campo) for registro in registros]
+            if any(isinstance(etiqueta, (dict, list)) for etiqueta in etiquetas):
+                return jsonify({'error': f'El campo "{campo}" debe tener valores simples'}), 400
+            tamanos = {}
+            for etiqueta in etiquetas:
+                tamanos[etiqueta] = tamanos.get(etiqueta, 0) + 1
+        else:
+            tamanos = {None: len(registros)}
+    elif estratificado:
+        estratos = datos.get('estratos')
+        if not isinstance(estratos, dict) or not estratos:
+            return jsonify({'error': 'El muestreo estratificado requiere "estratos" ({nombre: tamaño}) o "registros"'}), 400
+        try:
+            tamanos = {nombre: int(tamano) for nombre, tamano in estratos.items()}
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Los tamaños de los estratos deben ser enteros'}), 400
+        if any(tamano < 0 for tamano in tamanos.values()):
+            return jsonify({'error': 'Los tamaños de los estratos no pueden ser negativos'}), 400
+    else:
+        try:
+            tamanos = {None: int(datos.get('poblacion'))}
+        except (TypeError, ValueError):
+            return jsonify({'error': 'Indique poblacion (entero), estratos o registros'}), 400
+    
+    error = _validar_estratos(tamanos, parametros)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    plan, asignados = planificar_muestra(tamanos, parametros)
+    
+    if etiquetas is None:
+        # Población numerada: los estratos ocupan posiciones consecutivas
+        muestra = []
+        desplazamiento = 0
+        for estrato, tamano in tamanos.items():
+            for indice in sorted(plan[estrato]):
+                elemento = {'posicion': desplazamiento + indice + 1}
+                if estratificado:
+                    elemento.update(estrato=estrato, posicion_estrato=indice + 1)
+                if registros is not None:
+                    elemento['registro'] = registros[desplazamiento + indice]
+                muestra.append(elemento)
+            desplazamiento += tamano
+    else:
+        muestra = []
+        vistos = dict.fromkeys(tamanos, 0)
+        for posicion, (registro, etiqueta) in enumerate(zip(registros, etiquetas), start=1):
+            indice = vistos[etiqueta]
+            vistos[etiqueta] += 1
+            if indice in plan[etiqueta]:
+                muestra.append({'posicion': posicion, 'estrato': etiqueta,
+                                'posicion_estrato': indice + 1, 'registro': registro})
+    
+    for numero, elemento in enumerate(muestra, start=1):
+        elemento['numero'] = numero
+    
+    resumen = _resumen_muestreo(parametros, tamanos, asignados)
+    resumen['muestra'] = muestra
+    return jsonify(resumen)
+
+def _filas_csv_muestreo(ruta):
+    """Encabezado y filas no vacías de un CSV de población, leídas una a una"""
+    with open(ruta, newline='', encoding='utf-8-sig') as archivo:
+        for fila in _lector_csv(archivo):
+            if any(valor.strip() for valor in fila):
+                yield fila
+
+def _eliminar_archivo(ruta):
+    """Borra un archivo temporal si todavía existe"""
+    try:
+        os.remove(ruta)
+    except FileNotFoundError:
+        pass
+
+def _fragmentos_muestra_csv(ruta, encabezado, columna, plan):
+    """Segunda pasada: filas elegidas con su número y posición, en CSV por fragmentos"""
+    buffer = StringIO()
+    escritor = csv.writer(buffer)
+    escritor.writerow(['muestra_numero', 'posicion'] + encabezado)
+    vistos = dict.fromkeys(plan, 0)
+    numero = 0
+    try:
+        filas = _filas_csv_muestreo(ruta)
+        next(filas, None)
+        for posicion, fila in enumerate(filas, start=1):
+            estrato = fila[columna] if columna is not None and columna < len(fila) else None
+            indice = vistos[estrato]
+            vistos[estrato] += 1
+            if indice in plan[estrato]:
+                numero += 1
+                escritor.writerow([numero, posicion] + fila)
+                if numero % MUESTREO_FILAS_POR_FRAGMENTO == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+    finally:
+        _eliminar_archivo(ruta)
+
+@app.route('/api/muestreo/csv', methods=['POST'])
+def generar_muestreo_csv():
+    """
+    Selecciona una muestra de una población en CSV (campo multipart 'archivo')
+    
+    La primera fila es el encabezado. Parámetros del formulario: tamano,
+    metodo, semilla, asignacion y, para el estratificado, estrato (nombre de
+    la columna). El archivo se recorre dos veces: la primera cuenta las filas
+    de cada estrato y la segunda envía en streaming las filas elegidas, así
+    que la memoria depende del tamaño de la muestra y no de la población.
+    La semilla y la población van en las cabeceras X-Muestreo-*.
+    """
+    archivo = request.files.get('archivo')
+    if archivo is None or not archivo.filename:
+        return jsonify({'error': 'Debe enviar el archivo en el campo "archivo"'}), 400
+    
+    parametros, error = leer_parametros_muestreo(request.form)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    descriptor, ruta = tempfile.mkstemp(prefix='muestreo_', suffix='.csv', dir=IMPORTACION_DIRECTORIO)
+    os.close(descriptor)
+    archivo.save(ruta)
+    
+    try:
+        filas = _filas_csv_muestreo(ruta)
+        encabezado = next(filas, None)
+        if encabezado is None:
+            raise ValueError('El archivo está vacío')
+        
+        columna = None
+        if parametros['metodo'] == 'estratificado':
+            nombre = request.form.get('estrato', '')
+            nombres = [valor.strip() for valor in encabezado]
+            if nombre.strip() not in nombres:
+                raise ValueError('El muestreo estratificado requiere "estrato" con una columna del encabezado')
+            columna = nombres.index(nombre.strip())
+        
+        # Primera pasada: tamaño de cada estrato
+        tamanos = {}
+        for fila in filas:
+            estrato = fila[columna] if columna is not None and columna < len(fila) else None
+            tamanos[estrato] = tamanos.get(estrato, 0) + 1
+            if len(tamanos) > MUESTREO_ESTRATOS_MAXIMOS:
+                break
+        
+        error = _validar_estratos(tamanos, parametros)
+        if error:
+            raise ValueError(error)
+        
+        plan, _ = planificar_muestra(tamanos, parametros)
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        _eliminar_archivo(ruta)
+        return jsonify({'error': f'Error leyendo el CSV: {str(e)}'}), 400
+    except Exception:
+        _eliminar_archivo(ruta)
+        raise
+    
+    # El nombre subido puede traer espacios, ';' o caracteres fuera de latin-1
+    base_descarga = secure_filename(os.path.splitext(archivo.filename)[0]) or 'datos'
+    nombre_descarga = f"muestra_{base_descarga}_{parametros['semilla']}.csv"
+    respuesta = Response(
+        _fragmentos_muestra_csv(ruta, encabezado, columna, plan),
+        mimetype='text/csv',
+        headers={
+            'Content-Disposition': f'attachment; filename={nombre_descarga}',
+            'X-Muestreo-Semilla': str(parametros['semilla']),
+            'X-Muestreo-Poblacion': str(sum(tamanos.values())),
+            'X-Muestreo-Tamano': str(parametros['tamano'])
+        }
+    )
+    # Si el generador nunca arranca (cliente que cierra antes), su finally no corre
+    respuesta.call_on_close(lambda: _eliminar_archivo(ruta))
+    return respuesta
+
+# ================================
+# CÁLCULO DEL TAMAÑO DE MUESTRA
+# ================================
+
+class TablasCuantiles:
+    """
+    Cuantiles bilaterales z y t de Student, calculados una sola vez
+    
+    Para cada nivel de confianza se guarda z y la fila t con 1..gl_maximo
+    grados de libertad (exacta: Newton sobre la CDF de t con ν entero,
+    Abramowitz y Stegun 26.7.3-4). Con más grados de libertad se usa la
+    expansión de Cornish-Fisher (26.7.5), cuyo error es menor a 1e-6. Las
+    confianzas tabuladas se llenan juntas en el primer uso y las demás a
+    medida que se piden; importar el módulo no calcula nada.
+    """
+    
+    def __init__(self, confianzas, gl_maximo):
+        self.confianzas = confianzas
+        self.gl_maximo = gl_maximo
+        self._z = {}
+        self._filas_t = {}
+        self._lock = threading.Lock()
+    
+    def _asegurar(self, confianza):
+        if confianza in self._filas_t:
+            return
+        with self._lock:
+            if not self._filas_t:
+                for tabulada in self.confianzas:
+                    self._llenar(tabulada)
+            if confianza not in self._filas_t:
+                self._llenar(confianza)
+    
+    def _llenar(self, confianza):
+        z = NormalDist().inv_cdf(1 - (1 - confianza) / 2)
+        fila = [math.inf] + [self._t_exacto(confianza, gl, z) for gl in range(1, self.gl_maximo + 1)]
+        self._z[confianza] = z
+        self._filas_t[confianza] = fila
+    
+    @staticmethod
+    def _cornish_fisher(z, gl):
+        """Aproximación de t a partir de z (funciona con escalares y arreglos NumPy)"""
+        z2 = z * z
+        g1 = (z2 + 1) * z / 4
+        g2 = ((5 * z2 + 16) * z2 + 3) * z / 96
+        g3 = (((3 * z2 + 19) * z2 + 17) * z2 - 15) * z / 384
+        g4 = ((((79 * z2 + 776) * z2 + 1482) * z2 - 1920) * z2 - 945) * z / 92160
+        return z + (g1 + (g2 + (g3 + g4 / gl) / gl) / gl) / gl
+    
+    @staticmethod
+    def _probabilidad_t(t, gl):
+        """P(|T| <= t) para la t de Student con gl entero"""
+        theta = math.atan(t / math.sqrt(gl))
+        coseno2 = math.cos(theta) ** 2
+        if gl % 2:
+            suma, termino = 0.0, 1.0
+            for k in range(1, (gl - 1) // 2 + 1):
+                suma += termino
+                termino *= coseno2 * (2 * k) / (2 * k + 1)
+            return 2 / math.pi * (theta + math.sin(theta) * math.cos(theta) * suma)
+        suma, termino = 0.0, 1.0
+        for k in range(1, gl // 2 + 1):
+            suma += termino
+            termino *= coseno2 * (2 * k - 1) / (2 * k)
+        return math.sin(theta) * suma
+    
+    def _t_exacto(self, confianza, gl, z):
+        if gl == 1:
+            return math.tan(math.pi * confianza / 2)
+        if gl == 2:
+            return confianza * math.sqrt(2 / (1 - confianza * confianza))
+        t = self._cornish_fisher(z, gl)
+        constante = math.exp(math.lgamma((gl + 1) / 2) - math.lgamma(gl / 2)) / math.sqrt(gl * math.pi)
+        for _ in range(20):
+            densidad = constante * (1 + t * t / gl) ** (-(gl + 1) / 2)
+            paso = (self._probabilidad_t(t, gl) - confianza) / (2 * densidad)
+            t -= paso
+            if abs(paso) < 1e-12 * t:
+                break
+        return t
+    
+    def z(self, confianza):
+        self._asegurar(confianza)
+        return self._z[confianza]
+    
+    def t(self, confianza, gl):
+        self._asegurar(confianza)
+        if gl <= self.gl_maximo:
+            return self._filas_t[confianza][gl]
+        return self._cornish_fisher(self._z[confianza], gl)
+    
+    def arreglos(self, confianzas):
+        """(z, matriz t) de cada confianza única, para indexar grillas con NumPy"""
+        for confianza in confianzas:
+            self._asegurar(confianza)
+        return (np.array([self._z[confianza] for confianza in confianzas]),
+                np.array([self._filas_t[confianza] for confianza in confianzas]))
+
+cuantiles = TablasCuantiles(CONFIANZAS_TABULADAS, CUANTILES_T_GL_MAXIMO)
+
+def _redondear_muestra(n):
+    """Tamaño entero de la muestra: hacia arriba, sin que el redondeo binario sume uno"""
+    return math.ceil(round(n, 9))
+
+def _tamano_infinito(tipo, cuantil, error, proporcion, desviacion):
+    """n0 para población infinita (funciona con escalares y arreglos NumPy)"""
+    if tipo == 'atributos':
+        return cuantil * cuantil * proporcion * (1 - proporcion) / (error * error)
+    return (cuantil * desviacion / error) ** 2
+
+def _ajustar_poblacion(n0, poblacion):
+    """Corrección por población finita n0 / (1 + n0/N); N infinito deja n0"""
+    return n0 / (1 + n0 / poblacion)
+
+def _leer_parametro(datos, nombre, minimo, maximo, defecto=None, entero=False):
+    """Valor o lista de valores de un parámetro, validado; devuelve (valores, error)"""
+    valor = datos.get(nombre, defecto)
+    valores = valor if isinstance(valor, list) else [valor]
+    if not valores:
+        return None, f'{nombre} no puede ser una lista vacía'
+    convertidos = []
+    for elemento in valores:
+        if elemento is None and nombre == 'poblacion':
+            convertidos.append(math.inf)
+            continue
+        try:
+            elemento = float(elemento)
+        except (TypeError, ValueError):
+            return None, f'{nombre} debe ser numérico'
+        if entero:
+            # int() truncaría 1000.7 a 1000 sin avisar
+            if not elemento.is_integer():
+                return None, f'{nombre} debe ser un entero'
+            elemento = int(elemento)
+        if not minimo < elemento < maximo:
+            if maximo == math.inf:
+                return None, f'{nombre} debe ser mayor que {minimo}'
+            return None, f'{nombre} debe estar entre {minimo} y {maximo} (sin incluirlos)'
+        convertidos.append(elemento)
+    return (convertidos if isinstance(valor, list) else convertidos[0]), None
+
+def calcular_tamano_muestra(tipo, confianza, error, poblacion, proporcion, desviacion, distribucion):
+    """
+    Tamaño de muestra para estimar una proporción (atributos) o una media (variables)
+    
+    n0 = Z²·P·(1-P)/E² o (Z·σ/E)², y n = n0 / (1 + n0/N), como en el papel de
+    trabajo de cálculo de la muestra. Con distribucion 't' (variables) se
+    itera con t de n-1 grados de libertad hasta que n no cambia.
+    """
+    cuantil = cuantiles.z(confianza)
+    n0 = _tamano_infinito(tipo, cuantil, error, proporcion, desviacion)
+    n = _ajustar_poblacion(n0, poblacion)
+    gl = None
+    if distribucion == 't':
+        for _ in range(50):
+            gl = max(1, _redondear_muestra(n) - 1)
+            cuantil = cuantiles.t(confianza, gl)
+            n0 = _tamano_infinito(tipo, cuantil, error, proporcion, desviacion)
+            n = _ajustar_poblacion(n0, poblacion)
+            if max(1, _redondear_muestra(n) - 1) == gl:
+                break
+    
+    tamano = min(_redondear_muestra(n), poblacion)
+    resultado = {
+        'cuantil': round(cuantil, 6),
+        'grados_libertad': gl,
+        'tamano_infinito': round(n0, 4),
+        'tamano_ajustado': round(n, 4),
+        'tamano': int(tamano)
+    }
+    if poblacion != math.inf:
+        resultado['intervalo_muestreo'] = round(poblacion / tamano, 4)
+    return resultado
+
+def calcular_intervalo_confianza(tipo, confianza, poblacion, resultados):
+    """
+    Intervalo de confianza de la proporción o la media observadas en la muestra
+    
+    resultados: {'muestra', 'exitos'} para atributos o {'muestra', 'media',
+    'desviacion'} para variables. El error estándar lleva la corrección
+    sqrt((N-n)/(N-1)) si se conoce la población; para variables se usa t
+    con n-1 grados de libertad y, con N, también se estima el total.
+    """
+    n = int(resultados['muestra'])
+    if n < 1 or (poblacion != math.inf and n > poblacion):
+        raise ValueError('resultados.muestra debe estar entre 1 y la población')
+    correccion = math.sqrt((poblacion - n) / (poblacion - 1)) if poblacion != math.inf and poblacion > 1 else 1.0
+    
+    if tipo == 'atributos':
+        exitos = int(resultados['exitos'])
+        if not 0 <= exitos <= n:
+            raise ValueError('resultados.exitos debe estar entre 0 y resultados.muestra')
+        estimacion = exitos / n
+        margen = cuantiles.z(confianza) * math.sqrt(estimacion * (1 - estimacion) / n) * correccion
+        intervalo = {
+            'estimacion': round(estimacion, 6),
+            'margen': round(margen, 6),
+            'limite_inferior': round(max(0.0, estimacion - margen), 6),
+            'limite_superior': round(min(1.0, estimacion + margen), 6)
+        }
+    else:
+        if n < 2:
+            raise ValueError('resultados.muestra debe ser al menos 2 para variables')
+        media = float(resultados['media'])
+        desviacion = float(resultados['desviacion'])
+        margen = cuantiles.t(confianza, n - 1) * desviacion / math.sqrt(n) * correccion
+        intervalo = {
+            'estimacion': round(media, 6),
+            'margen': round(margen, 6),
+            'limite_inferior': round(media - margen, 6),
+            'limite_superior': round(media + margen, 6)
+        }
+        if poblacion != math.inf:
+            intervalo['total'] = {
+                'estimacion': round(poblacion * media, 2),
+                'limite_inferior': round(poblacion * (media - margen), 2),
+                'limite_superior': round(poblacion * (media + margen), 2)
+            }
+    return intervalo
+
+def calcular_grilla_tamano(tipo, valores, distribucion):
+    """
+    Tamaños de muestra para el producto cartesiano de los parámetros (NumPy)
+    
+    `valores` es {parámetro: lista} en el orden de los ejes. Los cuantiles
+    salen de las tablas con un solo índice por celda; con distribucion 't'
+    todas las celdas iteran juntas hasta que ninguna cambia.
+    Devuelve los arreglos (tamano, intervalo_muestreo), con NaN en el
+    intervalo cuando la población es infinita.
+    """
+    confianzas = valores['confianza']
+    mallas = np.meshgrid(*[np.arange(len(lista)) for lista in valores.values()], indexing='ij')
+    indices = dict(zip(valores, mallas))
+    columna = {nombre: np.asarray(lista, dtype=float)[indices[nombre]] for nombre, lista in valores.items()}
+    proporcion, desviacion = columna.get('proporcion'), columna.get('desviacion')
+    
+    tabla_z, tabla_t = cuantiles.arreglos(confianzas)
+    indice_confianza = indices['confianza']
+    cuantil = tabla_z[indice_confianza]
+    n0 = _tamano_infinito(tipo, cuantil, columna['error'], proporcion, desviacion)
+    n = _ajustar_poblacion(n0, columna['poblacion'])
+    
+    if distribucion == 't':
+        gl = None
+        for _ in range(50):
+            nuevo_gl = np.maximum(1, np.ceil(np.round(n, 9)) - 1).astype(np.int64)
+            if gl is not None and np.array_equal(nuevo_gl, gl):
+                break
+            gl = nuevo_gl
+            cuantil = np.where(
+                gl <= CUANTILES_T_GL_MAXIMO,
+                tabla_t[indice_confianza, np.minimum(gl, CUANTILES_T_GL_MAXIMO)],
+                TablasCuantiles._cornish_fisher(tabla_z[indice_confianza], gl)
+            )
+            n0 = _tamano_infinito(tipo, cuantil, columna['error'], proporcion, desviacion)
+            n = _ajustar_poblacion(n0, columna['poblacion'])
+    
+    tamano = np.minimum(np.ceil(np.round(n, 9)), columna['poblacion'])
+    intervalo = np.where(np.isfinite(columna['poblacion']), np.round(columna['poblacion'] / tamano, 4), np.nan)
+    return tamano.astype(np.int64), intervalo
 
-@app.route('/api/valorar', methods=['POST'])
-def valorar_software():
-    """Endpoint principal para valorar software"""
-    try:
-        datos = request.get_json()
-        
-        if not datos:
-            return jsonify({'error': 'No se recibieron datos'}), 400
-        
-        # Validaciones básicas
-        if 'tipo_software' not in datos:
-            return jsonify({'error': 'tipo_software es requerido'}), 400
-        
-        if 'tecnologia_principal' not in datos:
-            return jsonify({'error': 'tecnologia_principal es requerido'}), 400
-        
-        # === VALIDACIÓN Y LIMPIEZA DE DATOS NUMÉRICOS ===
-        # Función para convertir valores seguros
-        def safe_int(value, default=0):
-            if value is None or value == '' or value == 'None':
-                return default
-            try:
-                return int(float(value))
-            except (ValueError, TypeError):
-                return default
-                
-        def safe_float(value, default=0.0):
-            if value is None or value == '' or value == 'None':
-                return default
-            try:
-                return float(value)
-            except (ValueError, TypeError):
-                return default
-        
-        # Limpiar campos numéricos críticos
-        datos['usuarios_concurrentes'] = safe_int(datos.get('usuarios_concurrentes'), 1)
-        datos['usuarios_totales'] = safe_int(datos.get('usuarios_totales'), 1)
-        datos['integraciones_externas'] = safe_int(datos.get('integraciones_externas'), 0)
-        datos['antiguedad_anos'] = safe_float(datos.get('antiguedad_anos'), 0.0)
-        datos['criticidad_negocio'] = safe_int(datos.get('criticidad_negocio'), 3)
-        datos['tiempo_desarrollo_meses'] = safe_float(datos.get('tiempo_desarrollo_meses'), 0.0)
-        datos['ahorro_anual_cop'] = safe_int(datos.get('ahorro_anual_cop'), 0)
-        datos['inversion_original_cop'] = safe_int(datos.get('inversion_original_cop'), 0)
-        
-        # Validar rangos
-        if datos['usuarios_concurrentes'] < 1:
-            datos['usuarios_concurrentes'] = 1
-        if datos['criticidad_negocio'] < 1 or datos['criticidad_negocio'] > 5:
-            datos['criticidad_negocio'] = 3
-        
-        # Calcular valoración
-        resultado = motor.calcular_valor(datos)
-        
-        if 'error' in resultado:
-            return jsonify(resultado), 500
-        
+@app.route('/api/muestreo/tamano', methods=['POST'])
+def calcular_tamano():
+    """
+    Tamaño de muestra e intervalos para atributos o variables
+    
+    Parámetros: tipo (atributos o variables), confianza (0-1), error
+    (proporción en atributos, unidades de la variable en variables),
+    poblacion (N, opcional = infinita), proporcion esperada (atributos, 0.5
+    por defecto), desviacion (variables) y distribucion (z o t, variables).
+    Con 'resultados' se agrega el intervalo de confianza de lo observado.
+    
+    Si confianza, error, poblacion, proporcion o desviacion es una lista,
+    se evalúa la grilla completa en una sola pasada (requiere NumPy) y se
+    devuelven matrices con un eje por cada parámetro con lista.
+    """
+    datos = request.get_json(silent=True)
+    if not isinstance(datos, dict):
+        return jsonify({'error': 'No se recibieron datos'}), 400
+    
+    tipo = datos.get('tipo', 'atributos')
+    if tipo not in TIPOS_TAMANO_MUESTRA:
+        return jsonify({'error': f'tipo debe ser uno de: {", ".join(TIPOS_TAMANO_MUESTRA)}'}), 400
+    distribucion = datos.get('distribucion', 'z') if tipo == 'variables' else 'z'
+    if distribucion not in ('z', 't'):
+        return jsonify({'error': 'distribucion debe ser z o t'}), 400
+    if tipo == 'variables' and datos.get('desviacion') is None:
+        return jsonify({'error': 'El muestreo de variables requiere desviacion'}), 400
+    
+    # proporcion solo aplica a atributos y desviacion solo a variables
+    parametros = {}
+    for nombre, minimo, maximo, defecto, entero in (
+        ('confianza', 0.5, 1, 0.95, False),
+        ('error', 0, math.inf, None, False),
+        ('poblacion', 0, math.inf, None, True),
+        ('proporcion' if tipo == 'atributos' else 'desviacion', 0, 1 if tipo == 'atributos' else math.inf, 0.5, False)
+    ):
+        if nombre == 'poblacion' and datos.get('poblacion') is None:
+            parametros[nombre] = math.inf
+            continue
+        valor, error = _leer_parametro(datos, nombre, minimo, maximo, defecto, entero)
+        if error:
+            return jsonify({'error': error}), 400
+        parametros[nombre] = valor
+    parametros.setdefault('proporcion', None)
+    parametros.setdefault('desviacion', None)
+    
+    ejes = {nombre: valor for nombre, valor in parametros.items() if isinstance(valor, list)}
+    if ejes:
+        if not NUMPY_AVAILABLE:
+            return jsonify({'error': 'NumPy no está instalado. Ejecute: pip install numpy'}), 500
+        if math.prod(len(valores) for valores in ejes.values()) > MUESTREO_GRILLA_MAXIMA:
+            return jsonify({'error': f'La grilla supera {MUESTREO_GRILLA_MAXIMA} combinaciones'}), 400
+        valores = {nombre: valor if isinstance(valor, list) else [valor]
+                   for nombre, valor in parametros.items() if valor is not None}
+        tamano, intervalo = calcular_grilla_tamano(tipo, valores, distribucion)
+        
+        # Las matrices solo conservan los ejes pedidos como lista
+        forma = [len(valores) for valores in ejes.values()]
+        intervalo = intervalo.astype(object)
+        intervalo[np.isnan(intervalo.astype(float))] = None
         return jsonify({
-            'success': True,
-            'valoracion': resultado,
-            'timestamp': datetime.now().isoformat()
+            'tipo': tipo,
+            'distribucion': distribucion,
+            'fijos': {nombre: (None if valor == math.inf else valor)
+                      for nombre, valor in parametros.items() if nombre not in ejes and valor is not None},
+            'ejes': [{'parametro': nombre, 'valores': [None if valor == math.inf else valor for valor in lista]}
+                     for nombre, lista in ejes.items()],
+            'tamano': tamano.reshape(forma).tolist(),
+            'intervalo_muestreo': intervalo.reshape(forma).tolist()
         })
-        
-    except Exception as e:
-        return jsonify({'error': f'Error interno: {str(e)}'}), 500
-
-@app.route('/api/ejemplo-auditoria', methods=['GET'])
-def obtener_ejemplo_auditoria():
-    """Devuelve datos de ejemplo para un sistema de auditoría en Access"""
-    ejemplo_datos = {
-        'tipo_software': 'sistema_auditoria',
-        'tecnologia_principal': 'access_vba',
-        'antiguedad_anos': 2,
-        'en_uso_activo': True,
-        'sector': 'publico',
-        'descripcion': 'El software es una herramienta que facilita la auditoría interna para municipios de sexta categoría de Colombia',
-        'usuarios_concurrentes': 3,  # 2-5 usuarios
-        'usuarios_totales': 2,
-        'base_datos_tipo': 'local',
-        'integraciones_externas': 0,
-        'volumen_datos': 'pequeno',
-        'arquitectura': 'monolitica',
-        'funcionalidades': {
-            'autenticacion_avanzada': True,
-            'reportes_complejos': True,
-            'workflow_aprobaciones': True,
-            'dashboard_ejecutivo': True,
-            'auditoria_logs': True
-        },
-        'iso25010': {
-            'security': 2,
-            'functional_suitability': 3,
-            'reliability': 3,
-            'maintainability': 4,
-            'performance_efficiency': 3,
-            'usability': 4,
-            'compatibility': 4,
-            'portability': 5,
-            'flexibility': 4
-        },
-        'tipo_valoracion': 'conservadora',
-        'nivel_certeza': 'media',
-        'contexto_desarrollo': {
-            'desarrollo_interno': True,
-            'tiempo_parcial': True,
-            'aprendizaje_tecnologia': True,
-            'prototipo_iterativo': True,
-            'sin_metodologia': True
-        },
-        'criticidad_negocio': 2,
-        'conoce_tiempo_desarrollo': 'no',
-        'conoce_inversion': 'no',
-        'conoce_ahorros': 'no',
-        'genera_reportes_oficiales': True,
-        'requiere_auditoria_logs': True,
-        'maneja_datos_personales': True,
-        'decreto_648': True,
-        'observaciones': 'El aplicativo presenta una estructura operativa bien organizada y se encuentra alineado con los lineamientos del Decreto 648 de 2017, lo que evidencia una adecuada comprensión de los requerimientos normativos. Desde el punto de vista técnico, el código desarrollado en VBA muestra una estructura clara y mantenible, con una mínima presencia de código espagueti. Se evidencian buenas prácticas en la separación de funcionalidades mediante módulos, lo que facilita su comprensión, mantenimiento y escalabilidad dentro del entorno de Access.'
+    
+    resultado = {
+        'tipo': tipo,
+        'distribucion': distribucion,
+        'confianza': parametros['confianza'],
+        'error': parametros['error'],
+        'poblacion': None if parametros['poblacion'] == math.inf else parametros['poblacion']
     }
+    if tipo == 'atributos':
+        resultado['proporcion'] = parametros['proporcion']
+    else:
+        resultado['desviacion'] = parametros['desviacion']
+    resultado.update(calcular_tamano_muestra(tipo, distribucion=distribucion, **parametros))
     
-    return jsonify({
-        'success': True,
-        'datos': ejemplo_datos,
-        'descripcion': 'Sistema de Auditoría Municipal - Caso de Uso Real'
-    })
+    if datos.get('resultados') is not None:
+        try:
+            resultado['intervalo_confianza'] = calcular_intervalo_confianza(
+                tipo, parametros['confianza'], parametros['poblacion'], datos['resultados']
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            return jsonify({'error': f'resultados inválidos: {str(e)}'}), 400
+    
+    return jsonify(resultado)
 
-@app.route('/api/historico', methods=['GET'])
-def obtener_historico():
-    """Obtiene el histórico de valoraciones"""
-    try:
-        conn = sqlite3.connect('valoraciones.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT id, fecha_creacion, tipo_software, tecnologia_principal, 
-                   valor_minimo, valor_maximo, factor_confianza
-            FROM valoraciones 
-            ORDER BY fecha_creacion DESC 
-            LIMIT 50
-        ''')
-        
-        valoraciones = []
-        for row in cursor.fetchall():
-            valoraciones.append({
-                'id': row[0],
-                'fecha': row[1],
-                'tipo_software': row[2],
-                'tecnologia': row[3],
-                'valor_minimo': row[4],
-                'valor_maximo': row[5],
-                'confianza': row[6]
-            })
-        
-        conn.close()
-        
-        return jsonify({
-            'valoraciones': valoraciones,
-            'total': len(valoraciones)
-        })
-        
-    except Exception as e:
-        return jsonify({'error': f'Error consultando histórico: {str(e)}'}), 500
+# ================================
+# CACHÉ DE REPORTES PDF
+# ================================
 
-@app.route('/api/estadisticas', methods=['GET'])
-def obtener_estadisticas():
-    """Estadísticas del sistema"""
-    try:
-        conn = sqlite3.connect('valoraciones.db')
-        cursor = conn.cursor()
-        
-        # Total de valoraciones
-        cursor.execute('SELECT COUNT(*) FROM valoraciones')
-        total_valoraciones = cursor.fetchone()[0]
-        
-        # Valor promedio
-        cursor.execute('SELECT AVG((valor_minimo + valor_maximo) / 2) FROM valoraciones')
-        valor_promedio = cursor.fetchone()[0] or 0
-        
-        # Tecnología más valorada
-        cursor.execute('''
-            SELECT tecnologia_principal, COUNT(*) as cantidad 
-            FROM valoraciones 
-            GROUP BY tecnologia_principal 
-            ORDER BY cantidad DESC 
-            LIMIT 1
-        ''')
-        tech_result = cursor.fetchone()
-        tech_popular = tech_result[0] if tech_result else 'N/A'
-        
-        conn.close()
-        
-        return jsonify({
-            'total_valoraciones': total_valoraciones,
-            'valor_promedio': round(valor_promedio),
-            'tecnologia_mas_valorada': tech_popular,
-            'factores_tecnologia': len(FACTORES_TECNOLOGIA),
-            'version_sistema': '1.0'
-        })
-        
-    except Exception as e:
-        return jsonify({'error': f'Error en estadísticas: {str(e)}'}), 500
+class CachePDF:
+    """
+    Caché LRU en memoria de reportes PDF ya generados, limitada en bytes
+    
+    Las valoraciones guardadas no cambian, así que el PDF de un id puede
+    servirse desde memoria indefinidamente. Cada entrada guarda también su
+    ETag (hash del contenido) para responder 304 a descargas repetidas.
+    """
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+    
+    def obtener(self, valoracion_id):
+        """Devuelve (contenido, etag) o None, marcando la entrada como reciente"""
+        with self._lock:
+            entrada = self._entradas.get(valoracion_id)
+            if entrada is not None:
+                self._entradas.move_to_end(valoracion_id)
+            return entrada
+    
+    def guardar(self, valoracion_id, contenido):
+        """Guarda un PDF, expulsando los menos usados si se supera el límite"""
+        entrada = (contenido, hashlib.sha256(contenido).hexdigest()[:32])
+        if len(contenido) > self.max_bytes:
+            return entrada  # No cabe: se sirve sin guardar
+        
+        with self._lock:
+            anterior = self._entradas.pop(valoracion_id, None)
+            if anterior is not None:
+                self._bytes -= len(anterior[0])
+            self._entradas[valoracion_id] = entrada
+            self._bytes += len(contenido)
+            while self._bytes > self.max_bytes:
+                _, expulsada = self._entradas.popitem(last=False)
+                self._bytes -= len(expulsada[0])
+        return entrada
+    
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._bytes = 0
+
+cache_pdf = CachePDF(PDF_CACHE_MB * 1024 * 1024)
 
 def generar_pdf_reporte(valoracion_id):
     """
@@ -1056,24 +5105,20 @@ def generar_pdf_reporte(valoracion_id):
     if not REPORTLAB_AVAILABLE:
         return None, "ReportLab no está instalado. Ejecute: pip install reportlab"
     
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+    
     try:
         # Obtener datos de la valoración
-        conn = sqlite3.connect('valoraciones.db')
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT * FROM valoraciones WHERE id = ?
-        ''', (valoracion_id,))
-        
-        valoracion = cursor.fetchone()
+        valoracion = cargar_valoracion(valoracion_id)
         if not valoracion:
             return None, "Valoración no encontrada"
         
-        # Parsear datos JSON
-        respuestas = json.loads(valoracion[4]) if valoracion[4] else {}
-        desglose = json.loads(valoracion[8]) if valoracion[8] else {}
-        
-        conn.close()
+        respuestas = valoracion['respuestas']
+        desglose = valoracion['desglose']
         
         # Crear buffer para PDF
         buffer = BytesIO()
@@ -1150,9 +5195,9 @@ def generar_pdf_reporte(valoracion_id):
             descripcion = descripcion[:150] + "..."
         
         info_data = [
-            ["Fecha de valoración:", valoracion[1][:10] if valoracion[1] else "N/A"],
-            ["Tipo de software:", (valoracion[2] or "N/A").replace('_', ' ').title()],
-            ["Tecnología principal:", (valoracion[3] or "N/A").replace('_', ' ').title()],
+            ["Fecha de valoración:", valoracion['fecha_creacion'][:10] if valoracion['fecha_creacion'] else "N/A"],
+            ["Tipo de software:", (valoracion['tipo_software'] or "N/A").replace('_', ' ').title()],
+            ["Tecnología principal:", (valoracion['tecnologia_principal'] or "N/A").replace('_', ' ').title()],
             ["Descripción:", descripcion],
             ["Sector:", respuestas.get('sector', 'No especificado').title()],
             ["Usuarios totales:", str(respuestas.get('usuarios_totales', 'No especificado'))],
@@ -1181,16 +5226,16 @@ def generar_pdf_reporte(valoracion_id):
         # === RESULTADOS ECONÓMICOS DESTACADOS ===
         story.append(Paragraph("RESULTADOS ECONÓMICOS", heading_style))
         
-        valor_min = f"${valoracion[5]:,.0f} COP" if valoracion[5] else "N/A"
-        valor_max = f"${valoracion[6]:,.0f} COP" if valoracion[6] else "N/A"
-        valor_promedio = f"${(valoracion[5] + valoracion[6])/2:,.0f} COP" if valoracion[5] and valoracion[6] else "N/A"
+        valor_min = f"${valoracion['valor_minimo']:,.0f} COP" if valoracion['valor_minimo'] else "N/A"
+        valor_max = f"${valoracion['valor_maximo']:,.0f} COP" if valoracion['valor_maximo'] else "N/A"
+        valor_promedio = f"${(valoracion['valor_minimo'] + valoracion['valor_maximo'])/2:,.0f} COP" if valoracion['valor_minimo'] and valoracion['valor_maximo'] else "N/A"
         
         resultado_data = [
             ["💰 VALORACIÓN ECONÓMICA", ""],
             ["Valor mínimo estimado:", valor_min],
             ["Valor máximo estimado:", valor_max],
             ["Valor promedio:", valor_promedio],
-            ["Nivel de confianza:", f"{valoracion[7]*100:.0f}%" if valoracion[7] else "N/A"],
+            ["Nivel de confianza:", f"{valoracion['factor_confianza']*100:.0f}%" if valoracion['factor_confianza'] else "N/A"],
             ["Metodología aplicada:", "ISO 25010:2023 + COCOMO + Colombia 2025"],
         ]
         
@@ -1476,29 +5521,392 @@ def generar_pdf_reporte(valoracion_id):
     except Exception as e:
         return None, f"Error generando PDF: {str(e)}"
 
+# ================================
+# COLA DE RENDERIZADO DE PDF
+# ================================
+
+def _renderizar_pdf(valoracion_id, ruta_perfil=None):
+    """Tarea del pool: genera el PDF y devuelve (contenido, error)"""
+    if ruta_perfil:
+        # La solicitud que lo pidió se está perfilando: el worker guarda su propio pstats
+        perfil = cProfile.Profile()
+        try:
+            return perfil.runcall(_renderizar_pdf, valoracion_id)
+        finally:
+            perfil.dump_stats(ruta_perfil)
+    buffer, error = generar_pdf_reporte(valoracion_id)
+    if error:
+        return None, error
+    if not buffer:
+        return None, 'No se pudo generar el PDF'
+    return buffer.getvalue(), None
+
+class ColaPDF:
+    """
+    Renderizado de reportes PDF fuera del hilo de la solicitud
+    
+    Los PDF se generan en un pool de procesos (ReportLab es CPU intensivo y no
+    libera el GIL), de modo que los workers de Flask quedan libres para
+    /api/valorar. Cada PDF terminado se guarda en cache_pdf.
+    """
+    
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._trabajos = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                if self.workers > 0:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=CONTEXTO_PROCESOS)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+            return self._executor
+    
+    def enviar(self, valoracion_id, guardar_en_cache=True):
+        """Programa la generación del PDF y devuelve el future (contenido, error)"""
+        # Si la valoración aún está en la escritura diferida, esperar a que se guarde;
+        # si no se pudo guardar, el future lleva el error
+        try:
+            escritor_diferido.esperar(valoracion_id)
+        except ErrorEscrituraDiferida as e:
+            future = Future()
+            future.set_exception(e)
+            return future
+        inicio = time.perf_counter()
+        future = self._pool().submit(_renderizar_pdf, valoracion_id, perfilador.archivo_auxiliar('pdf'))
+        
+        if metricas.activas:
+            def _medir(f):
+                error = f.cancelled() or f.exception() is not None or f.result()[1]
+                metricas.observar('pdf_generacion_segundos', time.perf_counter() - inicio)
+                metricas.incrementar('pdf_reportes_total', resultado='error' if error else 'ok')
+            future.add_done_callback(_medir)
+        
+        def _guardar_en_cache(f):
+            if not f.cancelled() and f.exception() is None:
+                contenido, error = f.result()
+                if contenido:
+                    cache_pdf.guardar(valoracion_id, contenido)
+        
+        if guardar_en_cache:
+            future.add_done_callback(_guardar_en_cache)
+        return future
+    
+    def renderizar_muchos(self, valoraciones_ids):
+        """
+        Genera en paralelo los PDF de muchas valoraciones
+        
+        Produce (valoracion_id, contenido, error) en el orden en que terminan.
+        Solo mantiene en vuelo unos pocos trabajos por proceso, así que la
+        memoria no crece con el número de ids. Los resultados no se guardan
+        en la caché para no expulsar los reportes de uso frecuente.
+        """
+        en_vuelo = 2 * max(1, self.workers)
+        ids = iter(valoraciones_ids)
+        pendientes = {}
+        agotado = False
+        
+        try:
+            while True:
+                while not agotado and len(pendientes) < en_vuelo:
+                    valoracion_id = next(ids, None)
+                    if valoracion_id is None:
+                        agotado = True
+                        break
+                    entrada = cache_pdf.obtener(valoracion_id)
+                    if entrada is not None:
+                        yield valoracion_id, entrada[0], None
+                    else:
+                        pendientes[self.enviar(valoracion_id, guardar_en_cache=False)] = valoracion_id
+                
+                if not pendientes:
+                    return
+                
+                listos, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for future in listos:
+                    valoracion_id = pendientes.pop(future)
+                    try:
+                        contenido, error = future.result()
+                    except Exception as e:
+                        contenido, error = None, f'Error generando PDF: {str(e)}'
+                    yield valoracion_id, contenido, error
+        finally:
+            # Si el cliente abandona la descarga, no seguir renderizando
+            for future in pendientes:
+                future.cancel()
+    
+    def renderizar(self, valoracion_id):
+        """Obtiene el PDF desde caché o lo genera en el pool, esperando el resultado"""
+        entrada = cache_pdf.obtener(valoracion_id)
+        if entrada is not None:
+            return entrada, None
+        
+        # Escritura diferida fallida o pool de procesos roto: error como los demás
+        try:
+            contenido, error = self.enviar(valoracion_id).result()
+        except Exception as e:
+            contenido, error = None, f'Error generando PDF: {str(e)}'
+        if error:
+            return None, error
+        return cache_pdf.obtener(valoracion_id) or cache_pdf.guardar(valoracion_id, contenido), None
+    
+    def crear_trabajo(self, valoracion_id):
+        """Registra un trabajo asíncrono de PDF y devuelve su id"""
+        trabajo_id = str(uuid.uuid4())
+        trabajo = {
+            'id': trabajo_id,
+            'valoracion_id': valoracion_id,
+            'creado': datetime.now().isoformat(),
+            'future': None,
+            'entrada': cache_pdf.obtener(valoracion_id)
+        }
+        if trabajo['entrada'] is None:
+            trabajo['future'] = self.enviar(valoracion_id)
+        
+        with self._lock:
+            self._trabajos[trabajo_id] = trabajo
+            self._depurar()
+        return trabajo_id
+    
+    def _depurar(self):
+        """Descarta los trabajos terminados más antiguos por encima del máximo"""
+        exceso = len(self._trabajos) - PDF_TRABAJOS_MAXIMOS
+        for trabajo_id in list(self._trabajos):
+            if exceso <= 0:
+                break
+            future = self._trabajos[trabajo_id]['future']
+            if future is None or future.done():
+                del self._trabajos[trabajo_id]
+                exceso -= 1
+    
+    def estado(self, trabajo_id):
+        """Devuelve el estado público de un trabajo, o None si no existe"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None:
+            return None
+        
+        future = trabajo['future']
+        error = None
+        if future is None:
+            estado = 'completado'
+        elif not future.done():
+            estado = 'en_proceso' if future.running() else 'pendiente'
+        elif future.cancelled():
+            estado, error = 'error', 'Trabajo cancelado'
+        elif future.exception() is not None:
+            estado, error = 'error', f'Error generando PDF: {future.exception()}'
+        else:
+            contenido, error = future.result()
+            estado = 'error' if error else 'completado'
+        
+        return {
+            'job_id': trabajo['id'],
+            'valoracion_id': trabajo['valoracion_id'],
+            'creado': trabajo['creado'],
+            'estado': estado,
+            'error': error
+        }
+    
+    def resultado(self, trabajo_id):
+        """Devuelve (contenido, etag) de un trabajo completado, o None"""
+        with self._lock:
+            trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None:
+            return None
+        if trabajo['entrada'] is None:
+            future = trabajo['future']
+            if not future.done() or future.cancelled() or future.exception() is not None:
+                return None
+            contenido, error = future.result()
+            if error:
+                return None
+            # Se conserva en el trabajo aunque luego salga de la caché LRU
+            trabajo['entrada'] = cache_pdf.obtener(trabajo['valoracion_id']) or cache_pdf.guardar(trabajo['valoracion_id'], contenido)
+        return trabajo['entrada']
+    
+    def cerrar(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+cola_pdf = ColaPDF(PDF_WORKERS)
+atexit.register(cola_pdf.cerrar)
+
 @app.route('/api/generar-pdf/<valoracion_id>')
 def generar_pdf_endpoint(valoracion_id):
-    """Endpoint para generar y descargar PDF"""
-    buffer, error = generar_pdf_reporte(valoracion_id)
+    """Endpoint para generar y descargar PDF (servido desde caché si ya existe)"""
+    entrada, error = cola_pdf.renderizar(valoracion_id)
     
     if error:
         return jsonify({'error': error}), 500
     
-    if not buffer:
-        return jsonify({'error': 'No se pudo generar el PDF'}), 500
+    return _enviar_pdf(valoracion_id, entrada)
+
+def _enviar_pdf(valoracion_id, entrada):
+    """Respuesta de descarga para un PDF en caché (contenido, etag)"""
+    contenido, etag = entrada
     
+    # conditional=True responde 304 si el If-None-Match coincide con el ETag
     return send_file(
-        buffer,
+        BytesIO(contenido),
         as_attachment=True,
         download_name=f'valoracion_{valoracion_id[:8]}.pdf',
-        mimetype='application/pdf'
+        mimetype='application/pdf',
+        etag=etag,
+        conditional=True
+    )
+
+class _SalidaZip:
+    """Destino no posicionable para zipfile que acumula bytes hasta vaciarlos"""
+    
+    def __init__(self):
+        self._partes = []
+    
+    def write(self, datos):
+        self._partes.append(bytes(datos))
+        return len(datos)
+    
+    def flush(self):
+        pass
+    
+    def vaciar(self):
+        partes, self._partes = self._partes, []
+        return partes
+
+def _parsear_fecha(valor, nombre):
+    """Convierte AAAA-MM-DD en datetime; lanza ValueError con mensaje claro"""
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError(f'{nombre} debe tener formato AAAA-MM-DD')
+
+def _iterar_ids_por_fecha(desde, hasta, tamano_pagina=500):
+    """
+    Recorre por índice los ids de valoraciones en [desde, hasta], por páginas
+    
+    Cada página es una consulta corta por clave (fecha_creacion, id) que se
+    lee completa: entre páginas no queda ningún cursor abierto, así que el
+    ZIP no fija una instantánea WAL durante toda la descarga ni usa la
+    conexión de otro hilo (con el puente ASGI cada next() puede correr en un
+    hilo distinto).
+    """
+    clave = (desde.strftime('%Y-%m-%d'), '')
+    fin = (hasta + timedelta(days=1)).strftime('%Y-%m-%d')
+    while True:
+        filas = db.consultar('''
+            SELECT fecha_creacion, id FROM valoraciones
+            WHERE (fecha_creacion, id) > (?, ?) AND fecha_creacion < ?
+            ORDER BY fecha_creacion, id
+            LIMIT ?
+        ''', (*clave, fin, tamano_pagina))
+        for _, valoracion_id in filas:
+            yield valoracion_id
+        if len(filas) < tamano_pagina:
+            return
+        clave = filas[-1]
+
+@app.route('/api/exportar-pdf', methods=['GET'])
+def exportar_pdf_zip():
+    """
+    Exporta en un ZIP los PDF de todas las valoraciones de un rango de fechas
+    
+    Parámetros: desde y hasta (AAAA-MM-DD, ambos inclusive). Los PDF se
+    generan en paralelo y cada uno se envía al cliente apenas termina, con
+    transferencia por fragmentos; el archivo nunca se arma completo en memoria.
+    """
+    if not REPORTLAB_AVAILABLE:
+        return jsonify({'error': 'ReportLab no está instalado. Ejecute: pip install reportlab'}), 500
+    
+    try:
+        desde = _parsear_fecha(request.args.get('desde'), 'desde')
+        hasta = _parsear_fecha(request.args.get('hasta'), 'hasta')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if hasta < desde:
+        return jsonify({'error': 'hasta debe ser posterior o igual a desde'}), 400
+    
+    def generar():
+        salida = _SalidaZip()
+        errores = []
+        # Los PDF ya vienen comprimidos: se almacenan sin volver a comprimir
+        with zipfile.ZipFile(salida, 'w', zipfile.ZIP_STORED) as archivo_zip:
+            for valoracion_id, contenido, error in cola_pdf.renderizar_muchos(_iterar_ids_por_fecha(desde, hasta)):
+                if error:
+                    errores.append(f'{valoracion_id}: {error}')
+                else:
+                    archivo_zip.writestr(f'valoracion_{valoracion_id}.pdf', contenido)
+                yield from salida.vaciar()
+            
+            if errores:
+                archivo_zip.writestr('errores.txt', '\n'.join(errores))
+        yield from salida.vaciar()
+    
+    nombre = f"valoraciones_{desde.strftime('%Y%m%d')}_{hasta.strftime('%Y%m%d')}.zip"
+    return Response(
+        stream_with_context(generar()),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename={nombre}'}
     )
 
+@app.route('/api/pdf-jobs', methods=['POST'])
+def crear_trabajo_pdf():
+    """Encola la generación de un PDF y devuelve el id del trabajo"""
+    datos = request.get_json(silent=True) or {}
+    valoracion_id = datos.get('valoracion_id')
+    
+    if not valoracion_id:
+        return jsonify({'error': 'valoracion_id es requerido'}), 400
+    
+    if not REPORTLAB_AVAILABLE:
+        return jsonify({'error': 'ReportLab no está instalado. Ejecute: pip install reportlab'}), 500
+    
+    trabajo_id = cola_pdf.crear_trabajo(valoracion_id)
+    estado = cola_pdf.estado(trabajo_id)
+    estado['url_estado'] = f'/api/pdf-jobs/{trabajo_id}'
+    estado['url_descarga'] = f'/api/pdf-jobs/{trabajo_id}/descarga'
+    return jsonify(estado), 202
+
+@app.route('/api/pdf-jobs/<trabajo_id>', methods=['GET'])
+def obtener_trabajo_pdf(trabajo_id):
+    """Estado de un trabajo de PDF: pendiente, en_proceso, completado o error"""
+    estado = cola_pdf.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    return jsonify(estado)
+
+@app.route('/api/pdf-jobs/<trabajo_id>/descarga', methods=['GET'])
+def descargar_trabajo_pdf(trabajo_id):
+    """Descarga el PDF de un trabajo completado"""
+    estado = cola_pdf.estado(trabajo_id)
+    if estado is None:
+        return jsonify({'error': 'Trabajo no encontrado'}), 404
+    
+    if estado['estado'] == 'error':
+        return jsonify({'error': estado['error']}), 500
+    
+    entrada = cola_pdf.resultado(trabajo_id)
+    if entrada is None:
+        return jsonify({'error': 'El PDF aún no está listo', 'estado': estado['estado']}), 409
+    
+    return _enviar_pdf(estado['valoracion_id'], entrada)
+
 # ================================
 # INICIO DE LA APLICACIÓN
 # ================================
 
 if __name__ == '__main__':
+    if sys.argv[1:] == ['migrar']:
+        anterior, actual = migrar_base_datos()
+        print(f"Esquema de {DB_PATH}: versión {anterior} -> {actual}")
+        sys.exit(0)
+    
+    migrar_base_datos(forzar=False)
     print("🚀 Iniciando Sistema de Valoración de Software v1.0")
     print("📊 Basado en ISO/IEC 25010:2023 + Costos Colombia 2025")
     print("🌐 Acceso: http://localhost:5000")
@@ -0,0 +1,297 @@
+"""
+Punto de entrada ASGI del Sistema de Valoración de Software
+
+Uso:
+    uvicorn asgi:aplicacion --host 0.0.0.0 --port 5000
+
+Las rutas de mayor tráfico se atienden con manejadores async que nunca
+bloquean el bucle de eventos:
+
+- POST /api/valorar             cálculo en un pool de hilos de cálculo
+- GET  /api/historico           consulta por el adaptador BaseDatosAsincrona
+- GET  /api/estadisticas        consulta por el adaptador BaseDatosAsincrona
+- GET  /api/generar-pdf/<id>    renderizado en el pool de procesos de ColaPDF
+
+El resto de rutas (interfaz web, lotes, exportaciones, trabajos de PDF...) se
+sirve con la misma aplicación Flask a través de un puente WSGI que corre en
+hilos y transmite la respuesta por fragmentos.
+"""
+
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import parse_qsl
+
+from app import (
+    app as app_flask, db, cola_pdf, cache_pdf, escritor_diferido, metricas,
+    MIGRACION_AUTOMATICA, asegurar_esquema,
+    procesar_valoracion, consultar_historico, consultar_estadisticas
+)
+
+# Hilos dedicados a SQLite (cada hilo conserva su propia conexión de BaseDatos)
+ASGI_HILOS_DB = int(os.environ.get('VALORACION_ASGI_HILOS_DB', '8'))
+
+# Hilos para el cálculo de valoraciones
+ASGI_HILOS_CALCULO = int(os.environ.get('VALORACION_ASGI_HILOS_CALCULO', str(min(8, (os.cpu_count() or 1) + 2))))
+
+# Hilos del puente WSGI para las rutas que sigue atendiendo Flask
+ASGI_HILOS_WSGI = int(os.environ.get('VALORACION_ASGI_HILOS_WSGI', '16'))
+
+# ================================
+# ADAPTADOR DE BASE DE DATOS
+# ================================
+
+class BaseDatosAsincrona:
+    """
+    Acceso no bloqueante a BaseDatos
+
+    sqlite3 no tiene API asíncrona, así que cada operación se ejecuta en un
+    pool de hilos propio y se espera con await; el bucle de eventos sigue
+    atendiendo otras solicitudes mientras SQLite trabaja.
+    """
+
+    def __init__(self, base, hilos):
+        self.base = base
+        self._executor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix='sqlite')
+
+    async def ejecutar(self, funcion, *args):
+        """Ejecuta en el pool de la base de datos una función que usa `db`"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(funcion, *args))
+
+    async def consultar(self, sql, parametros=()):
+        return await self.ejecutar(self.base.consultar, sql, parametros)
+
+    async def consultar_uno(self, sql, parametros=()):
+        return await self.ejecutar(self.base.consultar_uno, sql, parametros)
+
+    def cerrar(self):
+        self._executor.shutdown(wait=True)
+
+bd = BaseDatosAsincrona(db, ASGI_HILOS_DB)
+executor_calculo = ThreadPoolExecutor(max_workers=ASGI_HILOS_CALCULO, thread_name_prefix='valoracion')
+executor_wsgi = ThreadPoolExecutor(max_workers=ASGI_HILOS_WSGI, thread_name_prefix='wsgi')
+
+# ================================
+# SOLICITUDES Y RESPUESTAS
+# ================================
+
+class Peticion:
+    """Datos mínimos de una solicitud HTTP ASGI"""
+
+    def __init__(self, scope, cuerpo):
+        self.scope = scope
+        self.metodo = scope['method']
+        self.ruta = scope['path']
+        self.args = dict(parse_qsl(scope.get('query_string', b'').decode('latin-1')))
+        self.cabeceras = {nombre.decode('latin-1').lower(): valor.decode('latin-1')
+                          for nombre, valor in scope.get('headers', [])}
+        self.cuerpo = cuerpo
+
+async def leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'http.disconnect':
+            break
+        partes.append(mensaje.get('body', b''))
+        if not mensaje.get('more_body', False):
+            break
+    return b''.join(partes)
+
+async def enviar_respuesta(send, estado, cuerpo, cabeceras):
+    cabeceras = [(nombre.encode('latin-1'), valor.encode('latin-1')) for nombre, valor in cabeceras]
+    cabeceras.append((b'content-length', str(len(cuerpo)).encode('ascii')))
+    await send({'type': 'http.response.start', 'status': estado, 'headers': cabeceras})
+    await send({'type': 'http.response.body', 'body': cuerpo})
+
+async def enviar_json(send, estado, datos):
+    cuerpo = json.dumps(datos, ensure_ascii=False, default=str).encode('utf-8')
+    await enviar_respuesta(send, estado, cuerpo, [
+        ('content-type', 'application/json'),
+        ('access-control-allow-origin', '*')
+    ])
+
+# ================================
+# MANEJADORES ASYNC
+# ================================
+
+async def valorar(peticion, send):
+    inicio = time.perf_counter()
+    try:
+        datos = json.loads(peticion.cuerpo) if peticion.cuerpo else None
+    except ValueError:
+        return await enviar_json(send, 400, {'error': 'El cuerpo no es un JSON válido'})
+    metricas.observar('valoracion_etapa_segundos', time.perf_counter() - inicio, etapa='parsear_json')
+
+    loop = asyncio.get_running_loop()
+    try:
+        respuesta, estado = await loop.run_in_executor(
+            executor_calculo, procesar_valoracion, datos, peticion.args
+        )
+    except Exception as e:
+        respuesta, estado = {'error': f'Error interno: {str(e)}'}, 500
+    await enviar_json(send, estado, respuesta)
+
+async def historico(peticion, send):
+    respuesta, estado = await bd.ejecutar(consultar_historico, peticion.args)
+    await enviar_json(send, estado, respuesta)
+
+async def estadisticas(peticion, send):
+    respuesta, estado = await bd.ejecutar(consultar_estadisticas)
+    await enviar_json(send, estado, respuesta)
+
+async def generar_pdf(peticion, send, valoracion_id):
+    entrada = cache_pdf.obtener(valoracion_id)
+    if entrada is None:
+        # enviar() puede esperar a la escritura diferida: se programa desde un hilo
+        future = await bd.ejecutar(cola_pdf.enviar, valoracion_id)
+        try:
+            contenido, error = await asyncio.wrap_future(future)
+        except Exception as e:
+            contenido, error = None, f'Error generando PDF: {str(e)}'
+        if error:
+            return await enviar_json(send, 500, {'error': error})
+        entrada = cache_pdf.obtener(valoracion_id) or cache_pdf.guardar(valoracion_id, contenido)
+
+    contenido, etag = entrada
+    cabeceras = [('etag', f'"{etag}"'), ('access-control-allow-origin', '*')]
+    if f'"{etag}"' in peticion.cabeceras.get('if-none-match', ''):
+        return await enviar_respuesta(send, 304, b'', cabeceras)
+
+    await enviar_respuesta(send, 200, contenido, cabeceras + [
+        ('content-type', 'application/pdf'),
+        ('content-disposition', f'attachment; filename=valoracion_{valoracion_id[:8]}.pdf')
+    ])
+
+RUTAS_ASYNC = {
+    ('POST', '/api/valorar'): valorar,
+    ('GET', '/api/historico'): historico,
+    ('GET', '/api/estadisticas'): estadisticas
+}
+
+PREFIJO_PDF = '/api/generar-pdf/'
+RUTA_PDF = '/api/generar-pdf/<valoracion_id>'  # Etiqueta de métricas, igual que la regla Flask
+
+async def atender_medido(ruta, metodo, send, atender):
+    """Ejecuta un manejador registrando duración y código, como las rutas Flask"""
+    inicio = time.perf_counter()
+    codigo = 500
+
+    async def enviar(mensaje):
+        nonlocal codigo
+        if mensaje['type'] == 'http.response.start':
+            codigo = mensaje['status']
+        await send(mensaje)
+
+    try:
+        await atender(enviar)
+    finally:
+        metricas.observar('http_solicitud_segundos', time.perf_counter() - inicio, ruta=ruta, metodo=metodo)
+        metricas.incrementar('http_solicitudes_total', ruta=ruta, metodo=metodo, codigo=codigo)
+
+# ================================
+# PUENTE WSGI (resto de rutas Flask)
+# ================================
+
+def _entorno_wsgi(peticion):
+    scope = peticion.scope
+    servidor = scope.get('server') or ('localhost', 80)
+    cliente = scope.get('client') or ('', 0)
+    entorno = {
+        'REQUEST_METHOD': peticion.metodo,
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': peticion.ruta,
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(servidor[0]),
+        'SERVER_PORT': str(servidor[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': cliente[0],
+        'CONTENT_LENGTH': str(len(peticion.cuerpo)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(peticion.cuerpo),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for nombre, valor in peticion.cabeceras.items():
+        if nombre == 'content-type':
+            entorno['CONTENT_TYPE'] = valor
+        elif nombre != 'content-length':
+            entorno['HTTP_' + nombre.upper().replace('-', '_')] = valor
+    return entorno
+
+async def puente_wsgi(peticion, send):
+    """Atiende la solicitud con Flask en un hilo, enviando cada fragmento al llegar"""
+    loop = asyncio.get_running_loop()
+    inicio = {}
+
+    def start_response(estado, cabeceras, exc_info=None):
+        inicio['estado'] = int(estado.split(' ', 1)[0])
+        inicio['cabeceras'] = cabeceras
+
+    respuesta = await loop.run_in_executor(executor_wsgi, app_flask.wsgi_app, _entorno_wsgi(peticion), start_response)
+    fragmentos = iter(respuesta)
+    try:
+        # El primer fragmento puede ser necesario para que se llame a start_response
+        fragmento = await loop.run_in_executor(executor_wsgi, next, fragmentos, None)
+        await send({
+            'type': 'http.response.start',
+            'status': inicio['estado'],
+            'headers': [(nombre.lower().encode('latin-1'), valor.encode('latin-1'))
+                        for nombre, valor in inicio['cabeceras']]
+        })
+        while fragmento is not None:
+            if fragmento:
+                await send({'type': 'http.response.body', 'body': fragmento, 'more_body': True})
+            fragmento = await loop.run_in_executor(executor_wsgi, next, fragmentos, None)
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(respuesta, 'close'):
+            await loop.run_in_executor(executor_wsgi, respuesta.close)
+
+# ================================
+# APLICACIÓN ASGI
+# ================================
+
+async def _ciclo_de_vida(receive, send):
+    while True:
+        mensaje = await receive()
+        if mensaje['type'] == 'lifespan.startup':
+            # Los manejadores async no pasan por before_request de Flask
+            if MIGRACION_AUTOMATICA:
+                await bd.ejecutar(asegurar_esquema)
+            await send({'type': 'lifespan.startup.complete'})
+        elif mensaje['type'] == 'lifespan.shutdown':
+            # Vaciar la escritura diferida antes de terminar
+            await asyncio.get_running_loop().run_in_executor(None, escritor_diferido.cerrar)
+            bd.cerrar()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def aplicacion(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _ciclo_de_vida(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    peticion = Peticion(scope, await leer_cuerpo(receive))
+
+    manejador = RUTAS_ASYNC.get((peticion.metodo, peticion.ruta))
+    if manejador is not None:
+        return await atender_medido(peticion.ruta, peticion.metodo, send,
+                                    lambda enviar: manejador(peticion, enviar))
+
+    if peticion.metodo == 'GET' and peticion.ruta.startswith(PREFIJO_PDF):
+        valoracion_id = peticion.ruta[len(PREFIJO_PDF):]
+        return await atender_medido(RUTA_PDF, peticion.metodo, send,
+                                    lambda enviar: generar_pdf(peticion, enviar, valoracion_id))
+
+    await puente_wsgi(peticion, send)
@@ -0,0 +1,512 @@
+"""
+Benchmarks del Sistema de Valoración de Software
+
+Mide, sobre una base de datos temporal y con datos sintéticos que cubren
+todas las combinaciones de tipo_software, tecnología y arquitectura:
+
+- latencia de una valoración (cálculo puro y MotorValoracion.calcular_valor)
+- rendimiento de la valoración por lotes (MotorValoracionLote)
+- tiempo de renderizado de reportes PDF (generar_pdf_reporte)
+- consultas de histórico, estadísticas, reportes y carga de una valoración
+  con 10k, 100k y 1M valoraciones guardadas
+- arranque en frío: importar app en un proceso nuevo y migrar una base vacía
+- concurrencia: valoraciones por segundo con 1..N hilos y 1..N procesos
+  sobre la misma instancia del motor, verificando que cada resultado y su
+  traza coincidan con el cálculo secuencial
+
+Uso:
+    python benchmark.py --salida resultados.json
+    python benchmark.py --filas 10000,100000 --omitir pdf
+    python benchmark.py --salida actual.json --comparar anterior.json
+
+Los resultados se escriben en JSON junto con la versión de Python, NumPy,
+la plataforma y el commit, para compararlos entre versiones. Con --comparar
+se listan las mediciones que empeoraron más que --tolerancia y el proceso
+termina con código 1 si hay alguna.
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+BENCHMARKS = ['arranque', 'latencia', 'concurrencia', 'lote', 'pdf', 'consultas']
+
+# ================================
+# DATOS SINTÉTICOS
+# ================================
+
+def combinaciones(sistema):
+    """Todas las combinaciones (tipo_software, tecnología, arquitectura) del motor"""
+    return list(itertools.product(
+        sistema.HORAS_BASE_TIPO, sistema.FACTORES_TECNOLOGIA, sistema.FACTORES_ARQUITECTURA
+    ))
+
+def generar_datos_software(rng, sistema, tipo, tecnologia, arquitectura):
+    """datos_software completo y válido para la combinación indicada"""
+    vocabularios = sistema.VOCABULARIOS_RESPUESTAS
+    datos = {
+        'tipo_software': tipo,
+        'tecnologia_principal': tecnologia,
+        'arquitectura': arquitectura,
+        'antiguedad_anos': round(rng.uniform(0, 20), 1),
+        'en_uso_activo': rng.choice(vocabularios['en_uso_activo']),
+        'sector': rng.choice(vocabularios['sector']),
+        'descripcion': f'Sistema sintético {tipo} en {tecnologia}',
+        'usuarios_concurrentes': rng.randint(1, 300),
+        'usuarios_totales': rng.randint(1, 3000),
+        'base_datos_tipo': rng.choice(vocabularios['base_datos_tipo']),
+        'integraciones_externas': rng.randint(0, 15),
+        'volumen_datos': rng.choice(vocabularios['volumen_datos']),
+        'funcionalidades': {
+            clave: True for clave in sistema.CONJUNTOS_RESPUESTAS['funcionalidades'] if rng.random() < 0.5
+        },
+        'iso25010': {caracteristica: rng.randint(1, 5) for caracteristica in sistema.PESOS_ISO25010},
+        'tipo_valoracion': rng.choice(vocabularios['tipo_valoracion']),
+        'nivel_certeza': rng.choice(vocabularios['nivel_certeza']),
+        'contexto_desarrollo': {
+            clave: True for clave in sistema.CONJUNTOS_RESPUESTAS['contexto_desarrollo'] if rng.random() < 0.3
+        },
+        'criticidad_negocio': rng.randint(1, 5),
+        'conoce_tiempo_desarrollo': rng.choice(vocabularios['conoce_tiempo_desarrollo']),
+        'conoce_inversion': rng.choice(vocabularios['conoce_inversion']),
+        'conoce_ahorros': rng.choice(vocabularios['conoce_ahorros'])
+    }
+    if datos['conoce_tiempo_desarrollo'] != 'no':
+        datos['tiempo_desarrollo_meses'] = round(rng.uniform(1, 36), 1)
+    if datos['conoce_inversion'] != 'no':
+        datos['inversion_original_cop'] = rng.randint(1, 200) * 1000000
+    if datos['conoce_ahorros'] != 'no':
+        datos['ahorro_anual_cop'] = rng.randint(1, 100) * 1000000
+    for bandera in sistema.BANDERAS_RESPUESTAS:
+        if rng.random() < 0.3:
+            datos[bandera] = True
+
+    sistema.validar_datos_software(datos)
+    return datos
+
+def generar_lote(rng, sistema, cantidad):
+    """`cantidad` datos_software recorriendo las combinaciones en orden"""
+    todas = combinaciones(sistema)
+    return [generar_datos_software(rng, sistema, *todas[i % len(todas)]) for i in range(cantidad)]
+
+# ================================
+# MEDICIÓN
+# ================================
+
+def resumir(duraciones):
+    """Estadísticos en milisegundos de una lista de duraciones en segundos"""
+    ordenadas = sorted(duraciones)
+
+    def percentil(p):
+        return round(ordenadas[min(len(ordenadas) - 1, int(p * len(ordenadas)))] * 1000, 4)
+
+    return {
+        'n': len(ordenadas),
+        'media_ms': round(sum(ordenadas) / len(ordenadas) * 1000, 4),
+        'p50_ms': percentil(0.50),
+        'p95_ms': percentil(0.95),
+        'p99_ms': percentil(0.99),
+        'max_ms': round(ordenadas[-1] * 1000, 4)
+    }
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    funcion(*args)
+    return time.perf_counter() - inicio
+
+def informar(mensaje):
+    print(mensaje, file=sys.stderr, flush=True)
+
+# ================================
+# BENCHMARKS
+# ================================
+
+def benchmark_latencia(sistema, rng, repeticiones):
+    """Latencia por llamada sobre todas las combinaciones"""
+    todas = combinaciones(sistema)
+    lista_datos = [generar_datos_software(rng, sistema, *combinacion) for combinacion in todas]
+
+    calculo = [
+        medir(sistema.motor._calcular_resultado, datos)
+        for _ in range(repeticiones) for datos in lista_datos
+    ]
+    # calcular_valor incluye el guardado en SQLite (la caché está desactivada)
+    completo = [medir(sistema.motor.calcular_valor, datos) for datos in lista_datos]
+
+    return {
+        'combinaciones': len(todas),
+        'calculo': resumir(calculo),
+        'calcular_valor': resumir(completo)
+    }
+
+def _calcular_trazas(lista_datos):
+    """Tarea de hilo o proceso: (resultado, traza) de cada datos_software"""
+    sistema = importlib.import_module('app')
+    return [sistema.motor.calcular_traza(datos) for datos in lista_datos]
+
+def benchmark_concurrencia(sistema, rng, niveles, repeticiones):
+    """
+    Escalado de MotorValoracion con hilos y con procesos
+
+    El trabajo total es fijo y se reparte en partes iguales. Con hilos la
+    ganancia está limitada por el GIL (el cálculo es Python puro); lo que
+    se comprueba es que las llamadas simultáneas no se mezclen. Con
+    procesos el rendimiento debe crecer con los núcleos disponibles.
+    """
+    lista_datos = [
+        generar_datos_software(rng, sistema, *combinacion) for combinacion in combinaciones(sistema)
+    ] * max(1, repeticiones)
+    referencia = [sistema.motor.calcular_traza(datos) for datos in lista_datos]
+
+    resultados = {'valoraciones': len(lista_datos), 'nucleos': os.cpu_count()}
+    for nombre, ejecutor in (('hilos', ThreadPoolExecutor), ('procesos', ProcessPoolExecutor)):
+        base = None
+        resultados[nombre] = {}
+        for cantidad in niveles:
+            partes = [lista_datos[indice::cantidad] for indice in range(cantidad)]
+            with ejecutor(max_workers=cantidad) as pool:
+                # Calentar el pool (en procesos, importa app en cada worker)
+                list(pool.map(_calcular_trazas, [partes[0][:1]] * cantidad))
+                inicio = time.perf_counter()
+                salidas = list(pool.map(_calcular_trazas, partes))
+                duracion = time.perf_counter() - inicio
+
+            discrepancias = sum(
+                salida != referencia[indice::cantidad] for indice, salida in enumerate(salidas)
+            )
+            filas_por_segundo = round(len(lista_datos) / duracion)
+            base = base or filas_por_segundo
+            resultados[nombre][str(cantidad)] = {
+                'duracion_s': round(duracion, 4),
+                'filas_por_segundo': filas_por_segundo,
+                'aceleracion': round(filas_por_segundo / base, 2),
+                'partes_distintas': discrepancias
+            }
+            if discrepancias:
+                raise RuntimeError(f'{discrepancias} partes difieren del cálculo secuencial con {cantidad} {nombre}')
+    return resultados
+
+def benchmark_lote(sistema, rng, tamanos):
+    """Filas por segundo del motor por lotes, comparado con el cálculo escalar"""
+    if not sistema.NUMPY_AVAILABLE:
+        return {'omitido': 'NumPy no está instalado'}
+
+    resultados = {}
+    for tamano in tamanos:
+        lista_datos = generar_lote(rng, sistema, tamano)
+        duracion = medir(sistema.motor_lote.valorar_lote, lista_datos, False)
+        resultados[str(tamano)] = {
+            'duracion_s': round(duracion, 4),
+            'filas_por_segundo': round(tamano / duracion)
+        }
+
+    lista_datos = generar_lote(rng, sistema, min(tamanos))
+    duracion = medir(lambda: [sistema.motor._calcular_resultado(datos) for datos in lista_datos])
+    resultados['escalar'] = {
+        'filas': len(lista_datos),
+        'duracion_s': round(duracion, 4),
+        'filas_por_segundo': round(len(lista_datos) / duracion)
+    }
+    return resultados
+
+def benchmark_pdf(sistema, cantidad):
+    """Tiempo de generar_pdf_reporte sobre valoraciones ya guardadas"""
+    if not sistema.REPORTLAB_AVAILABLE:
+        return {'omitido': 'ReportLab no está instalado'}
+
+    ids = [fila[0] for fila in sistema.db.consultar('SELECT id FROM valoraciones LIMIT ?', (cantidad,))]
+    if not ids:
+        return {'omitido': 'No hay valoraciones guardadas'}
+
+    duraciones = []
+    tamanos = []
+    for valoracion_id in ids:
+        inicio = time.perf_counter()
+        buffer, error = sistema.generar_pdf_reporte(valoracion_id)
+        duraciones.append(time.perf_counter() - inicio)
+        if error:
+            return {'error': error}
+        tamanos.append(len(buffer.getvalue()))
+
+    resultado = resumir(duraciones)
+    resultado['bytes_promedio'] = round(sum(tamanos) / len(tamanos))
+    return resultado
+
+# Se ejecuta en un proceso nuevo para cada medición de arranque
+SCRIPT_ARRANQUE = """
+import json, sys, time
+inicio = time.perf_counter()
+import app
+importar = time.perf_counter() - inicio
+inicio = time.perf_counter()
+app.migrar_base_datos(forzar=False)
+migrar = time.perf_counter() - inicio
+print(json.dumps({'importar': importar, 'migrar': migrar, 'reportlab': 'reportlab' in sys.modules}))
+"""
+
+def benchmark_arranque(directorio, repeticiones):
+    """Arranque en frío: proceso completo, import de app y migración de una base nueva"""
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    proceso, importar, migrar = [], [], []
+    reportlab_al_importar = False
+
+    for indice in range(repeticiones):
+        entorno = dict(os.environ, VALORACION_DB_PATH=os.path.join(directorio, f'arranque_{indice}.db'))
+        inicio = time.perf_counter()
+        salida = subprocess.run(
+            [sys.executable, '-c', SCRIPT_ARRANQUE], cwd=carpeta, env=entorno,
+            capture_output=True, text=True, check=True
+        )
+        proceso.append(time.perf_counter() - inicio)
+        medicion = json.loads(salida.stdout.strip().splitlines()[-1])
+        importar.append(medicion['importar'])
+        migrar.append(medicion['migrar'])
+        reportlab_al_importar = reportlab_al_importar or medicion['reportlab']
+
+    return {
+        'proceso': resumir(proceso),
+        'importar': resumir(importar),
+        'migrar_base_nueva': resumir(migrar),
+        'reportlab_al_importar': reportlab_al_importar
+    }
+
+def poblar(sistema, rng, objetivo, tamano_lote=20000):
+    """Completa la base hasta `objetivo` valoraciones con fechas repartidas en 3 años"""
+    actual = sistema.db.consultar_uno('SELECT COUNT(*) FROM valoraciones')[0]
+    fecha_base = datetime.now() - timedelta(days=3 * 365)
+
+    while actual < objetivo:
+        cantidad = min(tamano_lote, objetivo - actual)
+        lista_datos = generar_lote(rng, sistema, cantidad)
+        if sistema.NUMPY_AVAILABLE:
+            resultados = sistema.motor_lote.valorar_lote(lista_datos, guardar=False)
+        else:
+            resultados = [sistema.motor._calcular_resultado(datos) for datos in lista_datos]
+        fechas = sorted(fecha_base + timedelta(seconds=rng.uniform(0, 3 * 365 * 86400)) for _ in range(cantidad))
+
+        filas = [
+            sistema.codificador.filas(str(uuid.uuid4()), fecha, datos, resultado, sistema.huella_datos(datos))
+            for fecha, datos, resultado in zip(fechas, lista_datos, resultados)
+        ]
+        with sistema.db.transaccion() as conn:
+            conn.executemany(sistema.SQL_INSERTAR_VALORACION, [fila_valoracion for fila_valoracion, _ in filas])
+            conn.executemany(sistema.SQL_INSERTAR_TEXTO, [fila_texto for _, fila_texto in filas if fila_texto])
+            sistema.motor._acumular_estadisticas(conn, (
+                (fecha, datos['tipo_software'], datos['tecnologia_principal'],
+                 resultado['valor_minimo'], resultado['valor_maximo'])
+                for fecha, datos, resultado in zip(fechas, lista_datos, resultados)
+            ))
+        actual += cantidad
+        informar(f'  {actual} valoraciones guardadas')
+
+def benchmark_consultas(sistema, rng, niveles, repeticiones):
+    """Rutas de consulta con distintos volúmenes de valoraciones guardadas"""
+    cliente = sistema.app.test_client()
+    tecnologias = list(sistema.FACTORES_TECNOLOGIA)
+    resultados = {}
+
+    for objetivo in niveles:
+        informar(f'Poblando hasta {objetivo} valoraciones...')
+        inicio = time.perf_counter()
+        poblar(sistema, rng, objetivo)
+        nivel = {'poblar_s': round(time.perf_counter() - inicio, 2)}
+
+        def solicitud(url):
+            inicio = time.perf_counter()
+            respuesta = cliente.get(url)
+            duracion = time.perf_counter() - inicio
+            if respuesta.status_code != 200:
+                raise RuntimeError(f'{url} respondió {respuesta.status_code}')
+            return duracion, respuesta.get_json()
+
+        nivel['historico'] = resumir([solicitud('/api/historico')[0] for _ in range(repeticiones)])
+        nivel['historico_filtrado'] = resumir([
+            solicitud(f'/api/historico?tecnologia={rng.choice(tecnologias)}')[0] for _ in range(repeticiones)
+        ])
+
+        # Recorrido por cursor: el costo de cada página no debe crecer con la profundidad
+        paginas = []
+        url = f'/api/historico?limite={sistema.HISTORICO_LIMITE_MAXIMO}'
+        for _ in range(repeticiones):
+            duracion, cuerpo = solicitud(url)
+            paginas.append(duracion)
+            if not cuerpo['siguiente_cursor']:
+                break
+            url = f"/api/historico?limite={sistema.HISTORICO_LIMITE_MAXIMO}&cursor={cuerpo['siguiente_cursor']}"
+        nivel['historico_paginas'] = resumir(paginas)
+
+        nivel['estadisticas'] = resumir([solicitud('/api/estadisticas')[0] for _ in range(repeticiones)])
+        nivel['reporte_factores'] = resumir([
+            solicitud('/api/reportes/factores?agrupar=sector')[0] for _ in range(max(1, repeticiones // 4))
+        ])
+
+        ids = [fila[0] for fila in sistema.db.consultar(
+            'SELECT id FROM valoraciones ORDER BY random() LIMIT ?', (repeticiones,))]
+        nivel['cargar_valoracion'] = resumir([medir(sistema.cargar_valoracion, valoracion_id) for valoracion_id in ids])
+
+        resultados[str(objetivo)] = nivel
+
+    return resultados
+
+# ================================
+# RESULTADOS
+# ================================
+
+def metadatos(sistema, argumentos):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    return {
+        'fecha': datetime.now().isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'plataforma': platform.platform(),
+        'nucleos': os.cpu_count(),
+        'numpy': sistema.np.__version__ if sistema.NUMPY_AVAILABLE else None,
+        'reportlab': sistema.REPORTLAB_AVAILABLE,
+        'semilla': argumentos.semilla,
+        'repeticiones': argumentos.repeticiones
+    }
+
+def _aplanar(resultados, prefijo=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}"""
+    plano = {}
+    for clave, valor in resultados.items():
+        if isinstance(valor, dict):
+            plano.update(_aplanar(valor, f'{prefijo}{clave}.'))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            plano[prefijo + clave] = valor
+    return plano
+
+def comparar(anterior, actual, tolerancia):
+    """
+    Mediciones que empeoraron más que `tolerancia` (fracción)
+
+    Para tiempos (*_ms, *_s) empeorar es subir; para filas_por_segundo es
+    bajar. p99 y máximo se ignoran porque dependen de pausas aisladas.
+    Devuelve una lista de (métrica, antes, ahora, cambio relativo).
+    """
+    antes = _aplanar(anterior['resultados'])
+    ahora = _aplanar(actual['resultados'])
+    regresiones = []
+    for metrica, valor in sorted(ahora.items()):
+        previo = antes.get(metrica)
+        if not previo or metrica.endswith(('.p99_ms', '.max_ms')):
+            continue
+        if metrica.endswith(('_ms', '_s')):
+            cambio = valor / previo - 1
+        elif metrica.endswith('filas_por_segundo'):
+            cambio = previo / valor - 1 if valor else float('inf')
+        else:
+            continue
+        if cambio > tolerancia:
+            regresiones.append((metrica, previo, valor, cambio))
+    return regresiones
+
+# ================================
+# PROGRAMA
+# ================================
+
+def _lista_enteros(texto):
+    return [int(valor) for valor in texto.split(',') if valor.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks del Sistema de Valoración de Software')
+    parser.add_argument('--filas', type=_lista_enteros, default=[10000, 100000, 1000000],
+                        help='Volúmenes de valoraciones para las consultas (por defecto 10000,100000,1000000)')
+    parser.add_argument('--lotes', type=_lista_enteros, default=[1000, 10000, 50000],
+                        help='Tamaños de lote para el motor por lotes')
+    parser.add_argument('--hilos', type=_lista_enteros, default=[1, 2, 4, 8],
+                        help='Cantidades de hilos y de procesos para la concurrencia')
+    parser.add_argument('--repeticiones', type=int, default=20, help='Repeticiones por medición')
+    parser.add_argument('--pdf', type=int, default=20, help='Cantidad de reportes PDF a generar')
+    parser.add_argument('--omitir', default='', help=f'Benchmarks a omitir, separados por coma ({", ".join(BENCHMARKS)})')
+    parser.add_argument('--semilla', type=int, default=2025)
+    parser.add_argument('--salida', help='Archivo JSON de resultados (por defecto, la salida estándar)')
+    parser.add_argument('--comparar', help='Resultados JSON anteriores para detectar regresiones')
+    parser.add_argument('--tolerancia', type=float, default=0.2, help='Empeoramiento relativo permitido al comparar')
+    argumentos = parser.parse_args()
+
+    omitir = {nombre.strip() for nombre in argumentos.omitir.split(',') if nombre.strip()}
+    desconocidos = omitir - set(BENCHMARKS)
+    if desconocidos:
+        parser.error(f'benchmarks desconocidos: {", ".join(sorted(desconocidos))}')
+
+    with tempfile.TemporaryDirectory(prefix='valoracion_benchmark_') as directorio:
+        # Base de datos desechable y sin cachés, para medir el trabajo real
+        os.environ['VALORACION_DB_PATH'] = os.path.join(directorio, 'benchmark.db')
+        os.environ['VALORACION_CACHE_ELEMENTOS'] = '0'
+        os.environ['VALORACION_PDF_CACHE_MB'] = '0'
+        os.environ['VALORACION_ESCRITURA_DIFERIDA'] = '0'
+        os.environ['VALORACION_DEDUPLICAR'] = '0'
+        os.environ['VALORACION_MONTE_CARLO'] = '0'
+        sistema = importlib.import_module('app')
+        sistema.migrar_base_datos()
+
+        rng = random.Random(argumentos.semilla)
+        resultados = {}
+        try:
+            if 'arranque' not in omitir:
+                informar('Arranque en frío...')
+                resultados['arranque'] = benchmark_arranque(directorio, max(1, argumentos.repeticiones // 2))
+            if 'latencia' not in omitir:
+                informar('Latencia de valoración...')
+                resultados['latencia'] = benchmark_latencia(sistema, rng, max(1, argumentos.repeticiones // 4))
+            if 'concurrencia' not in omitir:
+                informar('Concurrencia con hilos y procesos...')
+                resultados['concurrencia'] = benchmark_concurrencia(
+                    sistema, rng, argumentos.hilos, max(1, argumentos.repeticiones // 4)
+                )
+            if 'lote' not in omitir:
+                informar('Valoración por lotes...')
+                resultados['lote'] = benchmark_lote(sistema, rng, argumentos.lotes)
+            if 'pdf' not in omitir:
+                informar('Reportes PDF...')
+                if sistema.db.consultar_uno('SELECT COUNT(*) FROM valoraciones')[0] < argumentos.pdf:
+                    poblar(sistema, rng, argumentos.pdf)
+                resultados['pdf'] = benchmark_pdf(sistema, argumentos.pdf)
+            if 'consultas' not in omitir:
+                resultados['consultas'] = benchmark_consultas(
+                    sistema, rng, sorted(argumentos.filas), argumentos.repeticiones
+                )
+        finally:
+            sistema.escritor_diferido.cerrar()
+            sistema.db.cerrar()
+
+    salida = {'metadatos': metadatos(sistema, argumentos), 'resultados': resultados}
+    texto = json.dumps(salida, indent=2, ensure_ascii=False)
+    if argumentos.salida:
+        with open(argumentos.salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto + '\n')
+        informar(f'Resultados guardados en {argumentos.salida}')
+    else:
+        print(texto)
+
+    if argumentos.comparar:
+        with open(argumentos.comparar, encoding='utf-8') as archivo:
+            anterior = json.load(archivo)
+        regresiones = comparar(anterior, salida, argumentos.tolerancia)
+        for metrica, previo, valor, cambio in regresiones:
+            informar(f'REGRESIÓN {metrica}: {previo} -> {valor} ({cambio:+.0%})')
+        if regresiones:
+            sys.exit(1)
+        informar(f'Sin regresiones por encima de {argumentos.tolerancia:.0%}')
+
+if __name__ == '__main__':
+    main()
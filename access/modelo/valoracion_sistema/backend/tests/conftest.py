@@ -0,0 +1,99 @@
+"""
+Configuración común de las pruebas del backend
+
+La base de datos de pruebas vive en un directorio temporal: VALORACION_DB_PATH
+se fija antes de importar app, que lee la ruta al cargarse.
+"""
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+DIRECTORIO_PRUEBAS = tempfile.mkdtemp(prefix='valoracion_pruebas_')
+os.environ['VALORACION_DB_PATH'] = os.path.join(DIRECTORIO_PRUEBAS, 'valoraciones.db')
+os.environ.setdefault('VALORACION_IMPORTACION_DIR', DIRECTORIO_PRUEBAS)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as app_modulo  # noqa: E402
+
+TIPOS = [
+    'sistema_auditoria', 'aplicativo_gestion', 'sistema_reportes', 'erp_basico', 'crm_sistema',
+    'aplicativo_inventarios', 'gestion_documental', 'sistema_contable', 'otro', 'desconocido'
+]
+TECNOLOGIAS = [
+    'access_vba', 'vb_net', 'excel_vba', 'php_basic', 'asp_net_webforms', 'jsp_servlet', 'php_laravel',
+    'javascript_react', 'python_django', 'python_flask', 'asp_net_core', 'java_spring',
+    'microservicios', 'cloud_native', 'cobol', 'MS Access 2010'
+]
+
+
+def generar_datos(rng):
+    """Un formulario al azar, con valores de borde, texto libre y respuestas atípicas"""
+    datos = {'tipo_software': rng.choice(TIPOS), 'tecnologia_principal': rng.choice(TECNOLOGIAS)}
+
+    def incluir():
+        return rng.random() < 0.5
+
+    if incluir():
+        datos['usuarios_concurrentes'] = rng.choice([0, 1, 5, 6, 19, 20, 21, 50, 200, 500, '7', '', None])
+    if incluir():
+        datos['usuarios_totales'] = rng.choice([1, 20, 21, 100, 101, 500, 501, 2000])
+    if incluir():
+        datos['integraciones_externas'] = rng.choice([0, 1, 2, 3, 5, 6, 10, 11, 20])
+    if incluir():
+        datos['antiguedad_anos'] = rng.choice([0, 2, 8, 8.5, 16, 30, '12'])
+    if incluir():
+        datos['criticidad_negocio'] = rng.choice([1, 2, 3, 4, 5, 0, 9, '4'])
+    if incluir():
+        datos['tiempo_desarrollo_meses'] = rng.choice([0, 1, 2.5, 12, 24, 25, 40])
+    if incluir():
+        datos['ahorro_anual_cop'] = rng.choice([0, 1000000, 5000001, 20000001, 50000001])
+    if incluir():
+        datos['inversion_original_cop'] = rng.choice([0, 1000000, 10000000, 30000000])
+    if incluir():
+        datos['en_uso_activo'] = rng.choice(['true', 'false', True])
+    for campo, vocabulario in app_modulo.VOCABULARIOS_RESPUESTAS.items():
+        if campo != 'en_uso_activo' and incluir():
+            datos[campo] = rng.choice(vocabulario + ['otro_valor'])
+    for campo, claves in app_modulo.CONJUNTOS_RESPUESTAS.items():
+        if incluir():
+            datos[campo] = {clave: rng.choice([True, True, False]) for clave in claves if incluir()}
+    if incluir():
+        datos['iso25010'] = {
+            caracteristica: rng.choice([1, 2, 3, 4, 5, 5, 3.5])
+            for caracteristica in app_modulo.PESOS_ISO25010 if incluir()
+        }
+    for campo in app_modulo.BANDERAS_RESPUESTAS:
+        if rng.random() < 0.3:
+            datos[campo] = rng.choice([True, False])
+    if incluir():
+        datos['descripcion'] = 'Sistema ' * rng.randint(0, 40)
+    return datos
+
+
+@pytest.fixture(scope='session')
+def app():
+    app_modulo.migrar_base_datos()
+    yield app_modulo
+    app_modulo.db.cerrar()
+    shutil.rmtree(DIRECTORIO_PRUEBAS, ignore_errors=True)
+
+
+@pytest.fixture
+def cliente(app):
+    return app.app.test_client()
+
+
+@pytest.fixture
+def lista_datos(app):
+    """Formularios al azar ya validados (misma semilla en cada prueba)"""
+    rng = random.Random(2025)
+    lista = [generar_datos(rng) for _ in range(2000)]
+    for datos in lista:
+        assert app.validar_datos_software(datos) is None
+    return lista
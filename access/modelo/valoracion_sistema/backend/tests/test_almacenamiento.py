@@ -0,0 +1,139 @@
+"""Codificación columnar de las valoraciones y migración de bases anteriores"""
+
+import copy
+import json
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+
+def _leer_fila(app, fila_valoracion, fila_texto):
+    """(respuestas, desglose) tal como los reconstruye cargar_valoracion"""
+    valoracion = dict(zip(app.codificador.columnas, fila_valoracion))
+    sobrantes = app.codificador.desempaquetar_texto(*fila_texto[1:]) if fila_texto else {}
+    for campo in ('tipo_software', 'tecnologia_principal'):
+        if valoracion[campo] is not None:
+            sobrantes[campo] = valoracion[campo]
+    return app.codificador.decodificar(valoracion, sobrantes)
+
+
+def test_codificar_y_decodificar_conserva_los_datos(app, lista_datos):
+    fecha = datetime(2025, 8, 5)
+    for numero, datos in enumerate(lista_datos):
+        resultado = app.motor._calcular_resultado(copy.deepcopy(datos))
+        fila_valoracion, fila_texto = app.codificador.filas(str(numero), fecha, datos, resultado, None)
+        assert _leer_fila(app, fila_valoracion, fila_texto) == (datos, resultado['desglose'])
+
+
+def test_valores_atipicos_van_al_texto(app):
+    datos = {
+        'tipo_software': 'otro', 'tecnologia_principal': 'cobol', 'sector': 'espacial',
+        'usuarios_totales': 2 ** 70, 'sarlaft': 'si', 'funcionalidades': {'api_rest': True, 'nueva': True},
+        'iso25010': {'security': 4.5}, 'campo_nuevo': [1, 2]
+    }
+    desglose = {'horas_estimadas': 10.5, 'costo_hora': 1000.0}
+    columnas, sobrantes = app.codificador.codificar(datos, desglose)
+    assert columnas['funcionalidades'] == 1 << app.CONJUNTOS_RESPUESTAS['funcionalidades'].index('api_rest')
+    assert columnas['costo_hora'] == 1000.0
+    assert sobrantes == {
+        'tipo_software': 'otro', 'tecnologia_principal': 'cobol', 'sector': 'espacial',
+        'usuarios_totales': 2 ** 70, 'sarlaft': 'si', 'iso25010': {'security': 4.5},
+        'campo_nuevo': [1, 2], 'funcionalidades': {'nueva': True},
+        app.CodificadorRespuestas.CLAVE_DESGLOSE: {'horas_estimadas': 10.5}
+    }
+
+
+def test_filas_lote_igual_a_filas(app, lista_datos):
+    fecha = datetime(2025, 8, 5)
+    ids = [str(numero) for numero in range(len(lista_datos))]
+    resultados = app.motor_lote.valorar_lote(lista_datos, guardar=False)
+    huellas = [app.huella_datos(datos) for datos in lista_datos]
+    columnas = {
+        nombre: [resultado[nombre] for resultado in resultados]
+        for nombre in ('valor_minimo', 'valor_maximo', 'valor_promedio', 'factor_confianza')
+    }
+    columnas.update({
+        factor: [resultado['desglose'][factor] for resultado in resultados] for factor in app.FACTORES_DESGLOSE
+    })
+
+    filas_valoracion, filas_texto = app.codificador.filas_lote(ids, fecha, lista_datos, columnas, huellas)
+
+    esperadas = [
+        app.codificador.filas(valoracion_id, fecha, datos, resultado, huella)
+        for valoracion_id, datos, resultado, huella in zip(ids, lista_datos, resultados, huellas)
+    ]
+    assert filas_valoracion == [fila_valoracion for fila_valoracion, _ in esperadas]
+    assert filas_texto == [fila_texto for _, fila_texto in esperadas if fila_texto]
+
+
+def test_guardar_lote_y_cargar(app, lista_datos):
+    lista = lista_datos[:200]
+    resultados = app.motor_lote.valorar_lote(lista)
+    for datos, resultado in zip(lista, resultados):
+        valoracion = app.cargar_valoracion(resultado['id'])
+        assert valoracion['respuestas'] == datos
+        assert valoracion['desglose'] == resultado['desglose']
+        assert valoracion['huella'] is None  # Sin deduplicación no se calcula
+
+
+ESQUEMA_V0 = '''
+    CREATE TABLE valoraciones (
+        id TEXT PRIMARY KEY,
+        fecha_creacion DATETIME,
+        tipo_software TEXT,
+        tecnologia_principal TEXT,
+        respuestas_json TEXT,
+        valor_minimo REAL,
+        valor_maximo REAL,
+        factor_confianza REAL,
+        desglose_json TEXT
+    )
+'''
+
+
+@pytest.fixture
+def base_v0(app, tmp_path, monkeypatch, lista_datos):
+    """Base con el esquema de la versión 1.0 (respuestas y desglose en JSON) como base activa"""
+    ruta = str(tmp_path / 'v0.db')
+    filas = []
+    for numero, datos in enumerate(lista_datos[:300]):
+        resultado = app.motor._calcular_resultado(copy.deepcopy(datos))
+        filas.append((
+            f'v0-{numero:04d}', f'2025-0{numero % 9 + 1}-15 10:00:00', datos['tipo_software'],
+            datos['tecnologia_principal'], json.dumps(datos), resultado['valor_minimo'],
+            resultado['valor_maximo'], resultado['factor_confianza'], json.dumps(resultado['desglose'])
+        ))
+    with sqlite3.connect(ruta) as conn:
+        conn.execute(ESQUEMA_V0)
+        conn.executemany('INSERT INTO valoraciones VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', filas)
+    conn.close()
+
+    base = app.BaseDatos(ruta)
+    monkeypatch.setattr(app, 'db', base)
+    yield filas
+    base.cerrar()
+
+
+def test_migracion_desde_esquema_v0(app, base_v0):
+    anterior, actual = app.migrar_base_datos(forzar=False)
+    assert (anterior, actual) == (0, app.ESQUEMA_VERSION)
+    assert app.db.consultar_uno('PRAGMA user_version')[0] == app.ESQUEMA_VERSION
+
+    for valoracion_id, fecha, _, _, respuestas_json, minimo, maximo, confianza, desglose_json in base_v0:
+        valoracion = app.cargar_valoracion(valoracion_id)
+        assert valoracion['fecha_creacion'] == fecha
+        assert valoracion['respuestas'] == json.loads(respuestas_json)
+        assert valoracion['desglose'] == json.loads(desglose_json)
+        assert (valoracion['valor_minimo'], valoracion['valor_maximo'], valoracion['factor_confianza']) == \
+            (minimo, maximo, confianza)
+        assert valoracion['huella'] == app.huella_datos(json.loads(respuestas_json))
+
+    total, = app.db.consultar_uno(
+        "SELECT cantidad FROM estadisticas_resumen WHERE dimension = 'global'")
+    assert total == len(base_v0)
+    catalogo, = app.db.consultar_uno('SELECT COUNT(*) FROM catalogo_respuestas')
+    assert catalogo == sum(len(vocabulario) for vocabulario in app.VOCABULARIOS_RESPUESTAS.values())
+
+    # Una segunda pasada no vuelve a migrar
+    assert app.migrar_base_datos(forzar=False) == (app.ESQUEMA_VERSION, app.ESQUEMA_VERSION)
@@ -0,0 +1,52 @@
+"""Validación de entradas de las rutas de valoración"""
+
+import pytest
+
+DATOS_MINIMOS = {'tipo_software': 'erp_basico', 'tecnologia_principal': 'python_django'}
+
+
+def _total_valoraciones(app):
+    return app.db.consultar_uno('SELECT COUNT(*) FROM valoraciones')[0]
+
+
+@pytest.mark.parametrize('consulta', ['semilla=-1', 'semilla=abc', 'iteraciones=1.5', 'iteraciones=x'])
+def test_simulacion_rechaza_parametros_sin_guardar(app, cliente, consulta):
+    antes = _total_valoraciones(app)
+    respuesta = cliente.post(f'/api/valorar?simulacion=1&{consulta}', json=dict(DATOS_MINIMOS))
+    assert respuesta.status_code == 400
+    assert _total_valoraciones(app) == antes
+
+
+def test_simulacion_con_semilla_es_reproducible(cliente):
+    consulta = '/api/valorar?simulacion=1&semilla=7&iteraciones=2000'
+    primera = cliente.post(consulta, json=dict(DATOS_MINIMOS)).get_json()
+    segunda = cliente.post(consulta, json=dict(DATOS_MINIMOS)).get_json()
+    assert primera['valoracion']['simulacion'] == segunda['valoracion']['simulacion']
+
+
+def test_lote_aisla_elementos_invalidos(cliente):
+    lote = [
+        dict(DATOS_MINIMOS),
+        dict(DATOS_MINIMOS, funcionalidades='abc'),
+        dict(DATOS_MINIMOS, iso25010={'security': '3'}),
+        dict(DATOS_MINIMOS, tipo_software=['erp_basico']),
+        dict(DATOS_MINIMOS, iso25010={'security': 4}),
+    ]
+    respuesta = cliente.post('/api/valorar/lote', json={'valoraciones': lote})
+    cuerpo = respuesta.get_json()
+    assert respuesta.status_code == 200
+    assert [valoracion['indice'] for valoracion in cuerpo['valoraciones']] == [0, 4]
+    assert all('id' in valoracion for valoracion in cuerpo['valoraciones'])
+    assert [error['indice'] for error in cuerpo['errores']] == [1, 2, 3]
+
+
+def test_lote_informa_si_no_se_guardo(app, cliente, monkeypatch):
+    monkeypatch.setattr(app.motor, '_guardar_valoraciones_lote', lambda *args, **kwargs: None)
+    respuesta = cliente.post('/api/valorar/lote', json=[dict(DATOS_MINIMOS)])
+    assert respuesta.status_code == 500
+    assert respuesta.get_json()['guardado'] is False
+
+
+def test_sensibilidad_rechaza_puntaje_iso_de_texto(cliente):
+    respuesta = cliente.post('/api/sensibilidad', json=dict(DATOS_MINIMOS, iso25010={'security': '3'}))
+    assert respuesta.status_code == 400
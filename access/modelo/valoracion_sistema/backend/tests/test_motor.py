@@ -0,0 +1,90 @@
+"""Motor escalar, motor por lotes y valores de referencia de la versión 1.0"""
+
+import copy
+
+import pytest
+
+# Resultados de MotorValoracion en la versión 1.0 (antes de las tablas
+# compiladas y del motor por lotes), con los datos limpiados como lo hacía
+# /api/valorar: cualquier cambio aquí es un cambio de metodología, no una
+# optimización.
+CASOS_REFERENCIA = [
+    (
+        {'tipo_software': 'sistema_auditoria', 'tecnologia_principal': 'access_vba'},
+        {'valor_minimo': 1542883, 'valor_maximo': 2130647, 'valor_promedio': 1836765, 'factor_confianza': 1.0},
+        {'horas_estimadas': 119, 'costo_hora': 21000.0, 'valor_base': 2499000.0, 'factor_calidad': 1.0,
+         'factor_complejidad': 1.0, 'factor_negocio': 1.0, 'factor_colombia': 1.05,
+         'factor_ajuste_valoracion': 0.7, 'margen_incertidumbre': 0.16000000000000003}
+    ),
+    (
+        {'tipo_software': 'erp_basico', 'tecnologia_principal': 'python_django', 'usuarios_concurrentes': 50,
+         'usuarios_totales': 500, 'integraciones_externas': 3, 'criticidad_negocio': 5,
+         'arquitectura': 'microservicios', 'volumen_datos': 'grande', 'base_datos_tipo': 'postgresql',
+         'sector': 'financiero', 'funcionalidades': {'api_rest': True, 'workflow_aprobaciones': True},
+         'iso25010': {'security': 2, 'reliability': 4, 'usability': 5},
+         'contexto_desarrollo': {'desarrollo_interno': True}, 'sarlaft': True,
+         'tipo_valoracion': 'conservadora', 'nivel_certeza': 'alta'},
+        {'valor_minimo': 317605756, 'valor_maximo': 429701905, 'valor_promedio': 373653831, 'factor_confianza': 1.0},
+        {'horas_estimadas': 836, 'costo_hora': 78000.0, 'valor_base': 65208000.0,
+         'factor_calidad': 0.8344444444444447, 'factor_complejidad': 2.8, 'factor_negocio': 2.0355,
+         'factor_colombia': 1.5750000000000002, 'factor_ajuste_valoracion': 0.765,
+         'margen_incertidumbre': 0.15000000000000002}
+    ),
+    (
+        {'tipo_software': 'crm_sistema', 'tecnologia_principal': 'php_laravel', 'antiguedad_anos': 8.5,
+         'tiempo_desarrollo_meses': 12, 'ahorro_anual_cop': 20000001, 'inversion_original_cop': 30000000,
+         'en_uso_activo': 'true', 'sector': 'publico', 'conoce_tiempo_desarrollo': 'no',
+         'conoce_inversion': 'no', 'iso25010': {'security': 1, 'maintainability': 3},
+         'tipo_valoracion': 'optimista'},
+        {'valor_minimo': 19131975, 'valor_maximo': 42584073, 'valor_promedio': 30858024,
+         'factor_confianza': 0.7329444444444444},
+        {'horas_estimadas': 769, 'costo_hora': 49500.00000000001, 'valor_base': 38065500.00000001,
+         'factor_calidad': 0.45000000000000007, 'factor_complejidad': 1.0, 'factor_negocio': 1.6016000000000004,
+         'factor_colombia': 1.2075, 'factor_ajuste_valoracion': 0.9315, 'margen_incertidumbre': 0.38000000000000006}
+    ),
+]
+
+CAMPOS_RESULTADO = ['valor_minimo', 'valor_maximo', 'valor_promedio', 'factor_confianza']
+
+
+@pytest.mark.parametrize('datos, esperado, desglose', CASOS_REFERENCIA)
+def test_motor_escalar_reproduce_referencia(app, datos, esperado, desglose):
+    datos = copy.deepcopy(datos)
+    assert app.validar_datos_software(datos) is None
+    resultado = app.motor._calcular_resultado(datos)
+    assert {campo: resultado[campo] for campo in CAMPOS_RESULTADO} == esperado
+    assert resultado['desglose'] == desglose
+
+
+@pytest.mark.parametrize('datos, esperado, desglose', CASOS_REFERENCIA)
+def test_motor_lote_reproduce_referencia(app, datos, esperado, desglose):
+    datos = copy.deepcopy(datos)
+    assert app.validar_datos_software(datos) is None
+    resultado, = app.motor_lote.valorar_lote([datos], guardar=False)
+    assert {campo: resultado[campo] for campo in CAMPOS_RESULTADO} == esperado
+    assert resultado['desglose'] == desglose
+
+
+def test_motor_lote_igual_al_escalar(app, lista_datos):
+    resultados = app.motor_lote.valorar_lote(lista_datos, guardar=False)
+    for datos, resultado in zip(lista_datos, resultados):
+        esperado = app.motor._calcular_resultado(copy.deepcopy(datos))
+        assert {campo: resultado[campo] for campo in CAMPOS_RESULTADO} == \
+            {campo: esperado[campo] for campo in CAMPOS_RESULTADO}
+        assert resultado['desglose'] == esperado['desglose']
+        assert type(resultado['desglose']['horas_estimadas']) is int
+
+
+def test_tablas_de_calidad_igual_a_la_formula(app):
+    for caracteristica, aportes in zip(app.PESOS_ISO25010, app.REGLAS.aportes_calidad):
+        for puntaje in range(1, 6):
+            assert aportes[puntaje] == app.REGLAS.aporte_calidad(caracteristica, puntaje)
+
+
+def test_sensibilidad_solo_varia_puntajes_enteros(app):
+    datos = {'tipo_software': 'erp_basico', 'tecnologia_principal': 'java_spring',
+             'iso25010': {'security': 3.5, 'usability': 5}}
+    assert app.validar_datos_software(datos) is None
+    campos = [campo for campo, _, _ in app.motor_lote._generar_variantes(datos)]
+    assert 'iso25010.usability' in campos
+    assert 'iso25010.security' not in campos
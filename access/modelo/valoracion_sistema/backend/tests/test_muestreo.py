@@ -0,0 +1,47 @@
+"""Cuantiles z y t y cálculo del tamaño de muestra"""
+
+import pytest
+
+# Valores de tablas estadísticas (bilaterales: confianza = 1 - α)
+CUANTILES_Z = [(0.80, 1.281552), (0.90, 1.644854), (0.95, 1.959964), (0.99, 2.575829), (0.999, 3.290527)]
+CUANTILES_T = [
+    (0.90, 1, 6.313752), (0.95, 2, 4.302653), (0.99, 5, 4.032143), (0.95, 10, 2.228139),
+    (0.95, 30, 2.042272), (0.99, 60, 2.660283), (0.95, 120, 1.979930), (0.95, 1000, 1.962339)
+]
+
+
+@pytest.mark.parametrize('confianza, esperado', CUANTILES_Z)
+def test_cuantil_z(app, confianza, esperado):
+    assert app.cuantiles.z(confianza) == pytest.approx(esperado, abs=1e-6)
+
+
+@pytest.mark.parametrize('confianza, gl, esperado', CUANTILES_T)
+def test_cuantil_t(app, confianza, gl, esperado):
+    assert app.cuantiles.t(confianza, gl) == pytest.approx(esperado, abs=1e-6)
+
+
+def test_confianza_no_tabulada(app):
+    assert app.cuantiles.z(0.98) == pytest.approx(2.326348, abs=1e-6)
+    assert app.cuantiles.t(0.98, 15) == pytest.approx(2.602480, abs=1e-6)
+
+
+def test_tamano_atributos(cliente):
+    respuesta = cliente.post('/api/muestreo/tamano', json={'tipo': 'atributos', 'error': 0.05})
+    assert respuesta.status_code == 200
+    assert respuesta.get_json()['tamano'] == 385
+
+
+def test_tamano_variables_con_t(cliente):
+    respuesta = cliente.post('/api/muestreo/tamano', json={
+        'tipo': 'variables', 'error': 2, 'desviacion': 10, 'distribucion': 't', 'poblacion': 500
+    })
+    cuerpo = respuesta.get_json()
+    assert respuesta.status_code == 200
+    assert (cuerpo['tamano'], cuerpo['grados_libertad']) == (83, 82)
+
+
+@pytest.mark.parametrize('poblacion', [1000.7, '1000.5', [500, 1000.5], 'inf'])
+def test_poblacion_no_entera(cliente, poblacion):
+    respuesta = cliente.post('/api/muestreo/tamano', json={'tipo': 'atributos', 'error': 0.05,
+                                                          'poblacion': poblacion})
+    assert respuesta.status_code == 400
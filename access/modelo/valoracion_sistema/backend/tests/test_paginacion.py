@@ -0,0 +1,59 @@
+"""Paginación por cursor del histórico y del recorrido por fechas"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+TIPO_PRUEBA = 'prueba_paginacion'
+
+
+@pytest.fixture(scope='module')
+def valoraciones_paginadas(app):
+    """57 valoraciones de marzo de 2019 con fechas repetidas (el id desempata), en orden ascendente"""
+    resultado = {
+        'valor_minimo': 1, 'valor_maximo': 3, 'valor_promedio': 2, 'factor_confianza': 1.0, 'desglose': {}
+    }
+    inicio = datetime(2019, 3, 1, 8, 0, 0)
+    filas = []
+    for numero in range(57):
+        fecha = inicio + timedelta(hours=5 * (numero // 4))  # Cuatro valoraciones por fecha, en tres días
+        datos = {'tipo_software': TIPO_PRUEBA, 'tecnologia_principal': 'cobol'}
+        filas.append(app.codificador.filas(f'pag-{numero % 7}-{numero:03d}', fecha, datos, resultado, None)[0])
+    with app.db.transaccion() as conn:
+        conn.executemany(app.SQL_INSERTAR_VALORACION, filas)
+    return [valoracion_id for valoracion_id, *_ in sorted(filas, key=lambda fila: (str(fila[1]), fila[0]))]
+
+
+def _recorrer_historico(cliente, orden, limite):
+    ids = []
+    parametros = {'tipo_software': TIPO_PRUEBA, 'orden': orden, 'limite': limite}
+    while True:
+        respuesta = cliente.get('/api/historico', query_string=parametros)
+        assert respuesta.status_code == 200
+        cuerpo = respuesta.get_json()
+        assert len(cuerpo['valoraciones']) <= limite
+        ids.extend(valoracion['id'] for valoracion in cuerpo['valoraciones'])
+        if cuerpo['siguiente_cursor'] is None:
+            return ids
+        parametros['cursor'] = cuerpo['siguiente_cursor']
+
+
+@pytest.mark.parametrize('limite', [1, 4, 10, 57, 100])
+def test_historico_recorre_todo_sin_repetir(cliente, valoraciones_paginadas, limite):
+    assert _recorrer_historico(cliente, 'asc', limite) == valoraciones_paginadas
+    assert _recorrer_historico(cliente, 'desc', limite) == valoraciones_paginadas[::-1]
+
+
+def test_historico_rechaza_cursor_invalido(cliente):
+    respuesta = cliente.get('/api/historico', query_string={'cursor': 'no-es-un-cursor'})
+    assert respuesta.status_code == 400
+
+
+@pytest.mark.parametrize('tamano_pagina', [1, 3, 4, 500])
+def test_iterar_ids_por_fecha(app, valoraciones_paginadas, tamano_pagina):
+    ids = list(app._iterar_ids_por_fecha(datetime(2019, 3, 1), datetime(2019, 3, 31), tamano_pagina))
+    assert ids == valoraciones_paginadas
+
+    # hasta es inclusive y el rango excluye lo demás
+    ids = list(app._iterar_ids_por_fecha(datetime(2019, 3, 1), datetime(2019, 3, 1), tamano_pagina))
+    assert ids == valoraciones_paginadas[:16]